@@ -2,12 +2,12 @@ from fastapi import Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordBearer
 from jose import jwt, JWTError
 from pydantic import ValidationError
-from sqlalchemy.orm import Session
 
 from app.core.config import settings
-from app.db.session import get_db
-from app.schemas.user import TokenPayload, UserRole
-from app.crud.crud_user import user
+from app.core.principal_cache import principals, verified_tokens
+from app.db.session import AsyncSessionLocal
+from app.schemas.user import Principal, TokenPayload, UserRole
+from app.crud.crud_user import async_user
 
 oauth2_scheme = OAuth2PasswordBearer(
     tokenUrl="/api/auth/login",
@@ -15,26 +15,41 @@ oauth2_scheme = OAuth2PasswordBearer(
     description="JWT token authentication"
 )
 
-async def get_current_user(
-    db: Session = Depends(get_db), token: str = Depends(oauth2_scheme)
-):
-    try:
-        payload = jwt.decode(
-            token, settings.SECRET_KEY, algorithms=[settings.ALGORITHM]
-        )
-        token_data = TokenPayload(**payload)
-    except (JWTError, ValidationError):
-        raise HTTPException(
-            status_code=status.HTTP_403_FORBIDDEN,
-            detail="Could not validate credentials",
-        )
+async def get_current_user(token: str = Depends(oauth2_scheme)) -> Principal:
+    """
+    Resolve the bearer token to its user.
+
+    Verified tokens are cached until they expire and users for a short TTL,
+    so most requests are authenticated without decoding the JWT again or
+    querying the users table. Cache misses load the user on a short-lived
+    async session of its own, on the primary, so sync and async routes
+    alike authenticate without blocking the event loop and the route's own
+    session keeps reading from its replica.
+    """
+    token_data = verified_tokens.get(token)
+    if token_data is None:
+        try:
+            payload = jwt.decode(
+                token, settings.SECRET_KEY, algorithms=[settings.ALGORITHM]
+            )
+            token_data = TokenPayload(**payload)
+        except (JWTError, ValidationError):
+            raise HTTPException(
+                status_code=status.HTTP_403_FORBIDDEN,
+                detail="Could not validate credentials",
+            )
+        verified_tokens.add(token, payload.get("exp"), token_data)
 
-    user_obj = user.get(db, id=token_data.sub)
-    if not user_obj:
-        raise HTTPException(status_code=404, detail="User not found")
-    if not user_obj.is_active:
+    principal = principals.get(token_data.sub)
+    if principal is None:
+        async with AsyncSessionLocal() as db:
+            user_obj = await async_user.get(db, token_data.sub)
+        if not user_obj:
+            raise HTTPException(status_code=404, detail="User not found")
+        principal = principals.load(user_obj)
+    if not principal.is_active:
         raise HTTPException(status_code=400, detail="Inactive user")
-    return user_obj
+    return principal
 
 def get_current_active_user(current_user = Depends(get_current_user)):
     if not current_user.is_active:
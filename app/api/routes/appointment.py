@@ -1,65 +1,159 @@
-from typing import Any, List
-from datetime import datetime
+import logging
+from typing import Any, List, Optional
+from datetime import date, datetime
 
-from fastapi import APIRouter, Depends, HTTPException, Query, BackgroundTasks
+import redis
+from fastapi import APIRouter, Depends, Header, HTTPException, Query, BackgroundTasks, Response
 from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 from app.api.deps import get_current_user
-from app.crud.crud_appointment import appointment
+from app.crud.crud_appointment import appointment, async_appointment, series_occurrences
+from app.crud.crud_calendar import DOCTOR, PATIENT, async_calendar_version, calendar_version
 from app.crud.crud_doctor import doctor
-from app.schemas.appointment import Appointment, AppointmentCreate, AppointmentUpdate, AppointmentDetail, AppointmentStatus
+from app.schemas.appointment import (
+    Appointment, AppointmentCreate, AppointmentUpdate, AppointmentDetail, AppointmentStatus,
+    AppointmentBatchCreate, AppointmentBatchResult, SlotHold, SlotHoldCreate,
+    AppointmentSeries, AppointmentSeriesCreate, AppointmentSeriesUpdate
+)
 from app.schemas.user import User
-from app.db.session import get_db
-from app.core.notifications import send_appointment_notification
+from app.db.models import Appointment as AppointmentModel
+from app.db.session import get_async_db, get_db
+from app.core.cache import appointment_tags, invalidate_tags, set_cache_tags
+from app.core.export import ExportFormat, export_response
+from app.core.etag import etag_matches, not_modified, weak_etag
+from app.core.icalendar import calendar_etag, calendar_response
+from app.core.pagination import NEXT_CURSOR_HEADER
+from app.core.notifications import send_appointment_notification, send_appointment_notifications
+from app.core.config import settings
+from app.core.slot_holds import seconds_until_expiry, slot_holds
+from app.core.slots import DEFAULT_SLOT_MINUTES
+
+logger = logging.getLogger(__name__)
 
 router = APIRouter()
 
+MAX_SEARCH_DAYS = 62
+
+APPOINTMENT_EXPORT_COLUMNS = [column.key for column in AppointmentModel.__table__.columns] + [
+    "patient_name", "doctor_name", "doctor_specialization"
+]
+
 
 @router.get("/", response_model=List[AppointmentDetail])
-def read_appointments(
-    db: Session = Depends(get_db),
+async def read_appointments(
+    response: Response,
+    db: AsyncSession = Depends(get_async_db),
     current_user: User = Depends(get_current_user),
     skip: int = 0,
     limit: int = 100,
+    cursor: Optional[str] = None,
     start_date: datetime = None,
     end_date: datetime = None,
+    if_none_match: Optional[str] = Header(None),
 ) -> Any:
     """
     Retrieve appointments with optional date filtering.
+
+    Results are ordered by start time. Pass the `X-Next-Cursor` response
+    header back as `cursor` to fetch the next page. Send the `ETag` back as
+    `If-None-Match` to get 304 Not Modified while the listed appointments
+    are unchanged.
     """
-    # If user is a patient, only show their appointments
-    if current_user.role == "patient":
-        appointments = appointment.get_by_patient(
-            db, patient_id=current_user.reference_id,
-            start_date=start_date, end_date=end_date,
-            skip=skip, limit=limit
-        )
-    # If user is a doctor, only show their appointments
-    elif current_user.role == "doctor":
-        appointments = appointment.get_by_doctor(
-            db, doctor_id=current_user.reference_id,
-            start_date=start_date, end_date=end_date,
-            skip=skip, limit=limit
-        )
-    # Admin and staff can see all appointments
+    if current_user.role in ("patient", "doctor"):
+        owner_type = PATIENT if current_user.role == "patient" else DOCTOR
+        version = (owner_type, current_user.reference_id, await async_calendar_version.get(
+            db, owner_type=owner_type, owner_id=current_user.reference_id
+        ))
     else:
-        appointments = appointment.get_multi_with_details(
-            db, start_date=start_date, end_date=end_date,
-            skip=skip, limit=limit
-        )
+        version = await async_appointment.details_version(db, start_date=start_date, end_date=end_date)
+    etag = weak_etag("appointments", *version)
+    if etag_matches(if_none_match, etag):
+        return not_modified(etag)
+    response.headers["ETag"] = etag
+
+    try:
+        # If user is a patient, only show their appointments
+        if current_user.role == "patient":
+            appointments = await async_appointment.get_by_patient(
+                db, patient_id=current_user.reference_id,
+                start_date=start_date, end_date=end_date,
+                skip=skip, limit=limit, cursor=cursor
+            )
+        # If user is a doctor, only show their appointments
+        elif current_user.role == "doctor":
+            appointments = await async_appointment.get_by_doctor(
+                db, doctor_id=current_user.reference_id,
+                start_date=start_date, end_date=end_date,
+                skip=skip, limit=limit, cursor=cursor
+            )
+        # Admin and staff can see all appointments
+        else:
+            appointments = await async_appointment.get_multi_with_details(
+                db, start_date=start_date, end_date=end_date,
+                skip=skip, limit=limit, cursor=cursor
+            )
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+    next_cursor = async_appointment.next_cursor(appointments, limit=limit)
+    if next_cursor:
+        response.headers[NEXT_CURSOR_HEADER] = next_cursor
+
+    if current_user.role in ("patient", "doctor"):
+        set_cache_tags(response, f"appointments:{current_user.role}:{current_user.reference_id}")
+    else:
+        set_cache_tags(response, "appointments")
 
     return appointments
 
 
+@router.get("/export")
+def export_appointments(
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user),
+    format: ExportFormat = ExportFormat.NDJSON,
+    start_date: datetime = None,
+    end_date: datetime = None,
+) -> Any:
+    """
+    Stream appointments as NDJSON or CSV with optional date filtering.
+    """
+    patient_id = current_user.reference_id if current_user.role == "patient" else None
+    doctor_id = current_user.reference_id if current_user.role == "doctor" else None
+
+    rows = appointment.stream_with_details(
+        db, patient_id=patient_id, doctor_id=doctor_id,
+        start_date=start_date, end_date=end_date
+    )
+
+    return export_response(
+        rows, format=format, columns=APPOINTMENT_EXPORT_COLUMNS, filename="appointments"
+    )
+
+
 @router.post("/", response_model=Appointment)
 def create_appointment(
     *,
     db: Session = Depends(get_db),
     appointment_in: AppointmentCreate,
     background_tasks: BackgroundTasks,
+    hold_id: Optional[str] = None,
 ) -> Any:
     """
     Create new appointment.
+
+    Pass the id of a slot hold covering the requested time as `hold_id` to
+    book a held slot; the hold is released once the appointment is created.
     """
+    # Reject times another client is holding before touching the database
+    if slot_holds.is_blocked(
+        appointment_in.doctor_id, appointment_in.start_time, appointment_in.end_time, hold_id=hold_id
+    ):
+        raise HTTPException(
+            status_code=409,
+            detail="The requested time is held by another booking in progress"
+        )
+
     # Check if the doctor is available at the requested time
     is_available = doctor.check_availability(
         db,
@@ -89,8 +183,23 @@ def create_appointment(
             detail="There is a scheduling conflict with another appointment"
         )
 
-    # Create the appointment
-    appointment_obj = appointment.create(db, obj_in=appointment_in)
+    # Create the appointment, re-checking for conflicts under the doctor's booking lock
+    appointment_obj = appointment.create_if_free(db, obj_in=appointment_in)
+
+    if appointment_obj is None:
+        raise HTTPException(
+            status_code=400,
+            detail="There is a scheduling conflict with another appointment"
+        )
+
+    if hold_id:
+        try:
+            slot_holds.release(hold_id)
+        except redis.RedisError as e:
+            # The hold expires on its own
+            logger.error(f"Failed to release slot hold after booking: {e}")
+
+    invalidate_tags(*appointment_tags(appointment_obj.id, appointment_obj.doctor_id, appointment_obj.patient_id))
 
     # Send notification in background
     background_tasks.add_task(
@@ -102,27 +211,278 @@ def create_appointment(
     return appointment_obj
 
 
+@router.post("/batch", response_model=AppointmentBatchResult)
+def create_appointments_batch(
+    *,
+    db: Session = Depends(get_db),
+    batch_in: AppointmentBatchCreate,
+    background_tasks: BackgroundTasks,
+) -> Any:
+    """
+    Create many appointments at once.
+
+    Each item is validated against doctor availability, existing appointments
+    and the other items of the batch. Valid items are created in a single
+    transaction; the result reports the outcome of every item.
+    """
+    held = {
+        doctor_id: slot_holds.held_intervals(doctor_id)
+        for doctor_id in {item.doctor_id for item in batch_in.appointments}
+    }
+    results = appointment.create_batch(db, objs_in=batch_in.appointments, held=held)
+
+    created = [result["appointment"] for result in results if result["appointment"] is not None]
+    created_ids = [appointment_obj.id for appointment_obj in created]
+
+    invalidate_tags(*{
+        tag for appointment_obj in created
+        for tag in appointment_tags(None, appointment_obj.doctor_id, appointment_obj.patient_id)
+    })
+
+    # Send all notifications as one batch in background
+    if created_ids:
+        background_tasks.add_task(
+            send_appointment_notifications,
+            appointment_ids=created_ids,
+            notification_type="created"
+        )
+
+    return {
+        "created": len(created_ids),
+        "failed": len(results) - len(created_ids),
+        "results": [
+            {**result, "success": result["appointment"] is not None}
+            for result in results
+        ]
+    }
+
+
+@router.post("/series", response_model=AppointmentSeries)
+def create_appointment_series(
+    *,
+    db: Session = Depends(get_db),
+    series_in: AppointmentSeriesCreate,
+    background_tasks: BackgroundTasks,
+) -> Any:
+    """
+    Create a recurring appointment series, for example weekly for 12 weeks.
+
+    Every occurrence is checked against doctor availability and existing
+    appointments; the series is only created if all of them can be booked.
+    """
+    if any(
+        slot_holds.is_blocked(occurrence.doctor_id, occurrence.start_time, occurrence.end_time)
+        for occurrence in series_occurrences(series_in)
+    ):
+        raise HTTPException(
+            status_code=409,
+            detail="The requested time is held by another booking in progress"
+        )
+
+    series_obj, errors = appointment.create_series(db, obj_in=series_in)
+
+    if series_obj is None:
+        raise HTTPException(
+            status_code=400,
+            detail=[
+                {"start_time": error["start_time"].isoformat(), "error": error["error"]}
+                for error in errors
+            ]
+        )
+
+    invalidate_tags(*appointment_tags(None, series_obj.doctor_id, series_obj.patient_id))
+
+    # Send all notifications as one batch in background
+    background_tasks.add_task(
+        send_appointment_notifications,
+        appointment_ids=[appointment_obj.id for appointment_obj in series_obj.appointments],
+        notification_type="created"
+    )
+
+    return series_obj
+
+
+@router.get("/series/{series_id}", response_model=AppointmentSeries)
+def read_appointment_series(
+    *,
+    db: Session = Depends(get_db),
+    series_id: int,
+) -> Any:
+    """
+    Get a recurring series with its occurrences.
+    """
+    series_obj = appointment.get_series(db, id=series_id)
+    if not series_obj:
+        raise HTTPException(status_code=404, detail="Appointment series not found")
+
+    return series_obj
+
+
+@router.put("/series/{series_id}", response_model=AppointmentSeries)
+def update_appointment_series(
+    *,
+    db: Session = Depends(get_db),
+    series_id: int,
+    series_in: AppointmentSeriesUpdate,
+    background_tasks: BackgroundTasks,
+) -> Any:
+    """
+    Update the status or notes of every upcoming occurrence of a series.
+    """
+    series_obj = appointment.get_series(db, id=series_id)
+    if not series_obj:
+        raise HTTPException(status_code=404, detail="Appointment series not found")
+
+    updated_ids = appointment.update_series(db, series_id=series_id, obj_in=series_in)
+
+    invalidate_tags(
+        *appointment_tags(None, series_obj.doctor_id, series_obj.patient_id),
+        *(f"appointment:{id}" for id in updated_ids)
+    )
+
+    if updated_ids:
+        background_tasks.add_task(
+            send_appointment_notifications,
+            appointment_ids=updated_ids,
+            notification_type="updated"
+        )
+
+    return appointment.get_series(db, id=series_id)
+
+
+@router.delete("/series/{series_id}", response_model=AppointmentSeries)
+def cancel_appointment_series(
+    *,
+    db: Session = Depends(get_db),
+    series_id: int,
+    background_tasks: BackgroundTasks,
+) -> Any:
+    """
+    Cancel every upcoming occurrence of a series.
+    """
+    series_obj = appointment.get_series(db, id=series_id)
+    if not series_obj:
+        raise HTTPException(status_code=404, detail="Appointment series not found")
+
+    cancelled_ids = appointment.update_series(
+        db, series_id=series_id, obj_in=AppointmentSeriesUpdate(status=AppointmentStatus.CANCELLED)
+    )
+
+    invalidate_tags(
+        *appointment_tags(None, series_obj.doctor_id, series_obj.patient_id),
+        *(f"appointment:{id}" for id in cancelled_ids)
+    )
+
+    if cancelled_ids:
+        background_tasks.add_task(
+            send_appointment_notifications,
+            appointment_ids=cancelled_ids,
+            notification_type="cancelled"
+        )
+
+    return appointment.get_series(db, id=series_id)
+
+
+@router.post("/holds", response_model=SlotHold)
+def create_slot_hold(
+    *,
+    db: Session = Depends(get_db),
+    hold_in: SlotHoldCreate,
+) -> Any:
+    """
+    Reserve a slot for a short time while the client completes its booking.
+    """
+    ttl = min(hold_in.ttl_seconds or settings.SLOT_HOLD_SECONDS, settings.SLOT_HOLD_MAX_SECONDS)
+
+    is_available = doctor.check_availability(
+        db,
+        doctor_id=hold_in.doctor_id,
+        start_time=hold_in.start_time,
+        end_time=hold_in.end_time
+    )
+
+    if not is_available:
+        raise HTTPException(
+            status_code=400,
+            detail="Doctor is not available at the requested time"
+        )
+
+    has_conflict = appointment.check_conflicts(
+        db,
+        doctor_id=hold_in.doctor_id,
+        start_time=hold_in.start_time,
+        end_time=hold_in.end_time
+    )
+
+    if has_conflict:
+        raise HTTPException(
+            status_code=400,
+            detail="There is a scheduling conflict with another appointment"
+        )
+
+    try:
+        hold = slot_holds.acquire(hold_in.doctor_id, hold_in.start_time, hold_in.end_time, ttl=ttl)
+    except redis.RedisError as e:
+        logger.error(f"Slot hold failed: {e}")
+        raise HTTPException(status_code=503, detail="Slot holds are unavailable")
+    if hold is None:
+        raise HTTPException(
+            status_code=409,
+            detail="The requested time is held by another booking in progress"
+        )
+
+    invalidate_tags(f"slots:doctor:{hold.doctor_id}", "slots")
+
+    return hold
+
+
+@router.delete("/holds/{hold_id}", status_code=204)
+def release_slot_hold(
+    *,
+    hold_id: str,
+) -> None:
+    """
+    Release a slot hold before it expires.
+    """
+    try:
+        hold = slot_holds.get(hold_id)
+        if hold is None or not slot_holds.release(hold_id):
+            raise HTTPException(status_code=404, detail="Hold not found")
+    except redis.RedisError as e:
+        logger.error(f"Slot hold release failed: {e}")
+        raise HTTPException(status_code=503, detail="Slot holds are unavailable")
+
+    invalidate_tags(f"slots:doctor:{hold.doctor_id}", "slots")
+
+
 @router.get("/{id}", response_model=AppointmentDetail)
 def read_appointment(
     *,
     db: Session = Depends(get_db),
+    response: Response,
     id: int,
+    current_user: User = Depends(get_current_user),
 ) -> Any:
     """
     Get appointment by ID.
     """
-    current_user: User = Depends(get_current_user)
     appointment_obj = appointment.get_with_details(db, id=id)
     if not appointment_obj:
         raise HTTPException(status_code=404, detail="Appointment not found")
 
     # Check permissions
-    if current_user.role == "patient" and current_user.reference_id != appointment_obj.patient_id:
+    if current_user.role == "patient" and current_user.reference_id != appointment_obj["patient_id"]:
         raise HTTPException(status_code=403, detail="Not enough permissions")
 
-    if current_user.role == "doctor" and current_user.reference_id != appointment_obj.doctor_id:
+    if current_user.role == "doctor" and current_user.reference_id != appointment_obj["doctor_id"]:
         raise HTTPException(status_code=403, detail="Not enough permissions")
 
+    # The response embeds the patient's and doctor's names
+    set_cache_tags(
+        response, f"appointment:{id}",
+        f"doctor:{appointment_obj['doctor_id']}", f"patient:{appointment_obj['patient_id']}"
+    )
+
     return appointment_obj
 
 
@@ -133,11 +493,11 @@ def update_appointment(
     id: int,
     appointment_in: AppointmentUpdate,
     background_tasks: BackgroundTasks,
+    current_user: User = Depends(get_current_user),
 ) -> Any:
     """
     Update an appointment.
     """
-    current_user: User = Depends(get_current_user)
     appointment_obj = appointment.get(db, id=id)
     if not appointment_obj:
         raise HTTPException(status_code=404, detail="Appointment not found")
@@ -146,8 +506,16 @@ def update_appointment(
     if current_user.role == "patient" and current_user.reference_id != appointment_obj.patient_id:
         raise HTTPException(status_code=403, detail="Not enough permissions")
 
-    # If updating time, check for availability and conflicts
+    # If updating time, check for holds, availability and conflicts
     if appointment_in.start_time and appointment_in.end_time:
+        if slot_holds.is_blocked(
+            appointment_obj.doctor_id, appointment_in.start_time, appointment_in.end_time
+        ):
+            raise HTTPException(
+                status_code=409,
+                detail="The requested time is held by another booking in progress"
+            )
+
         # Check if the doctor is available at the requested time
         is_available = doctor.check_availability(
             db,
@@ -177,9 +545,21 @@ def update_appointment(
                 detail="There is a scheduling conflict with another appointment"
             )
 
-    # Update the appointment
-    appointment_obj = appointment.update(
-        db, db_obj=appointment_obj, obj_in=appointment_in)
+    # Update the appointment, re-checking a time change under the doctor's booking lock
+    if appointment_in.start_time or appointment_in.end_time:
+        appointment_obj = appointment.update_if_free(
+            db, db_obj=appointment_obj, obj_in=appointment_in)
+
+        if appointment_obj is None:
+            raise HTTPException(
+                status_code=400,
+                detail="There is a scheduling conflict with another appointment"
+            )
+    else:
+        appointment_obj = appointment.update(
+            db, db_obj=appointment_obj, obj_in=appointment_in)
+
+    invalidate_tags(*appointment_tags(appointment_obj.id, appointment_obj.doctor_id, appointment_obj.patient_id))
 
     # Send notification in background
     background_tasks.add_task(
@@ -213,6 +593,8 @@ def delete_appointment(
     # Delete the appointment
     appointment_obj = appointment.remove(db, id=id)
 
+    invalidate_tags(*appointment_tags(id, doctor_id, patient_id))
+
     # Send cancellation notification in background
     background_tasks.add_task(
         send_appointment_notification,
@@ -244,6 +626,8 @@ def update_appointment_status(
     # Update status
     appointment_obj = appointment.update_status(db, id=id, status=status)
 
+    invalidate_tags(*appointment_tags(appointment_obj.id, appointment_obj.doctor_id, appointment_obj.patient_id))
+
     # Send notification in background
     background_tasks.add_task(
         send_appointment_notification,
@@ -259,17 +643,127 @@ def update_appointment_status(
 def get_available_slots(
     *,
     db: Session = Depends(get_db),
+    response: Response,
     doctor_id: int,
     date: datetime = Query(...),
+    slot_minutes: int = Query(DEFAULT_SLOT_MINUTES, ge=5, le=480),
 ) -> Any:
     """
     Get available appointment slots for a doctor on a specific date.
     """
+    holds = slot_holds.held(doctor_id)
+
     # Get the doctor's availability for the day of the week
     available_slots = doctor.get_available_slots(
         db,
         doctor_id=doctor_id,
-        date=date
+        date=date,
+        slot_minutes=slot_minutes,
+        held=[(hold.start_time, hold.end_time) for hold in holds]
     )
 
+    # Held slots come back when the hold expires, which no write invalidates
+    set_cache_tags(response, f"slots:doctor:{doctor_id}", ttl=seconds_until_expiry(holds))
+
     return available_slots
+
+
+@router.get("/specialization/{specialization}/first-available", response_model=List[dict])
+def get_first_available_slots(
+    *,
+    db: Session = Depends(get_db),
+    response: Response,
+    specialization: str,
+    start_date: date = Query(...),
+    end_date: date = Query(...),
+    slot_minutes: int = Query(DEFAULT_SLOT_MINUTES, ge=5, le=480),
+    limit: int = Query(10, ge=1, le=100),
+) -> Any:
+    """
+    Get the earliest available slots across all doctors of a specialization
+    within a date range.
+    """
+    if end_date < start_date:
+        raise HTTPException(
+            status_code=400,
+            detail="end_date must not be before start_date"
+        )
+
+    if (end_date - start_date).days >= MAX_SEARCH_DAYS:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Date range cannot exceed {MAX_SEARCH_DAYS} days"
+        )
+
+    set_cache_tags(response, "slots")
+
+    return doctor.find_first_available_slots(
+        db,
+        specialization=specialization,
+        start_date=start_date,
+        end_date=end_date,
+        slot_minutes=slot_minutes,
+        limit=limit
+    )
+
+
+def _calendar_feed(
+    db: Session, current_user: User, *,
+    owner_type: str, owner_id: int, if_none_match: Optional[str]
+) -> Response:
+    if current_user.role in (DOCTOR, PATIENT) and (
+        current_user.role != owner_type or current_user.reference_id != owner_id
+    ):
+        raise HTTPException(status_code=403, detail="Not enough permissions")
+
+    # Answer polls from the change counter alone while nothing has changed
+    etag = calendar_etag(owner_type, owner_id, calendar_version.get(db, owner_type=owner_type, owner_id=owner_id))
+    if etag_matches(if_none_match, etag):
+        return not_modified(etag, **{"Cache-Control": "private, no-cache"})
+
+    appointments = appointment.stream_by_owner(db, **{f"{owner_type}_id": owner_id})
+
+    return calendar_response(
+        appointments,
+        name=f"Appointments ({owner_type} {owner_id})",
+        etag=etag,
+        filename=f"{owner_type}-{owner_id}-appointments"
+    )
+
+
+@router.get("/doctor/{doctor_id}/calendar.ics")
+def get_doctor_calendar(
+    *,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user),
+    doctor_id: int,
+    if_none_match: Optional[str] = Header(None),
+) -> Any:
+    """
+    iCalendar feed of a doctor's appointments.
+
+    Send the returned `ETag` back as `If-None-Match` to get a 304 while the
+    calendar is unchanged.
+    """
+    return _calendar_feed(
+        db, current_user, owner_type=DOCTOR, owner_id=doctor_id, if_none_match=if_none_match
+    )
+
+
+@router.get("/patient/{patient_id}/calendar.ics")
+def get_patient_calendar(
+    *,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user),
+    patient_id: int,
+    if_none_match: Optional[str] = Header(None),
+) -> Any:
+    """
+    iCalendar feed of a patient's appointments.
+
+    Send the returned `ETag` back as `If-None-Match` to get a 304 while the
+    calendar is unchanged.
+    """
+    return _calendar_feed(
+        db, current_user, owner_type=PATIENT, owner_id=patient_id, if_none_match=if_none_match
+    )
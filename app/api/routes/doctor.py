@@ -1,27 +1,55 @@
-from typing import Any, List
+from typing import Any, List, Optional
 
-from fastapi import APIRouter, Depends, HTTPException, Query, status
+from fastapi import APIRouter, Depends, Header, HTTPException, Query, Response, status
+from sqlalchemy import select
 from sqlalchemy.orm import Session
 from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
 
 from app.api.deps import get_current_staff, get_current_user
-from app.crud.crud_doctor import doctor
+from app.crud.crud_doctor import async_doctor, doctor
+from app.db.models import Doctor as DoctorModel
 from app.schemas.doctor import Doctor, DoctorCreate, DoctorUpdate, DoctorWithAvailability, AvailabilityCreate
 from app.schemas.user import User
-from app.db.session import get_db
+from app.db.session import get_async_db, get_db
+from app.core.cache import doctor_tags, invalidate_tags, set_cache_tags
+from app.core.etag import entity_etag, etag_matches, not_modified, weak_etag
+from app.core.pagination import NEXT_CURSOR_HEADER
 
 router = APIRouter()
 
 @router.get("/", response_model=List[Doctor])
-def read_doctors(
-    db: Session = Depends(get_db),
+async def read_doctors(
+    response: Response,
+    db: AsyncSession = Depends(get_async_db),
     skip: int = 0,
     limit: int = 100,
+    cursor: Optional[str] = None,
+    if_none_match: Optional[str] = Header(None),
 ) -> Any:
     """
     Retrieve doctors.
+
+    Results are ordered by ID. Pass the `X-Next-Cursor` response header back
+    as `cursor` to fetch the next page. Send the `ETag` back as
+    `If-None-Match` to get 304 Not Modified while no doctor has changed.
     """
-    doctors = doctor.get_multi(db, skip=skip, limit=limit)
+    etag = weak_etag("doctors", *await async_doctor.collection_version(db, select(DoctorModel)))
+    if etag_matches(if_none_match, etag):
+        return not_modified(etag)
+    response.headers["ETag"] = etag
+
+    try:
+        doctors = await async_doctor.get_multi(db, skip=skip, limit=limit, cursor=cursor)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+    next_cursor = async_doctor.next_cursor(doctors, limit=limit)
+    if next_cursor:
+        response.headers[NEXT_CURSOR_HEADER] = next_cursor
+
+    set_cache_tags(response, "doctors")
+
     return doctors
 
 @router.post("/", response_model=Doctor)
@@ -48,13 +76,17 @@ def create_doctor(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="Duplicate doctor entry or invalid data."
         )
+
+    invalidate_tags(*doctor_tags(doctor_obj.id))
     return doctor_obj
 
 @router.get("/{id}", response_model=DoctorWithAvailability)
 def read_doctor(
     *,
     db: Session = Depends(get_db),
+    response: Response,
     id: int,
+    if_none_match: Optional[str] = Header(None),
 ) -> Any:
     """
     Get doctor by ID with availability.
@@ -62,6 +94,13 @@ def read_doctor(
     doctor_obj = doctor.get_with_availability(db, id=id)
     if not doctor_obj:
         raise HTTPException(status_code=404, detail="Doctor not found")
+
+    etag = entity_etag(doctor_obj)
+    if etag_matches(if_none_match, etag):
+        return not_modified(etag)
+    response.headers["ETag"] = etag
+
+    set_cache_tags(response, f"doctor:{id}")
     return doctor_obj
 
 @router.put("/{id}", response_model=Doctor)
@@ -94,6 +133,8 @@ def update_doctor(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="Invalid data or duplicate entry."
         )
+
+    invalidate_tags(*doctor_tags(id))
     return doctor_obj
 
 @router.delete("/{id}", response_model=Doctor)
@@ -117,6 +158,8 @@ def delete_doctor(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="Cannot delete doctor with existing dependencies."
         )
+
+    invalidate_tags(*doctor_tags(id))
     return doctor_obj
 
 @router.post("/{id}/availability", response_model=DoctorWithAvailability)
@@ -141,17 +184,22 @@ def add_doctor_availability(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="Invalid availability data or time conflict."
         )
+
+    invalidate_tags(*doctor_tags(id))
     return doctor_obj
 
 @router.get("/specialization/{specialization}", response_model=List[Doctor])
 def get_doctors_by_specialization(
     *,
     db: Session = Depends(get_db),
+    response: Response,
     specialization: str,
 ) -> Any:
     """
     Get doctors by specialization.
     """
+    set_cache_tags(response, "doctors")
+
     doctors = doctor.get_by_specialization(db, specialization=specialization)
     if not doctors:
         return []
@@ -1,31 +1,73 @@
-from typing import Any, List
+from typing import Any, List, Optional
 
-from fastapi import APIRouter, Depends, HTTPException, Query, status
+from fastapi import APIRouter, Depends, Header, HTTPException, Query, Response, status
+from sqlalchemy import select
 from sqlalchemy.orm import Session
 from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
 
-from app.api.deps import get_current_user
-from app.crud.crud_patient import patient
+from app.api.deps import get_current_staff, get_current_user
+from app.crud.crud_patient import async_patient, patient
 from app.schemas.patient import Patient, PatientCreate, PatientUpdate
 from app.schemas.user import User
-from app.db.session import get_db
+from app.db.models import Patient as PatientModel
+from app.db.session import get_async_db, get_db
+from app.core.cache import invalidate_tags, patient_tags
+from app.core.etag import entity_etag, etag_matches, not_modified, weak_etag
+from app.core.export import ExportFormat, export_response
+from app.core.pagination import NEXT_CURSOR_HEADER
 
 router = APIRouter()
 
+PATIENT_EXPORT_COLUMNS = [column.key for column in PatientModel.__table__.columns]
+
 
 @router.get("/", response_model=List[Patient])
-def read_patients(
-    db: Session = Depends(get_db),
+async def read_patients(
+    response: Response,
+    db: AsyncSession = Depends(get_async_db),
     skip: int = 0,
     limit: int = 100,
+    cursor: Optional[str] = None,
+    if_none_match: Optional[str] = Header(None),
 ) -> Any:
     """
     Retrieve patients.
+
+    Results are ordered by ID. Pass the `X-Next-Cursor` response header back
+    as `cursor` to fetch the next page. Send the `ETag` back as
+    `If-None-Match` to get 304 Not Modified while no patient has changed.
     """
-    patients = patient.get_multi(db, skip=skip, limit=limit)
+    etag = weak_etag("patients", *await async_patient.collection_version(db, select(PatientModel)))
+    if etag_matches(if_none_match, etag):
+        return not_modified(etag)
+    response.headers["ETag"] = etag
+
+    try:
+        patients = await async_patient.get_multi(db, skip=skip, limit=limit, cursor=cursor)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+    next_cursor = async_patient.next_cursor(patients, limit=limit)
+    if next_cursor:
+        response.headers[NEXT_CURSOR_HEADER] = next_cursor
+
     return patients
 
 
+@router.get("/export", dependencies=[Depends(get_current_staff)])
+def export_patients(
+    db: Session = Depends(get_db),
+    format: ExportFormat = ExportFormat.NDJSON,
+) -> Any:
+    """
+    Stream all patients as NDJSON or CSV.
+    """
+    return export_response(
+        patient.stream(db), format=format, columns=PATIENT_EXPORT_COLUMNS, filename="patients"
+    )
+
+
 @router.post("/", response_model=Patient)
 def create_patient(
     *,
@@ -54,22 +96,29 @@ def create_patient(
 
 
 @router.get("/{id}", response_model=Patient)
-def read_patient(
+async def read_patient(
     *,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     current_user: User = Depends(get_current_user),
+    response: Response,
     id: int,
+    if_none_match: Optional[str] = Header(None),
 ) -> Any:
     """
     Get patient by ID.
     """
-    patient_obj = patient.get(db, id=id)
+    patient_obj = await async_patient.get(db, id=id)
     if not patient_obj:
         raise HTTPException(status_code=404, detail="Patient not found")
 
     if current_user.role == "patient" and current_user.reference_id != id:
         raise HTTPException(status_code=403, detail="Not enough permissions")
 
+    etag = entity_etag(patient_obj)
+    if etag_matches(if_none_match, etag):
+        return not_modified(etag)
+    response.headers["ETag"] = etag
+
     return patient_obj
 
 
@@ -96,6 +145,7 @@ def update_patient(
             )
 
     patient_obj = patient.update(db, db_obj=patient_obj, obj_in=patient_in)
+    invalidate_tags(*patient_tags(id))
     return patient_obj
 
 
@@ -113,6 +163,7 @@ def delete_patient(
         raise HTTPException(status_code=404, detail="Patient not found")
 
     patient_obj = patient.remove(db, id=id)
+    invalidate_tags(*patient_tags(id))
     return patient_obj
 
 
@@ -1,66 +1,382 @@
+import asyncio
+import base64
 import json
-from typing import  Callable
+import logging
+import math
+import random
+import secrets
+import time
+from typing import Callable, Dict, Iterable, List, Optional
+from urllib.parse import urlencode
+
 import redis
 from fastapi import Request, Response
+from jose import JWTError, jwt
 from starlette.middleware.base import BaseHTTPMiddleware
 
+from app.core.compression import negotiate, precompress
 from app.core.config import settings
+from app.core.etag import etag_matches, not_modified
+from app.core.metrics import record_compression
+from app.core.redis_client import RedisClient, redis_client
+
+logger = logging.getLogger(__name__)
+
+# Response header a route sets to make a GET response cacheable; stripped
+# before the response leaves the middleware
+CACHE_TAGS_HEADER = "X-Cache-Tags"
+# Response header shortening how long a tagged response stays fresh
+CACHE_TTL_HEADER = "X-Cache-TTL"
+CACHE_STATUS_HEADER = "X-Cache"
+
+# Deletes a lock only if it still holds the caller's token
+RELEASE_LOCK_SCRIPT = """
+if redis.call("get", KEYS[1]) == ARGV[1] then
+    return redis.call("del", KEYS[1])
+end
+return 0
+"""
+
+
+def set_cache_tags(response: Response, *tags: str, ttl: Optional[int] = None) -> None:
+    """
+    Mark a GET response as cacheable, tagged with the entities it was built
+    from. Writes to any of those entities must call `invalidate_tags` with
+    the same tags. `ttl` caps how many seconds the response stays fresh, for
+    responses built from state that expires without a write.
+    """
+    if settings.RESPONSE_CACHE_ENABLED:
+        response.headers[CACHE_TAGS_HEADER] = " ".join(tags)
+        if ttl is not None:
+            response.headers[CACHE_TTL_HEADER] = str(ttl)
+
+
+def doctor_tags(doctor_id: int) -> List[str]:
+    """
+    Tags of responses built from a doctor's profile or availability,
+    including appointment responses that embed the doctor's name.
+    """
+    return [
+        "doctors",
+        f"doctor:{doctor_id}",
+        f"slots:doctor:{doctor_id}",
+        "slots",
+        "appointments",
+        f"appointments:doctor:{doctor_id}",
+    ]
+
+
+def patient_tags(patient_id: int) -> List[str]:
+    """Tags of responses that embed a patient's details."""
+    return ["appointments", f"appointments:patient:{patient_id}", f"patient:{patient_id}"]
+
+
+def appointment_tags(appointment_id: Optional[int], doctor_id: int, patient_id: int) -> List[str]:
+    """Tags of responses that change when an appointment is written."""
+    tags = [
+        "appointments",
+        f"appointments:doctor:{doctor_id}",
+        f"appointments:patient:{patient_id}",
+        f"slots:doctor:{doctor_id}",
+        "slots",
+    ]
+    if appointment_id is not None:
+        tags.append(f"appointment:{appointment_id}")
+    return tags
+
+
+def request_principal(request: Request) -> Optional[str]:
+    """
+    The user a request is authenticated as, from a valid bearer token, or
+    None when the request carries no valid token and must not be cached.
+    """
+    scheme, _, token = request.headers.get("authorization", "").partition(" ")
+    if scheme.lower() != "bearer" or not token:
+        return None
+    try:
+        payload = jwt.decode(token, settings.SECRET_KEY, algorithms=[settings.ALGORITHM])
+    except JWTError:
+        return None
+    subject = payload.get("sub")
+    return f"user:{subject}" if subject else None
+
+
+def may_cache(request: Request) -> bool:
+    """
+    Whether CacheMiddleware may store the response to `request`. Such
+    requests read from the primary, since a lagging replica would refill
+    entries that writes just invalidated.
+    """
+    return settings.RESPONSE_CACHE_ENABLED and request.method == "GET" and request_principal(request) is not None
+
+
+def cache_key(request: Request, principal: str) -> str:
+    query = urlencode(sorted(request.query_params.multi_items()))
+    return f"cache:{principal}:{request.url.path}?{query}"
+
+
+class ResponseCache:
+    """
+    Redis store of cached responses with tag-based invalidation.
+
+    Every tag has a Redis set of the keys tagged with it; invalidating a tag
+    deletes those keys. Tag sets expire with their newest entry. Entries are
+    fresh for `ttl` seconds and kept `stale_ttl` seconds longer so they can be
+    served while one request recomputes them.
+
+    Lookups, stores and locks run on the event loop through the shared
+    asyncio client. Invalidation is called by sync routes and CRUD code in
+    the threadpool and uses a synchronous client.
+    """
 
-class CacheMiddleware(BaseHTTPMiddleware):
     def __init__(
         self,
-        app,
         redis_url: str = settings.REDIS_URL,
-        ttl: int = 60
+        ttl: int = settings.RESPONSE_CACHE_TTL_SECONDS,
+        stale_ttl: int = settings.RESPONSE_CACHE_STALE_SECONDS,
+        lock_ttl: int = settings.RESPONSE_CACHE_LOCK_SECONDS,
+        client: RedisClient = redis_client
     ):
-        super().__init__(app)
         self.redis = redis.from_url(redis_url)
+        self.client = client
         self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self.lock_ttl = lock_ttl
+        self._release_lock = client.register_script(RELEASE_LOCK_SCRIPT)
+
+    async def get(self, key: str) -> Optional[dict]:
+        cached = await self.client.run(self.client.redis.get(key))
+        return json.loads(cached) if cached else None
+
+    async def set(self, key: str, data: dict, tags: Iterable[str], ttl: Optional[int] = None) -> None:
+        # Tag sets keep the full lifetime so they outlive every entry in them
+        def queue(pipe):
+            pipe.setex(key, (self.ttl if ttl is None else min(self.ttl, ttl)) + self.stale_ttl, json.dumps(data))
+            for tag in tags:
+                pipe.sadd(f"cache:tag:{tag}", key)
+                pipe.expire(f"cache:tag:{tag}", self.ttl + self.stale_ttl)
+
+        await self.client.pipelined(queue)
+
+    def invalidate(self, tags: Iterable[str]) -> None:
+        tag_keys = [f"cache:tag:{tag}" for tag in set(tags)]
+        if not tag_keys:
+            return
+        keys = self.redis.sunion(tag_keys)
+        pipe = self.redis.pipeline()
+        if keys:
+            pipe.delete(*keys)
+        pipe.delete(*tag_keys)
+        pipe.execute()
+
+    async def acquire_lock(self, key: str) -> Optional[str]:
+        """Take the cross-replica recompute lock of `key`; returns its token or None."""
+        token = secrets.token_hex(8)
+        if await self.client.run(self.client.redis.set(f"{key}:lock", token, nx=True, ex=self.lock_ttl)):
+            return token
+        return None
+
+    async def release_lock(self, key: str, token: str) -> None:
+        await self._release_lock(keys=[f"{key}:lock"], args=[token])
+
+
+response_cache = ResponseCache()
+
+
+def invalidate_tags(*tags: str) -> None:
+    """Drop every cached response tagged with any of `tags`."""
+    if not settings.RESPONSE_CACHE_ENABLED:
+        return
+    try:
+        response_cache.invalidate(tags)
+    except redis.RedisError as e:
+        logger.error(f"Failed to invalidate cache tags {tags}: {e}")
+
+
+class CacheMiddleware(BaseHTTPMiddleware):
+    """
+    Cache GET responses that routes tag with `set_cache_tags`.
+
+    Entries are keyed by the authenticated user as well as path and query,
+    so a response is never served to another principal. Untagged responses
+    and requests without a valid bearer token are passed through. Every
+    entry is also tagged with its user so it can be dropped when the user
+    changes. Hits whose `ETag` matches the request's `If-None-Match` are
+    answered with 304 Not Modified.
+
+    Large bodies are stored gzip- and Brotli-compressed alongside the
+    original, once when the entry is written, and every hit is served in the
+    variant its `Accept-Encoding` prefers without compressing again.
+
+    Only one request recomputes an entry at a time: concurrent misses in the
+    same process wait for it (single-flight), and a Redis lock does the same
+    across replicas. While an entry is being recomputed, other requests get
+    the stale copy. Entries are refreshed early with a probability that grows
+    as they near expiry and with how long they took to compute, so hot keys
+    are usually refreshed by a single request before they expire.
+    """
+
+    def __init__(
+        self,
+        app,
+        cache: Optional[ResponseCache] = None,
+        early_expiry_beta: float = settings.RESPONSE_CACHE_EARLY_EXPIRY_BETA,
+        lock_wait: float = settings.RESPONSE_CACHE_LOCK_WAIT_SECONDS
+    ):
+        super().__init__(app)
+        self.cache = cache or response_cache
+        self.early_expiry_beta = early_expiry_beta
+        self.lock_wait = lock_wait
+        self._in_flight: Dict[str, asyncio.Future] = {}
+
+    async def _lookup(self, key: str) -> Optional[dict]:
+        try:
+            return await self.cache.get(key)
+        except redis.RedisError as e:
+            logger.error(f"Cache lookup failed: {e}")
+            return None
+
+    def _needs_refresh(self, entry: dict) -> bool:
+        # Probabilistic early expiry ("XFetch"): -log(u) is 0 most of the time
+        # but occasionally large, and is scaled by the recompute time
+        jitter = -entry.get("delta", 0) * self.early_expiry_beta * math.log(1.0 - random.random())
+        return time.time() + jitter >= entry.get("fresh_until", 0)
+
+    async def _acquire_lock(self, key: str) -> Optional[str]:
+        try:
+            return await self.cache.acquire_lock(key)
+        except redis.RedisError as e:
+            # Recompute without the cross-replica lock rather than not at all
+            logger.error(f"Cache lock failed: {e}")
+            return ""
+
+    async def _release_lock(self, key: str, token: str) -> None:
+        try:
+            await self.cache.release_lock(key, token)
+        except redis.RedisError as e:
+            logger.error(f"Cache unlock failed: {e}")
+
+    async def _wait_for_entry(self, key: str) -> Optional[dict]:
+        # Another replica holds the lock; give it a moment to store the entry
+        deadline = time.monotonic() + self.lock_wait
+        while time.monotonic() < deadline:
+            await asyncio.sleep(0.05)
+            entry = await self._lookup(key)
+            if entry is not None:
+                return entry
+        return None
+
+    def _cached_response(self, request: Request, entry: dict, cache_status: str) -> Response:
+        etag = entry["headers"].get("etag")
+        if etag and etag_matches(request.headers.get("if-none-match"), etag):
+            return not_modified(etag, **{CACHE_STATUS_HEADER: cache_status})
+
+        # Content-Length is recomputed for the variant being sent
+        headers = {name: value for name, value in entry["headers"].items() if name != "content-length"}
+        headers[CACHE_STATUS_HEADER] = cache_status
+        content = entry["content"]
+
+        encoded = entry.get("encoded", {})
+        if encoded:
+            headers["vary"] = "Accept-Encoding"
+        encoding = negotiate(request.headers.get("accept-encoding"), encoded)
+        if encoding is not None:
+            content = base64.b64decode(encoded[encoding])
+            headers["content-encoding"] = encoding
+            record_compression(encoding, "cache", entry["size"] - len(content))
+
+        return Response(
+            content=content,
+            status_code=entry["status_code"],
+            headers=headers,
+            media_type=entry["media_type"]
+        )
 
     async def dispatch(self, request: Request, call_next: Callable) -> Response:
         if request.method != "GET":
             return await call_next(request)
 
-        if request.url.path in ["/health", "/docs", "/redoc", "/openapi.json"]:
+        principal = request_principal(request)
+        if principal is None:
+            return await call_next(request)
+
+        key = cache_key(request, principal)
+
+        entry = await self._lookup(key)
+        if entry is not None and not self._needs_refresh(entry):
+            return self._cached_response(request, entry, "HIT")
+
+        in_flight = self._in_flight.get(key)
+        if in_flight is not None:
+            if entry is not None:
+                return self._cached_response(request, entry, "STALE")
+            entry = await asyncio.shield(in_flight)
+            if entry is not None:
+                return self._cached_response(request, entry, "HIT")
             return await call_next(request)
 
-        cache_key = f"cache:{request.url.path}:{request.query_params}"
+        future = asyncio.get_running_loop().create_future()
+        self._in_flight[key] = future
+        result = None
+        try:
+            token = await self._acquire_lock(key)
+            if token is None:
+                if entry is not None:
+                    result = entry
+                    return self._cached_response(request, entry, "STALE")
+                result = await self._wait_for_entry(key)
+                if result is not None:
+                    return self._cached_response(request, result, "HIT")
 
-        cached_response = self.redis.get(cache_key)
-        if cached_response:
-            cached_data = json.loads(cached_response)
-            return Response(
-                content=cached_data["content"],
-                status_code=cached_data["status_code"],
-                headers=cached_data["headers"],
-                media_type=cached_data["media_type"]
-            )
+            try:
+                response, result = await self._compute(request, call_next, key, principal)
+                return response
+            finally:
+                if token:
+                    await self._release_lock(key, token)
+        finally:
+            del self._in_flight[key]
+            future.set_result(result)
 
+    async def _compute(self, request: Request, call_next: Callable, key: str, principal: str):
+        started = time.time()
         response = await call_next(request)
 
-        if 200 <= response.status_code < 300:
-            response_body = b""
-            async for chunk in response.body_iterator:
-                response_body += chunk
-
-            cache_data = {
-                "content": response_body.decode(),
-                "status_code": response.status_code,
-                "headers": dict(response.headers),
-                "media_type": response.media_type
-            }
-
-            self.redis.setex(
-                cache_key,
-                self.ttl,
-                json.dumps(cache_data)
-            )
-
-            return Response(
-                content=response_body,
-                status_code=response.status_code,
-                headers=dict(response.headers),
-                media_type=response.media_type
-            )
-
-        return response
+        tags = response.headers.get(CACHE_TAGS_HEADER)
+        if tags is None:
+            return response, None
+        del response.headers[CACHE_TAGS_HEADER]
+        ttl = self.cache.ttl
+        if CACHE_TTL_HEADER in response.headers:
+            ttl = min(ttl, int(response.headers[CACHE_TTL_HEADER]))
+            del response.headers[CACHE_TTL_HEADER]
+
+        if response.status_code != 200:
+            return response, None
+
+        response_body = b""
+        async for chunk in response.body_iterator:
+            response_body += chunk
+
+        encoded = await asyncio.to_thread(precompress, response_body)
+
+        stored_at = time.time()
+        cache_data = {
+            "content": response_body.decode(),
+            "size": len(response_body),
+            "encoded": {
+                encoding: base64.b64encode(body).decode() for encoding, body in encoded.items()
+            },
+            "status_code": response.status_code,
+            "headers": dict(response.headers),
+            "media_type": response.media_type,
+            "delta": stored_at - started,
+            "fresh_until": stored_at + ttl
+        }
+
+        try:
+            await self.cache.set(key, cache_data, tags.split() + [principal], ttl=ttl)
+        except redis.RedisError as e:
+            logger.error(f"Cache store failed: {e}")
+
+        return self._cached_response(request, cache_data, "MISS"), cache_data
@@ -0,0 +1,145 @@
+import asyncio
+import gzip
+import time
+from typing import Dict, Iterable, Optional
+
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from app.core.config import settings
+from app.core.metrics import record_compression
+
+try:
+    import brotli
+except ImportError:  # Brotli is optional; gzip is always available
+    brotli = None
+
+# Supported content codings in order of preference
+ENCODINGS = ("br", "gzip") if brotli is not None else ("gzip",)
+
+
+def negotiate(accept_encoding: Optional[str], available: Iterable[str]) -> Optional[str]:
+    """
+    The encoding from `available` that an Accept-Encoding header prefers, or
+    None if the body should be sent as is. Ties go to the server's order.
+    """
+    if not accept_encoding:
+        return None
+
+    weights = {}
+    for item in accept_encoding.split(","):
+        coding, _, params = item.partition(";")
+        weight = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                weight = float(params[2:])
+            except ValueError:
+                weight = 0.0
+        weights[coding.strip().lower()] = weight
+
+    best, best_weight = None, 0.0
+    for encoding in ENCODINGS:
+        if encoding not in available:
+            continue
+        weight = weights.get(encoding, weights.get("*", 0.0))
+        if weight > best_weight:
+            best, best_weight = encoding, weight
+    return best
+
+
+def compress(body: bytes, encoding: str, level: Optional[int] = None) -> bytes:
+    if encoding == "br":
+        return brotli.compress(body, quality=settings.COMPRESSION_BROTLI_QUALITY if level is None else level)
+    if encoding == "gzip":
+        # A fixed mtime keeps the output identical for identical bodies
+        return gzip.compress(body, compresslevel=settings.COMPRESSION_GZIP_LEVEL if level is None else level, mtime=0)
+    raise ValueError(f"Unsupported encoding {encoding}")
+
+
+def precompress(body: bytes) -> Dict[str, bytes]:
+    """
+    Every supported encoding of a body about to be cached, compressed at the
+    cache levels. Empty for bodies below the compression threshold.
+    """
+    if len(body) < settings.COMPRESSION_MINIMUM_SIZE:
+        return {}
+    levels = {"br": settings.RESPONSE_CACHE_BROTLI_QUALITY, "gzip": settings.RESPONSE_CACHE_GZIP_LEVEL}
+    variants = {}
+    for encoding in ENCODINGS:
+        started = time.perf_counter()
+        variants[encoding] = compress(body, encoding, levels[encoding])
+        record_compression(encoding, "cache_store", 0, time.perf_counter() - started)
+    return variants
+
+
+class CompressionMiddleware:
+    """
+    Compress response bodies of at least `minimum_size` bytes with the
+    encoding the client prefers.
+
+    Responses that already carry a Content-Encoding (precompressed cache
+    hits) and streamed responses without a Content-Length, such as exports
+    and calendar feeds, are passed through untouched. Bodies of at least
+    `thread_minimum_size` bytes are compressed in a worker thread so they
+    do not hold up the event loop.
+    """
+
+    def __init__(
+        self,
+        app: ASGIApp,
+        minimum_size: int = settings.COMPRESSION_MINIMUM_SIZE,
+        thread_minimum_size: int = settings.COMPRESSION_THREAD_MINIMUM_SIZE
+    ):
+        self.app = app
+        self.minimum_size = minimum_size
+        self.thread_minimum_size = thread_minimum_size
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http" or scope["method"] == "HEAD":
+            await self.app(scope, receive, send)
+            return
+
+        encoding = negotiate(Headers(scope=scope).get("accept-encoding"), ENCODINGS)
+        if encoding is None:
+            await self.app(scope, receive, send)
+            return
+
+        start_message: Optional[Message] = None
+        chunks = []
+
+        async def send_compressed(message: Message) -> None:
+            nonlocal start_message
+            if message["type"] == "http.response.start":
+                headers = Headers(raw=message["headers"])
+                length = headers.get("content-length")
+                if "content-encoding" in headers or length is None or int(length) < self.minimum_size:
+                    await send(message)
+                else:
+                    start_message = message
+                return
+
+            if message["type"] != "http.response.body" or start_message is None:
+                await send(message)
+                return
+
+            chunks.append(message.get("body", b""))
+            if message.get("more_body", False):
+                return
+
+            body = b"".join(chunks)
+            started = time.perf_counter()
+            if len(body) >= self.thread_minimum_size:
+                compressed = await asyncio.to_thread(compress, body, encoding)
+            else:
+                compressed = compress(body, encoding)
+            record_compression(encoding, "on_the_fly", len(body) - len(compressed), time.perf_counter() - started)
+
+            headers = MutableHeaders(scope=start_message)
+            headers["Content-Encoding"] = encoding
+            headers["Content-Length"] = str(len(compressed))
+            headers.add_vary_header("Accept-Encoding")
+            await send(start_message)
+            await send({"type": "http.response.body", "body": compressed})
+
+        await self.app(scope, receive, send_compressed)
@@ -0,0 +1,220 @@
+import threading
+import time as clock
+from collections import OrderedDict
+from datetime import date, datetime, time, timedelta
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from app.core.config import settings
+from app.core.interval_index import to_naive_utc
+
+CELL_MINUTES = 15
+CELLS_PER_DAY = 24 * 60 // CELL_MINUTES
+
+
+def is_aligned(value: time) -> bool:
+    return value.second == 0 and value.microsecond == 0 and value.minute % CELL_MINUTES == 0
+
+
+def cell_of(value: time) -> int:
+    """Index of the cell starting at an aligned time of day."""
+    return (value.hour * 60 + value.minute) // CELL_MINUTES
+
+
+def cells_mask(start_seconds: float, end_seconds: float) -> int:
+    """Mask of every cell that [start_seconds, end_seconds) of a day touches."""
+    cell_seconds = CELL_MINUTES * 60
+    low = max(int(start_seconds // cell_seconds), 0)
+    high = min(int(-(-end_seconds // cell_seconds)), CELLS_PER_DAY)
+    if high <= low:
+        return 0
+    return ((1 << (high - low)) - 1) << low
+
+
+def _seconds_of_day(value: Any) -> float:
+    return value.hour * 3600 + value.minute * 60 + value.second + value.microsecond / 1e6
+
+
+class DayWindows:
+    """Availability windows of a doctor for one weekday, in database order."""
+
+    def __init__(self, windows: List[Tuple[time, time]], loaded_at: float):
+        self.windows = windows
+        self.loaded_at = loaded_at
+
+    @property
+    def aligned(self) -> bool:
+        return all(is_aligned(start_time) and is_aligned(end_time) for start_time, end_time in self.windows)
+
+    def masks(self) -> List[int]:
+        return [
+            cells_mask(_seconds_of_day(start_time), _seconds_of_day(end_time))
+            for start_time, end_time in self.windows
+        ]
+
+
+class DayBookings:
+    """Cells booked by one doctor on one date, kept per appointment."""
+
+    def __init__(self, loaded_at: float):
+        self.loaded_at = loaded_at
+        self.masks: Dict[int, int] = {}
+        self.booked = 0
+
+    def add(self, id: int, mask: int) -> None:
+        self.masks[id] = mask
+        self.booked |= mask
+
+    def discard(self, id: int) -> None:
+        if self.masks.pop(id, None) is not None:
+            self.booked = 0
+            for mask in self.masks.values():
+                self.booked |= mask
+
+
+class DayBitmapCache:
+    """
+    In-process cache of per-doctor availability windows (per weekday) and
+    booked 15-minute cells (per date), each day held in a 96-bit int.
+
+    Entries are loaded from the database on a miss and then updated in place
+    by the doctor and appointment CRUD write methods. Entries older than `ttl`
+    seconds are reloaded so writes made by other processes are picked up.
+    Times that do not fall on the 15-minute grid cannot be represented
+    exactly, and callers fall back to SQL for them.
+    """
+
+    def __init__(
+        self,
+        ttl: int = settings.SCHEDULE_CACHE_TTL_SECONDS,
+        max_days: int = settings.SCHEDULE_CACHE_MAX_DAYS
+    ):
+        self.ttl = ttl
+        self.max_days = max_days
+        self._windows: Dict[Tuple[int, int], DayWindows] = {}
+        self._bookings: "OrderedDict[Tuple[int, date], DayBookings]" = OrderedDict()
+        self._booking_keys: Dict[int, Tuple[int, date]] = {}
+        self._lock = threading.RLock()
+
+    def _expired(self, entry: Any) -> bool:
+        return bool(self.ttl) and clock.monotonic() - entry.loaded_at > self.ttl
+
+    # Availability windows
+
+    def windows(self, doctor_id: int, weekday: int) -> Optional[DayWindows]:
+        with self._lock:
+            entry = self._windows.get((doctor_id, weekday))
+            if entry is None or self._expired(entry):
+                return None
+            return entry
+
+    def load_windows(self, doctor_id: int, weekday: int, rows: Iterable[Tuple[time, time]]) -> DayWindows:
+        entry = DayWindows(list(rows), loaded_at=clock.monotonic())
+        with self._lock:
+            self._windows[(doctor_id, weekday)] = entry
+        return entry
+
+    def add_window(self, doctor_id: int, weekday: int, start_time: time, end_time: time) -> None:
+        with self._lock:
+            entry = self._windows.get((doctor_id, weekday))
+            if entry is not None:
+                entry.windows.append((start_time, end_time))
+
+    # Booked cells
+
+    def _day_of(self, start_time: datetime, end_time: datetime) -> Optional[date]:
+        start_time, end_time = to_naive_utc(start_time), to_naive_utc(end_time)
+        if start_time.date() != end_time.date():
+            return None
+        return start_time.date()
+
+    def booked(self, doctor_id: int, day: date) -> Optional[int]:
+        with self._lock:
+            entry = self._bookings.get((doctor_id, day))
+            if entry is None or self._expired(entry):
+                return None
+            self._bookings.move_to_end((doctor_id, day))
+            return entry.booked
+
+    def load_bookings(
+        self, doctor_id: int, day: date, rows: Iterable[Tuple[int, datetime, datetime]]
+    ) -> int:
+        """Replace a doctor's bookings for `day` with `(id, start_time, end_time)` rows."""
+        entry = DayBookings(loaded_at=clock.monotonic())
+        midnight = datetime.combine(day, time.min)
+        for id, start_time, end_time in rows:
+            entry.add(id, cells_mask(
+                (to_naive_utc(start_time) - midnight).total_seconds(),
+                (to_naive_utc(end_time) - midnight).total_seconds()
+            ))
+
+        with self._lock:
+            self._bookings[(doctor_id, day)] = entry
+            for id in entry.masks:
+                self._booking_keys[id] = (doctor_id, day)
+            while len(self._bookings) > self.max_days:
+                _, evicted = self._bookings.popitem(last=False)
+                for id in evicted.masks:
+                    self._booking_keys.pop(id, None)
+        return entry.booked
+
+    def add_booking(self, doctor_id: int, id: int, start_time: datetime, end_time: datetime) -> None:
+        day = self._day_of(start_time, end_time)
+        with self._lock:
+            self.discard_booking(id)
+            entry = self._bookings.get((doctor_id, day)) if day is not None else None
+            if entry is None:
+                return
+            midnight = datetime.combine(day, time.min)
+            entry.add(id, cells_mask(
+                (to_naive_utc(start_time) - midnight).total_seconds(),
+                (to_naive_utc(end_time) - midnight).total_seconds()
+            ))
+            self._booking_keys[id] = (doctor_id, day)
+
+    def discard_booking(self, id: int) -> None:
+        with self._lock:
+            key = self._booking_keys.pop(id, None)
+            if key is not None and key in self._bookings:
+                self._bookings[key].discard(id)
+
+    def invalidate(self) -> None:
+        with self._lock:
+            self._windows.clear()
+            self._bookings.clear()
+            self._booking_keys.clear()
+
+
+def is_within_windows(masks: List[int], start_time: time, end_time: time) -> bool:
+    """Whether [start_time, end_time) lies entirely inside one window."""
+    needed = cells_mask(_seconds_of_day(start_time), _seconds_of_day(end_time))
+    return any(mask & needed == needed for mask in masks)
+
+
+def bitmap_slots(
+    day: date, windows: List[Tuple[time, time]], booked: int, slot_minutes: int
+) -> List[Dict[str, Any]]:
+    """
+    Slots of `slot_minutes` (a multiple of CELL_MINUTES) cut from each aligned
+    window whose cells are not booked; same output as `generate_slots`.
+    """
+    cells_per_slot = slot_minutes // CELL_MINUTES
+    slot_mask = (1 << cells_per_slot) - 1
+    midnight = datetime.combine(day, time.min)
+    cell = timedelta(minutes=CELL_MINUTES)
+
+    slots = []
+    for start_time, end_time in windows:
+        position, end_position = cell_of(start_time), cell_of(end_time)
+        while position + cells_per_slot <= end_position:
+            if not booked & (slot_mask << position):
+                slot_start_time = midnight + position * cell
+                slots.append({
+                    "start_time": slot_start_time.isoformat(),
+                    "end_time": (slot_start_time + cells_per_slot * cell).isoformat(),
+                    "is_available": True
+                })
+            position += cells_per_slot
+    return slots
+
+
+schedule_cache = DayBitmapCache()
@@ -0,0 +1,38 @@
+import hashlib
+from typing import Any, Optional
+
+from fastapi import Response
+from pydantic import BaseModel
+
+
+def weak_etag(*parts: Any) -> str:
+    """Weak ETag fingerprinting `parts`, e.g. an id and its last change time."""
+    digest = hashlib.blake2b("|".join(str(part) for part in parts).encode(), digest_size=12)
+    return f'W/"{digest.hexdigest()}"'
+
+
+def entity_etag(obj: Any) -> str:
+    """
+    Weak ETag of a single row or schema object, fingerprinting its field
+    values rather than its serialized body. Unlike `updated_at` alone this
+    also tells apart writes made within the database clock's resolution.
+    """
+    if isinstance(obj, BaseModel):
+        return weak_etag(type(obj).__name__, obj.model_dump())
+    return weak_etag(type(obj).__name__, *(getattr(obj, column.key) for column in obj.__table__.columns))
+
+
+def _opaque_tag(etag: str) -> str:
+    return etag[2:] if etag.startswith("W/") else etag
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """Whether an If-None-Match header matches `etag` (weak comparison)."""
+    if not if_none_match:
+        return False
+    candidates = [candidate.strip() for candidate in if_none_match.split(",")]
+    return "*" in candidates or _opaque_tag(etag) in {_opaque_tag(candidate) for candidate in candidates}
+
+
+def not_modified(etag: str, **headers: str) -> Response:
+    return Response(status_code=304, headers={"ETag": etag, **headers})
@@ -0,0 +1,69 @@
+import csv
+import io
+import json
+from enum import Enum
+from typing import Any, Dict, Iterable, Iterator, List
+
+from fastapi.responses import StreamingResponse
+
+# Rows are written to the response in chunks of this many rows
+CHUNK_ROWS = 500
+
+
+class ExportFormat(str, Enum):
+    NDJSON = "ndjson"
+    CSV = "csv"
+
+
+def _encode_value(value: Any) -> Any:
+    if hasattr(value, "isoformat"):
+        return value.isoformat()
+    return value
+
+
+def iter_ndjson(rows: Iterable[Dict[str, Any]]) -> Iterator[str]:
+    chunk = []
+    for row in rows:
+        chunk.append(json.dumps(row, default=_encode_value))
+        if len(chunk) >= CHUNK_ROWS:
+            yield "\n".join(chunk) + "\n"
+            chunk = []
+    if chunk:
+        yield "\n".join(chunk) + "\n"
+
+
+def iter_csv(rows: Iterable[Dict[str, Any]], columns: List[str]) -> Iterator[str]:
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=columns, extrasaction="ignore")
+    writer.writeheader()
+    for count, row in enumerate(rows, start=1):
+        writer.writerow({key: _encode_value(value) for key, value in row.items()})
+        if count % CHUNK_ROWS == 0:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue()
+
+
+def export_response(
+    rows: Iterable[Dict[str, Any]],
+    *,
+    format: ExportFormat,
+    columns: List[str],
+    filename: str
+) -> StreamingResponse:
+    """
+    Stream `rows` as NDJSON or CSV. `rows` should be a lazy iterator (for
+    example a server-side cursor) so memory use does not grow with the
+    number of rows.
+    """
+    if format == ExportFormat.CSV:
+        content, media_type = iter_csv(rows, columns), "text/csv"
+    else:
+        content, media_type = iter_ndjson(rows), "application/x-ndjson"
+
+    return StreamingResponse(
+        content,
+        media_type=media_type,
+        headers={"Content-Disposition": f'attachment; filename="{filename}.{format.value}"'}
+    )
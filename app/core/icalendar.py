@@ -0,0 +1,108 @@
+from datetime import datetime
+from typing import Any, Dict, Iterable, Iterator
+
+from fastapi.responses import StreamingResponse
+
+from app.core.interval_index import to_naive_utc
+
+ICALENDAR_MEDIA_TYPE = "text/calendar; charset=utf-8"
+
+# Events are written to the response in chunks of this many events
+CHUNK_EVENTS = 500
+
+# Bump when the feed layout changes so cached copies are not reused
+FEED_FORMAT_VERSION = 1
+
+EVENT_STATUS = {
+    "scheduled": "TENTATIVE",
+    "confirmed": "CONFIRMED",
+    "completed": "CONFIRMED",
+    "cancelled": "CANCELLED",
+    "no_show": "CANCELLED",
+}
+
+
+def _escape(text: str) -> str:
+    return text.replace("\\", "\\\\").replace(";", "\\;").replace(",", "\\,").replace("\n", "\\n")
+
+
+def _fold(line: str) -> str:
+    # Content lines are limited to 75 octets; continuation lines start with a space
+    encoded = line.encode("utf-8")
+    if len(encoded) <= 75:
+        return line + "\r\n"
+    parts = []
+    while encoded:
+        size = 75 if not parts else 74
+        # Do not split a multi-byte character
+        while size < len(encoded) and (encoded[size] & 0xC0) == 0x80:
+            size -= 1
+        parts.append(encoded[:size].decode("utf-8"))
+        encoded = encoded[size:]
+    return "\r\n ".join(parts) + "\r\n"
+
+
+def _format_datetime(value: datetime) -> str:
+    return to_naive_utc(value).strftime("%Y%m%dT%H%M%SZ")
+
+
+def _event(appointment: Dict[str, Any]) -> str:
+    # Only fields of the appointment row are used, so the owner's change
+    # counter covers every change to the feed
+    status = getattr(appointment["status"], "value", appointment["status"])
+    stamp = appointment.get("updated_at") or appointment.get("created_at") or appointment["start_time"]
+    lines = [
+        "BEGIN:VEVENT",
+        f"UID:appointment-{appointment['id']}@healthcare-api",
+        f"DTSTAMP:{_format_datetime(stamp)}",
+        f"DTSTART:{_format_datetime(appointment['start_time'])}",
+        f"DTEND:{_format_datetime(appointment['end_time'])}",
+        f"SUMMARY:Appointment #{appointment['id']}",
+        f"STATUS:{EVENT_STATUS.get(status, 'TENTATIVE')}",
+        "END:VEVENT",
+    ]
+    return "".join(_fold(line) for line in lines)
+
+
+def iter_icalendar(appointments: Iterable[Dict[str, Any]], *, name: str) -> Iterator[str]:
+    header = [
+        "BEGIN:VCALENDAR",
+        "VERSION:2.0",
+        "PRODID:-//Healthcare Appointment System//Appointments//EN",
+        "CALSCALE:GREGORIAN",
+        f"X-WR-CALNAME:{_escape(name)}",
+    ]
+    chunk = ["".join(_fold(line) for line in header)]
+    for appointment in appointments:
+        chunk.append(_event(appointment))
+        if len(chunk) >= CHUNK_EVENTS:
+            yield "".join(chunk)
+            chunk = []
+    chunk.append(_fold("END:VCALENDAR"))
+    yield "".join(chunk)
+
+
+def calendar_etag(owner_type: str, owner_id: int, version: int) -> str:
+    return f'"{owner_type}-{owner_id}-{version}-{FEED_FORMAT_VERSION}"'
+
+
+def calendar_response(
+    appointments: Iterable[Dict[str, Any]],
+    *,
+    name: str,
+    etag: str,
+    filename: str
+) -> StreamingResponse:
+    """
+    Stream `appointments` as an iCalendar feed. `appointments` should be a
+    lazy iterator so memory use does not grow with the calendar size.
+    """
+    return StreamingResponse(
+        iter_icalendar(appointments, name=name),
+        media_type=ICALENDAR_MEDIA_TYPE,
+        headers={
+            "ETag": etag,
+            "Cache-Control": "private, no-cache",
+            "Content-Disposition": f'inline; filename="{filename}.ics"'
+        }
+    )
@@ -0,0 +1,187 @@
+import itertools
+import threading
+import time
+from bisect import bisect_left, insort
+from collections import Counter
+from datetime import datetime, timedelta, timezone
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from app.core.config import settings
+
+
+def to_naive_utc(value: datetime) -> datetime:
+    """
+    Bring a datetime into a comparable form: aware values are converted to
+    naive UTC, naive values are assumed to already be UTC (as the database
+    session stores them).
+    """
+    if value.tzinfo is not None:
+        return value.astimezone(timezone.utc).replace(tzinfo=None)
+    return value
+
+
+class DoctorIntervals:
+    """
+    Sorted list of one doctor's booked intervals.
+
+    Entries are kept ordered by start time, together with the longest
+    booked interval. Any interval overlapping [start, end) must begin in
+    [start - max_span, end), so an overlap query is two bisections plus a
+    scan of the entries inside that window: O(log n) while intervals have
+    similar lengths. The worst case is O(n). While one interval is much
+    longer than the rest, every query scans the entries that start up to
+    that length earlier. `max_span` shrinks again when the long interval is
+    discarded.
+    """
+
+    def __init__(self, loaded_at: float):
+        self.loaded_at = loaded_at
+        self.entries: List[Tuple[datetime, int, datetime]] = []
+        self.by_id: Dict[int, Tuple[datetime, datetime]] = {}
+        self.max_span = timedelta(0)
+        # Number of booked intervals of each length, to recompute max_span on discard
+        self.spans: Counter = Counter()
+
+    def add(self, id: int, start_time: datetime, end_time: datetime) -> None:
+        self.discard(id)
+        start_time, end_time = to_naive_utc(start_time), to_naive_utc(end_time)
+        insort(self.entries, (start_time, id, end_time))
+        self.by_id[id] = (start_time, end_time)
+        self.spans[end_time - start_time] += 1
+        if end_time - start_time > self.max_span:
+            self.max_span = end_time - start_time
+
+    def discard(self, id: int) -> None:
+        existing = self.by_id.pop(id, None)
+        if existing is None:
+            return
+        start_time, end_time = existing
+        position = bisect_left(self.entries, (start_time, id, end_time))
+        if position < len(self.entries) and self.entries[position][1] == id:
+            del self.entries[position]
+
+        span = end_time - start_time
+        self.spans[span] -= 1
+        if not self.spans[span]:
+            del self.spans[span]
+            if span == self.max_span:
+                self.max_span = max(self.spans, default=timedelta(0))
+
+    def overlaps(
+        self, start_time: datetime, end_time: datetime, exclude_id: Optional[int] = None
+    ) -> bool:
+        start_time, end_time = to_naive_utc(start_time), to_naive_utc(end_time)
+        low = bisect_left(self.entries, (start_time - self.max_span,))
+        high = bisect_left(self.entries, (end_time,))
+        for entry_start, entry_id, entry_end in self.entries[low:high]:
+            if entry_end > start_time and entry_id != exclude_id:
+                return True
+        return False
+
+
+class AppointmentIntervalIndex:
+    """
+    In-process index of non-cancelled appointments, one sorted interval list
+    per doctor.
+
+    A doctor is loaded from the database on first use and then kept in sync
+    by the appointment CRUD write methods. Entries older than `ttl` seconds
+    are treated as a cold miss and reloaded, which bounds how long writes
+    made by other processes can go unnoticed.
+
+    Every write bumps the doctor's generation, loaded or not. A loader reads
+    `generation` before querying the database and passes it to `load`, which
+    drops the snapshot if a write came in meanwhile: the snapshot may be
+    missing it.
+    """
+
+    def __init__(self, ttl: int = settings.APPOINTMENT_INDEX_TTL_SECONDS):
+        self.ttl = ttl
+        self._doctors: Dict[int, DoctorIntervals] = {}
+        self._counter = itertools.count(1)
+        self._generations: Dict[int, int] = {}
+        # Generation of the last invalidation of every doctor
+        self._cleared = 0
+        self._lock = threading.RLock()
+
+    def _bump(self, doctor_id: int) -> None:
+        self._generations[doctor_id] = next(self._counter)
+
+    def generation(self, doctor_id: int) -> int:
+        with self._lock:
+            return max(self._generations.get(doctor_id, 0), self._cleared)
+
+    def _get_fresh(self, doctor_id: int) -> Optional[DoctorIntervals]:
+        intervals = self._doctors.get(doctor_id)
+        if intervals is None:
+            return None
+        if self.ttl and time.monotonic() - intervals.loaded_at > self.ttl:
+            del self._doctors[doctor_id]
+            return None
+        return intervals
+
+    def is_loaded(self, doctor_id: int) -> bool:
+        with self._lock:
+            return self._get_fresh(doctor_id) is not None
+
+    def load(
+        self, doctor_id: int, rows: Iterable[Tuple[int, datetime, datetime]],
+        generation: Optional[int] = None
+    ) -> bool:
+        """
+        Replace a doctor's intervals with `(id, start_time, end_time)` rows,
+        unless the doctor was written to since `generation`. Returns whether
+        the rows were loaded.
+        """
+        intervals = DoctorIntervals(loaded_at=time.monotonic())
+        for id, start_time, end_time in rows:
+            intervals.add(id, start_time, end_time)
+        with self._lock:
+            if generation is not None and generation != self.generation(doctor_id):
+                return False
+            self._doctors[doctor_id] = intervals
+            return True
+
+    def add(self, doctor_id: int, id: int, start_time: datetime, end_time: datetime) -> None:
+        with self._lock:
+            self._bump(doctor_id)
+            intervals = self._get_fresh(doctor_id)
+            if intervals is not None:
+                intervals.add(id, start_time, end_time)
+
+    def discard(self, doctor_id: int, id: int) -> None:
+        with self._lock:
+            self._bump(doctor_id)
+            intervals = self._get_fresh(doctor_id)
+            if intervals is not None:
+                intervals.discard(id)
+
+    def overlaps(
+        self,
+        doctor_id: int,
+        start_time: datetime,
+        end_time: datetime,
+        exclude_id: Optional[int] = None
+    ) -> Optional[bool]:
+        """
+        Return whether [start_time, end_time) overlaps a booked interval of the
+        doctor, or None if the doctor is not loaded (a cold miss).
+        """
+        with self._lock:
+            intervals = self._get_fresh(doctor_id)
+            if intervals is None:
+                return None
+            return intervals.overlaps(start_time, end_time, exclude_id=exclude_id)
+
+    def invalidate(self, doctor_id: Optional[int] = None) -> None:
+        with self._lock:
+            if doctor_id is None:
+                self._doctors.clear()
+                self._generations.clear()
+                self._cleared = next(self._counter)
+            else:
+                self._doctors.pop(doctor_id, None)
+                self._bump(doctor_id)
+
+
+appointment_index = AppointmentIntervalIndex()
@@ -8,6 +8,7 @@ from fastapi import Request, Response
 from starlette.middleware.base import BaseHTTPMiddleware
 import time
 import psutil
+from typing import Optional
 
 # =============================================================================
 # METRICS DEFINITIONS
@@ -39,7 +40,27 @@ APP_INFO = Info('healthcare_app', 'Healthcare application information')
 # Database metrics
 DB_CONNECTIONS_ACTIVE = Gauge(
     'db_connections_active',
-    'Number of active database connections'
+    'Number of active database connections',
+    ['pool']
+)
+
+DB_CONNECTIONS_IDLE = Gauge(
+    'db_connections_idle',
+    'Number of idle database connections kept in the pool',
+    ['pool']
+)
+
+DB_CONNECTIONS_OVERFLOW = Gauge(
+    'db_connections_overflow',
+    'Number of database connections open beyond the pool size',
+    ['pool']
+)
+
+DB_POOL_CHECKOUT = Histogram(
+    'db_pool_checkout_seconds',
+    'Time to check out a database connection, including waiting for a free one',
+    ['pool'],
+    buckets=[0.0001, 0.0005, 0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0]
 )
 
 DB_QUERY_DURATION = Histogram(
@@ -48,6 +69,18 @@ DB_QUERY_DURATION = Histogram(
     ['operation', 'table']
 )
 
+DB_REPLICA_LAG = Gauge(
+    'db_replica_lag_seconds',
+    'Replication lag of a read replica at its last check',
+    ['replica']
+)
+
+DB_REPLICA_HEALTHY = Gauge(
+    'db_replica_healthy',
+    'Whether a read replica is serving reads (1) or ejected (0)',
+    ['replica']
+)
+
 # Cache metrics
 CACHE_HITS = Counter(
     'cache_hits_total',
@@ -61,6 +94,33 @@ CACHE_MISSES = Counter(
     ['cache_type']
 )
 
+# Shared asyncio Redis pool metrics
+REDIS_POOL_CONNECTIONS = Gauge(
+    'redis_pool_connections',
+    'Connections in the shared Redis pool',
+    ['state']
+)
+
+REDIS_POOL_WAIT = Histogram(
+    'redis_pool_wait_seconds',
+    'Time spent waiting for a connection from the shared Redis pool',
+    buckets=[0.0001, 0.0005, 0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0]
+)
+
+# Response compression metrics
+COMPRESSION_BYTES_SAVED = Counter(
+    'http_response_compression_bytes_saved_total',
+    'Response body bytes saved by compression',
+    ['encoding', 'source']
+)
+
+COMPRESSION_DURATION = Histogram(
+    'http_response_compression_duration_seconds',
+    'Time spent compressing response bodies',
+    ['encoding', 'source'],
+    buckets=[0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25]
+)
+
 # Business metrics
 APPOINTMENTS_CREATED = Counter(
     'appointments_created_total',
@@ -211,6 +271,31 @@ def record_db_query(operation: str, table: str, duration: float):
     DB_QUERY_DURATION.labels(operation=operation, table=table).observe(duration)
 
 
+def record_db_pool(pool: str, active: int, idle: int, overflow: int):
+    """
+    Record the active, idle and overflow connections of a database pool
+    """
+    DB_CONNECTIONS_ACTIVE.labels(pool=pool).set(active)
+    DB_CONNECTIONS_IDLE.labels(pool=pool).set(idle)
+    DB_CONNECTIONS_OVERFLOW.labels(pool=pool).set(overflow)
+
+
+def record_db_pool_checkout(pool: str, duration: float):
+    """
+    Record how long checking out a database connection took
+    """
+    DB_POOL_CHECKOUT.labels(pool=pool).observe(duration)
+
+
+def record_db_replica(replica: str, lag: Optional[float], healthy: bool):
+    """
+    Record a read replica's lag and whether it is serving reads
+    """
+    if lag is not None:
+        DB_REPLICA_LAG.labels(replica=replica).set(lag)
+    DB_REPLICA_HEALTHY.labels(replica=replica).set(1 if healthy else 0)
+
+
 def record_cache_hit(cache_type: str = 'redis'):
     """
     Record a cache hit
@@ -225,6 +310,31 @@ def record_cache_miss(cache_type: str = 'redis'):
     CACHE_MISSES.labels(cache_type=cache_type).inc()
 
 
+def record_redis_pool(in_use: int, idle: int):
+    """
+    Record how many connections of the shared Redis pool are in use and idle
+    """
+    REDIS_POOL_CONNECTIONS.labels(state='in_use').set(in_use)
+    REDIS_POOL_CONNECTIONS.labels(state='idle').set(idle)
+
+
+def record_redis_pool_wait(duration: float):
+    """
+    Record how long a Redis call waited for a pool connection
+    """
+    REDIS_POOL_WAIT.observe(duration)
+
+
+def record_compression(encoding: str, source: str, saved_bytes: int, duration: float = None):
+    """
+    Record bytes saved by sending a compressed body, and the time spent
+    compressing it when it was not precompressed
+    """
+    COMPRESSION_BYTES_SAVED.labels(encoding=encoding, source=source).inc(max(saved_bytes, 0))
+    if duration is not None:
+        COMPRESSION_DURATION.labels(encoding=encoding, source=source).observe(duration)
+
+
 def record_appointment_created(status: str = 'scheduled'):
     """
     Record an appointment creation
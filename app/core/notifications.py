@@ -1,6 +1,6 @@
 import json
 import logging
-from typing import Optional
+from typing import List, Optional
 from datetime import datetime
 import aio_pika
 import asyncio
@@ -10,11 +10,16 @@ from app.db.session import SessionLocal
 from app.crud.crud_appointment import appointment
 from app.crud.crud_patient import patient
 from app.crud.crud_doctor import doctor
+from app.db.models import Appointment, Doctor, Patient
 
 logger = logging.getLogger(__name__)
 
 async def send_to_queue(message: dict):
     """Send a message to RabbitMQ queue"""
+    await send_batch_to_queue([message])
+
+async def send_batch_to_queue(messages: List[dict]):
+    """Send several messages to RabbitMQ queue over a single connection"""
     try:
         connection = await aio_pika.connect_robust(settings.RABBITMQ_URL)
 
@@ -23,15 +28,16 @@ async def send_to_queue(message: dict):
 
             queue = await channel.declare_queue("notifications", durable=True)
 
-            await channel.default_exchange.publish(
-                aio_pika.Message(
-                    body=json.dumps(message).encode(),
-                    delivery_mode=aio_pika.DeliveryMode.PERSISTENT
-                ),
-                routing_key=queue.name,
-            )
+            for message in messages:
+                await channel.default_exchange.publish(
+                    aio_pika.Message(
+                        body=json.dumps(message).encode(),
+                        delivery_mode=aio_pika.DeliveryMode.PERSISTENT
+                    ),
+                    routing_key=queue.name,
+                )
 
-            logger.info(f"Sent notification message: {message}")
+            logger.info(f"Sent {len(messages)} notification message(s)")
 
     except Exception as e:
         logger.error(f"Failed to send message to queue: {e}")
@@ -84,3 +90,44 @@ def send_appointment_notification(
         logger.error(f"Error sending notification: {e}")
     finally:
         db.close()
+
+def send_appointment_notifications(appointment_ids: List[int], notification_type: str):
+    """Send notifications about several appointments as one batch"""
+    db = SessionLocal()
+    try:
+        rows = db.query(
+            Appointment.id,
+            Appointment.start_time,
+            Patient.email,
+            Patient.first_name,
+            Patient.last_name,
+            Doctor.first_name,
+            Doctor.last_name
+        ).join(
+            Patient, Appointment.patient_id == Patient.id
+        ).join(
+            Doctor, Appointment.doctor_id == Doctor.id
+        ).filter(
+            Appointment.id.in_(appointment_ids)
+        ).all()
+
+        messages = [
+            {
+                "type": notification_type,
+                "appointment_id": appointment_id,
+                "patient_email": patient_email,
+                "patient_name": f"{patient_first_name} {patient_last_name}",
+                "doctor_name": f"{doctor_first_name} {doctor_last_name}",
+                "appointment_time": start_time.isoformat(),
+            }
+            for appointment_id, start_time, patient_email, patient_first_name,
+                patient_last_name, doctor_first_name, doctor_last_name in rows
+        ]
+
+        if messages:
+            asyncio.run(send_batch_to_queue(messages))
+
+    except Exception as e:
+        logger.error(f"Error sending notifications: {e}")
+    finally:
+        db.close()
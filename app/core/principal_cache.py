@@ -0,0 +1,91 @@
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Optional, Tuple
+
+from app.core.config import settings
+from app.schemas.user import Principal, TokenPayload
+
+
+def _token_hash(token: str) -> str:
+    return hashlib.sha256(token.encode()).hexdigest()
+
+
+class VerifiedTokenCache:
+    """
+    Bounded LRU of JWTs whose signature has already been verified, keyed by
+    token hash and kept until the token's `exp`.
+    """
+
+    def __init__(self, max_entries: int = settings.TOKEN_CACHE_MAX_ENTRIES):
+        self.max_entries = max_entries
+        self._tokens: "OrderedDict[str, Tuple[float, TokenPayload]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, token: str) -> Optional[TokenPayload]:
+        key = _token_hash(token)
+        with self._lock:
+            entry = self._tokens.get(key)
+            if entry is None:
+                return None
+            expires_at, payload = entry
+            if time.time() >= expires_at:
+                del self._tokens[key]
+                return None
+            self._tokens.move_to_end(key)
+            return payload
+
+    def add(self, token: str, expires_at: Optional[float], payload: TokenPayload) -> None:
+        # Tokens without an expiry are verified on every request
+        if expires_at is None:
+            return
+        with self._lock:
+            self._tokens[_token_hash(token)] = (expires_at, payload)
+            while len(self._tokens) > self.max_entries:
+                self._tokens.popitem(last=False)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._tokens.clear()
+
+
+class PrincipalCache:
+    """
+    Users resolved from tokens, keyed by user id and trusted for `ttl`
+    seconds. User writes invalidate the entry in this process; other
+    processes pick up the change within `ttl`.
+    """
+
+    def __init__(self, ttl: int = settings.PRINCIPAL_CACHE_TTL_SECONDS):
+        self.ttl = ttl
+        self._principals: Dict[int, Tuple[float, Principal]] = {}
+        self._lock = threading.Lock()
+
+    def get(self, user_id: int) -> Optional[Principal]:
+        with self._lock:
+            entry = self._principals.get(user_id)
+            if entry is None:
+                return None
+            loaded_at, principal = entry
+            if time.monotonic() - loaded_at > self.ttl:
+                del self._principals[user_id]
+                return None
+            return principal
+
+    def load(self, user_obj) -> Principal:
+        principal = Principal.model_validate(user_obj, from_attributes=True)
+        with self._lock:
+            self._principals[principal.id] = (time.monotonic(), principal)
+        return principal
+
+    def invalidate(self, user_id: Optional[int] = None) -> None:
+        with self._lock:
+            if user_id is None:
+                self._principals.clear()
+            else:
+                self._principals.pop(user_id, None)
+
+
+verified_tokens = VerifiedTokenCache()
+principals = PrincipalCache()
@@ -0,0 +1,97 @@
+import logging
+import re
+import time
+from collections import Counter
+from contextvars import ContextVar
+from functools import lru_cache
+from typing import List, Optional, Tuple
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from starlette.types import ASGIApp, Receive, Scope, Send
+
+from app.core.config import settings
+from app.core.metrics import record_db_query
+
+logger = logging.getLogger(__name__)
+
+OPERATIONS = {"select", "insert", "update", "delete"}
+
+# First table a statement reads from or writes to, without its schema
+TABLE_PATTERN = re.compile(r'\b(?:FROM|INTO|UPDATE)\s+(?:"?\w+"?\.)?"?(\w+)', re.IGNORECASE)
+
+# Statements run by the current request, collected by QueryBudgetMiddleware
+_request_queries: ContextVar[Optional[List[str]]] = ContextVar("request_queries", default=None)
+
+
+@lru_cache(maxsize=1024)
+def classify(statement: str) -> Tuple[str, str]:
+    """
+    The operation and table of a SQL statement, used as metric labels.
+    Statements are cached by SQLAlchemy's compiler, so the same few strings
+    come back again and again.
+    """
+    words = statement.split(None, 1)
+    operation = words[0].lower() if words else ""
+    if operation not in OPERATIONS:
+        operation = "other"
+    match = TABLE_PATTERN.search(statement)
+    return operation, match.group(1).lower() if match else "none"
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    context.query_started = time.perf_counter()
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    operation, table = classify(statement)
+    record_db_query(operation, table, time.perf_counter() - context.query_started)
+
+    queries = _request_queries.get()
+    if queries is not None:
+        queries.append(statement)
+
+
+def instrument_engine(engine: Engine) -> None:
+    """
+    Record the duration of every query `engine` runs in DB_QUERY_DURATION and
+    count it against the current request. For an AsyncEngine pass its
+    `sync_engine`.
+    """
+    event.listen(engine, "before_cursor_execute", _before_cursor_execute)
+    event.listen(engine, "after_cursor_execute", _after_cursor_execute)
+
+
+class QueryBudgetMiddleware:
+    """
+    Count the queries each request runs on instrumented engines and log a
+    warning listing them when there are more than `budget`, which is how
+    N+1 query patterns show up. A budget of 0 disables the check.
+    """
+
+    def __init__(self, app: ASGIApp, budget: int = settings.DB_QUERY_BUDGET):
+        self.app = app
+        self.budget = budget
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http" or not self.budget:
+            await self.app(scope, receive, send)
+            return
+
+        # Sync routes run in the threadpool with a copy of this context, so
+        # they append to the same list
+        queries: List[str] = []
+        token = _request_queries.set(queries)
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            _request_queries.reset(token)
+
+        if len(queries) > self.budget:
+            repeated = "\n".join(
+                f"  {count}x {statement}" for statement, count in Counter(queries).most_common()
+            )
+            logger.warning(
+                f"{scope['method']} {scope['path']} ran {len(queries)} queries "
+                f"(budget {self.budget}):\n{repeated}"
+            )
@@ -1,46 +1,349 @@
+import logging
+import math
+import threading
+import time
+from typing import Callable, Dict, List, NamedTuple, Optional, Tuple, Union
 
-from typing import Callable
 import redis
 from fastapi import Request, Response
+from jose import JWTError, jwt
 from starlette.middleware.base import BaseHTTPMiddleware
+from starlette.routing import Match
 from starlette.status import HTTP_429_TOO_MANY_REQUESTS
 
 from app.core.config import settings
+from app.core.principal_cache import verified_tokens
+from app.core.redis_client import RedisClient, redis_client
+from app.schemas.user import TokenPayload
+
+logger = logging.getLogger(__name__)
+
+RATE_LIMIT_HEADERS = ["X-RateLimit-Limit", "X-RateLimit-Remaining", "X-RateLimit-Reset", "Retry-After"]
+
+EXEMPT_PATHS = {"/health", "/metrics", "/docs", "/redoc", "/openapi.json"}
+
+# Takes one token from every bucket in KEYS, or from none of them if any is
+# empty. ARGV holds each bucket's capacity and refill rate (tokens per
+# second) in turn; buckets refill continuously from Redis' own clock.
+# Returns whether the request is allowed and the tokens left per bucket.
+TAKE_TOKEN_SCRIPT = """
+local clock = redis.call("TIME")
+local now = tonumber(clock[1]) + tonumber(clock[2]) / 1000000
+local allowed = 1
+local levels = {}
+for i, key in ipairs(KEYS) do
+    local capacity = tonumber(ARGV[2 * i - 1])
+    local rate = tonumber(ARGV[2 * i])
+    local bucket = redis.call("HMGET", key, "tokens", "ts")
+    local tokens = tonumber(bucket[1]) or capacity
+    local ts = tonumber(bucket[2]) or now
+    levels[i] = math.min(capacity, tokens + math.max(0, now - ts) * rate)
+    if levels[i] < 1 then
+        allowed = 0
+    end
+end
+for i, key in ipairs(KEYS) do
+    local capacity = tonumber(ARGV[2 * i - 1])
+    local rate = tonumber(ARGV[2 * i])
+    if allowed == 1 then
+        levels[i] = levels[i] - 1
+    end
+    redis.call("HSET", key, "tokens", levels[i], "ts", now)
+    redis.call("PEXPIRE", key, math.ceil((capacity - levels[i]) / rate * 1000) + 1)
+    levels[i] = tostring(levels[i])
+end
+return {allowed, levels}
+"""
+
+# Applies the tokens a process took from its local copies of the buckets in
+# KEYS since its last sync. ARGV holds each bucket's capacity, refill rate
+# and tokens taken in turn. Levels may go below zero, down to -capacity, so
+# overshoot between syncs is paid back. Returns every bucket's level.
+RECONCILE_SCRIPT = """
+local clock = redis.call("TIME")
+local now = tonumber(clock[1]) + tonumber(clock[2]) / 1000000
+local levels = {}
+for i, key in ipairs(KEYS) do
+    local capacity = tonumber(ARGV[3 * i - 2])
+    local rate = tonumber(ARGV[3 * i - 1])
+    local taken = tonumber(ARGV[3 * i])
+    local bucket = redis.call("HMGET", key, "tokens", "ts")
+    local tokens = tonumber(bucket[1]) or capacity
+    local ts = tonumber(bucket[2]) or now
+    tokens = math.min(capacity, tokens + math.max(0, now - ts) * rate)
+    tokens = math.max(tokens - taken, -capacity)
+    redis.call("HSET", key, "tokens", tokens, "ts", now)
+    redis.call("PEXPIRE", key, math.ceil((capacity - tokens) / rate * 1000) + 1)
+    levels[i] = tostring(tokens)
+end
+return levels
+"""
+
+
+class Bucket(NamedTuple):
+    key: str
+    capacity: int
+    refill_rate: float
+
+
+class RedisTokenBuckets:
+    """
+    Token buckets in Redis, updated by one atomic script call (EVALSHA) on
+    the shared asyncio client.
+    """
+
+    def __init__(self, client: RedisClient = redis_client):
+        self._take = client.register_script(TAKE_TOKEN_SCRIPT)
+
+    async def take(self, buckets: List[Bucket]) -> Tuple[bool, List[float]]:
+        """Take a token from every bucket if all have one; returns the tokens left."""
+        args = []
+        for bucket in buckets:
+            args += [bucket.capacity, bucket.refill_rate]
+        allowed, levels = await self._take(keys=[bucket.key for bucket in buckets], args=args)
+        return bool(allowed), [float(level) for level in levels]
+
+    def stop(self) -> None:
+        # Nothing runs in the background; the shared client is closed with the app
+        pass
+
+
+class _LocalBucket:
+    def __init__(self, bucket: Bucket, now: float, max_error: float):
+        self.bucket = bucket
+        self.level = float(bucket.capacity)
+        self.updated = now
+        # Tokens this process may take between two syncs
+        self.allowance = max(1, int(bucket.capacity * max_error))
+        self.taken_since_sync = 0
+        self.unsent = 0
+        self.sending = 0
+
+    def refill(self, now: float) -> None:
+        self.level = min(self.bucket.capacity, self.level + (now - self.updated) * self.bucket.refill_rate)
+        self.updated = now
+
+
+class LocalTokenBuckets:
+    """
+    Token buckets kept in process memory and reconciled with Redis in batches.
+
+    `take` never waits on Redis: it spends from this process's copy of each
+    bucket. Every `sync_interval` seconds a background thread sends the
+    tokens taken since the last sync to Redis in one script call and adopts
+    the shared levels it returns, so the copies converge on the buckets
+    other replicas spend from too. Between syncs a process takes at most
+    `max_error` of a bucket's capacity, which bounds how far all replicas
+    together can overshoot a limit per interval. Tokens taken while Redis is
+    unreachable are sent with the next successful sync. The sync thread has
+    its own synchronous client, off the event loop.
+    """
+
+    def __init__(
+        self,
+        redis_url: str = settings.REDIS_URL,
+        sync_interval: float = settings.RATE_LIMIT_SYNC_INTERVAL_SECONDS,
+        max_error: float = settings.RATE_LIMIT_LOCAL_MAX_ERROR
+    ):
+        self.redis = redis.from_url(redis_url)
+        self._reconcile = self.redis.register_script(RECONCILE_SCRIPT)
+        self.sync_interval = sync_interval
+        self.max_error = max_error
+        self._buckets: Dict[str, _LocalBucket] = {}
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+        self._stopped = threading.Event()
+
+    def _start(self) -> None:
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="rate-limit-sync", daemon=True)
+            self._thread.start()
+
+    def _run(self) -> None:
+        while not self._stopped.wait(self.sync_interval):
+            self.sync()
+
+    def stop(self) -> None:
+        """Stop the sync thread and send the tokens taken since its last sync."""
+        self._stopped.set()
+        if self._thread is not None:
+            self._thread.join()
+        self.sync()
+        self.redis.close()
+
+    async def take(self, buckets: List[Bucket]) -> Tuple[bool, List[float]]:
+        """Take a token from every bucket if all have one; returns the tokens left."""
+        self._start()
+        now = time.monotonic()
+        with self._lock:
+            states = []
+            for bucket in buckets:
+                state = self._buckets.get(bucket.key)
+                if state is None:
+                    state = self._buckets[bucket.key] = _LocalBucket(bucket, now, self.max_error)
+                state.refill(now)
+                states.append(state)
+
+            allowed = all(state.level >= 1 and state.taken_since_sync < state.allowance for state in states)
+            if allowed:
+                for state in states:
+                    state.level -= 1
+                    state.taken_since_sync += 1
+                    state.unsent += 1
+            return allowed, [state.level for state in states]
+
+    def sync(self) -> None:
+        """Send tokens taken since the last sync to Redis and adopt the shared levels."""
+        now = time.monotonic()
+        with self._lock:
+            for key, state in list(self._buckets.items()):
+                state.taken_since_sync = 0
+                # Buckets idle long enough to be full again are forgotten
+                idle = now - state.updated
+                if not state.unsent and idle * state.bucket.refill_rate >= state.bucket.capacity:
+                    del self._buckets[key]
+            states = list(self._buckets.values())
+            for state in states:
+                state.sending, state.unsent = state.unsent, 0
+
+        if not states:
+            return
+
+        args = []
+        for state in states:
+            args += [state.bucket.capacity, state.bucket.refill_rate, state.sending]
+        try:
+            levels = self._reconcile(keys=[state.bucket.key for state in states], args=args)
+        except redis.RedisError as e:
+            logger.error(f"Rate limit sync failed: {e}")
+            with self._lock:
+                for state in states:
+                    state.unsent += state.sending
+                    state.sending = 0
+            return
+
+        now = time.monotonic()
+        with self._lock:
+            for state, level in zip(states, levels):
+                # Tokens taken while the sync was in flight are not in Redis yet
+                state.level = float(level) - state.unsent
+                state.updated = now
+                state.sending = 0
+
+
+def _token_payload(request: Request) -> Optional[TokenPayload]:
+    scheme, _, token = request.headers.get("authorization", "").partition(" ")
+    if scheme.lower() != "bearer" or not token:
+        return None
+    token_data = verified_tokens.get(token)
+    if token_data is None:
+        try:
+            payload = jwt.decode(token, settings.SECRET_KEY, algorithms=[settings.ALGORITHM])
+            token_data = TokenPayload(**payload)
+        except (JWTError, ValueError):
+            return None
+        verified_tokens.add(token, payload.get("exp"), token_data)
+    return token_data if token_data.sub is not None else None
+
+
+def token_buckets(redis_url: str = settings.REDIS_URL) -> Union[RedisTokenBuckets, LocalTokenBuckets]:
+    """The token buckets RATE_LIMIT_MODE selects."""
+    if settings.RATE_LIMIT_MODE == "local":
+        return LocalTokenBuckets(redis_url)
+    return RedisTokenBuckets()
 
 
 class RateLimiter(BaseHTTPMiddleware):
+    """
+    Token-bucket rate limiting of every user, or of every client IP for
+    anonymous requests.
+
+    Each user has a bucket sized by their role's per-minute quota (or the
+    default quota); routes listed in `route_limits` as "METHOD /path" get a
+    separate, usually smaller, bucket per user as well. A request takes one
+    token from each of its buckets in a single Redis round trip and is
+    rejected with 429 if any is empty. Responses carry `X-RateLimit-*`
+    headers for the most constrained bucket. When Redis is unavailable
+    requests are let through.
+
+    With RATE_LIMIT_MODE "local" the buckets are kept in process memory and
+    reconciled with Redis in the background (`LocalTokenBuckets`), trading
+    a bounded overshoot for no Redis round trip per request.
+    """
+
     def __init__(
         self,
         app,
         redis_url: str = settings.REDIS_URL,
-        rate_limit_per_minute: int = 60
+        rate_limit_per_minute: int = settings.RATE_LIMIT_PER_MINUTE,
+        role_limits: Optional[Dict[str, int]] = None,
+        route_limits: Optional[Dict[str, int]] = None,
+        buckets: Optional[Union[RedisTokenBuckets, LocalTokenBuckets]] = None
     ):
         super().__init__(app)
-        self.redis = redis.from_url(redis_url)
+        self.buckets = token_buckets(redis_url) if buckets is None else buckets
         self.rate_limit = rate_limit_per_minute
-        self.window = 60
+        self.role_limits = settings.RATE_LIMIT_ROLE_PER_MINUTE if role_limits is None else role_limits
+        self.route_limits = settings.RATE_LIMIT_ROUTE_PER_MINUTE if route_limits is None else route_limits
 
-    async def dispatch(self, request: Request, call_next: Callable) -> Response:
-        if request.url.path in ["/health", "/docs", "/redoc", "/openapi.json"]:
-            return await call_next(request)
+    def _route(self, request: Request) -> Optional[str]:
+        # Route limits are keyed by path template, so /doctors/1 and
+        # /doctors/2 share a bucket
+        for route in request.app.routes:
+            match, _ = route.matches(request.scope)
+            if match == Match.FULL:
+                return f"{request.method} {route.path}"
+        return None
 
-        client_ip = request.client.host
+    def _buckets(self, request: Request) -> List[Bucket]:
+        token_data = _token_payload(request)
+        if token_data is not None:
+            identity = f"user:{token_data.sub}"
+            limit = self.role_limits.get(token_data.role, self.rate_limit)
+        else:
+            identity = f"ip:{request.client.host if request.client else 'unknown'}"
+            limit = self.rate_limit
 
-        key = f"rate_limit:{client_ip}:{request.url.path}"
+        # The hash tag keeps all of a client's buckets in one cluster slot
+        buckets = [Bucket(f"rate_limit:{{{identity}}}", limit, limit / 60)]
+        if self.route_limits:
+            route = self._route(request)
+            if route in self.route_limits:
+                route_limit = self.route_limits[route]
+                buckets.append(Bucket(f"rate_limit:{{{identity}}}:{route}", route_limit, route_limit / 60))
+        return buckets
 
-        current = self.redis.get(key)
-        current = int(current) if current else 0
+    def _headers(self, buckets: List[Bucket], levels: List[float], allowed: bool) -> Dict[str, str]:
+        # Report the bucket closest to running out
+        bucket, level = min(zip(buckets, levels), key=lambda item: item[1] / item[0].capacity)
+        headers = {
+            "X-RateLimit-Limit": str(bucket.capacity),
+            "X-RateLimit-Remaining": str(max(int(level), 0)),
+            "X-RateLimit-Reset": str(math.ceil((bucket.capacity - level) / bucket.refill_rate)),
+        }
+        if not allowed:
+            headers["Retry-After"] = str(max(math.ceil((1 - level) / bucket.refill_rate), 1))
+        return headers
 
-        if current >= self.rate_limit:
+    async def dispatch(self, request: Request, call_next: Callable) -> Response:
+        if request.url.path in EXEMPT_PATHS:
+            return await call_next(request)
+
+        buckets = self._buckets(request)
+        try:
+            allowed, levels = await self.buckets.take(buckets)
+        except redis.RedisError as e:
+            logger.error(f"Rate limit check failed: {e}")
+            return await call_next(request)
+
+        headers = self._headers(buckets, levels, allowed)
+        if not allowed:
             return Response(
                 content="Rate limit exceeded. Please try again later.",
                 status_code=HTTP_429_TOO_MANY_REQUESTS,
-                headers={"Retry-After": str(self.window)}
+                headers=headers
             )
 
-        pipe = self.redis.pipeline()
-        pipe.incr(key)
-        pipe.expire(key, self.window)
-        pipe.execute()
-
-        return await call_next(request)
+        response = await call_next(request)
+        response.headers.update(headers)
+        return response
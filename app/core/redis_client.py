@@ -0,0 +1,141 @@
+import asyncio
+import logging
+import time
+from typing import Any, Awaitable, Callable, Iterable, List, Optional, TypeVar
+
+import redis
+from redis import asyncio as aioredis
+from redis.asyncio.client import Pipeline
+
+from app.core.config import settings
+from app.core.metrics import record_redis_pool, record_redis_pool_wait
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+
+class InstrumentedConnectionPool(aioredis.BlockingConnectionPool):
+    """
+    Blocking pool that reports its usage and checkout wait times.
+
+    Connections are connected after the stock checkout returns rather than
+    inside it: redis-py 5.0 connects while holding the pool's condition
+    and, when connecting fails, deadlocks releasing the connection, which
+    leaks its slot.
+    """
+
+    def _record_usage(self) -> None:
+        # The counts come from the pool's internals; skip them rather than
+        # fail a Redis call if a redis-py release renames them
+        try:
+            in_use, idle = len(self._in_use_connections), len(self._available_connections)
+        except (AttributeError, TypeError):
+            return
+        record_redis_pool(in_use, idle)
+
+    async def ensure_connection(self, connection) -> None:
+        # Called by the stock checkout; see get_connection
+        pass
+
+    async def get_connection(self, command_name, *keys, **options):
+        started = time.perf_counter()
+        try:
+            connection = await super().get_connection(command_name, *keys, **options)
+        finally:
+            record_redis_pool_wait(time.perf_counter() - started)
+            self._record_usage()
+
+        try:
+            await super().ensure_connection(connection)
+        except BaseException:
+            await self.release(connection)
+            raise
+        return connection
+
+    async def release(self, connection) -> None:
+        await super().release(connection)
+        self._record_usage()
+
+
+class Script:
+    """Lua script run with EVALSHA on the shared client, loaded on first use."""
+
+    def __init__(self, redis_client: "RedisClient", source: str):
+        self.redis_client = redis_client
+        self.source = source
+        self._script = None
+
+    async def __call__(self, keys: Iterable[Any] = (), args: Iterable[Any] = ()) -> Any:
+        client = self.redis_client.redis
+        if self._script is None:
+            self._script = client.register_script(self.source)
+        return await self.redis_client.run(self._script(keys=list(keys), args=list(args), client=client))
+
+
+class RedisClient:
+    """
+    Shared asyncio Redis client for code running on the event loop.
+
+    Every process has one bounded connection pool, opened at startup and
+    closed at shutdown; requests wait up to `pool_timeout` seconds for a
+    free connection. Calls go through `run`, which enforces the per-call
+    time budget, so a slow Redis fails the call with a RedisError instead
+    of holding up the request. Pool usage and checkout waits are exported
+    as metrics.
+    """
+
+    def __init__(
+        self,
+        url: str = settings.REDIS_URL,
+        max_connections: int = settings.REDIS_POOL_SIZE,
+        pool_timeout: float = settings.REDIS_POOL_TIMEOUT_SECONDS,
+        call_timeout: float = settings.REDIS_CALL_TIMEOUT_SECONDS
+    ):
+        self.url = url
+        self.max_connections = max_connections
+        self.pool_timeout = pool_timeout
+        self.call_timeout = call_timeout
+        self._redis: Optional[aioredis.Redis] = None
+
+    @property
+    def redis(self) -> aioredis.Redis:
+        # Created on first use as well as at startup, for apps and tests
+        # that run without the startup event
+        if self._redis is None:
+            pool = InstrumentedConnectionPool.from_url(
+                self.url, max_connections=self.max_connections, timeout=self.pool_timeout
+            )
+            self._redis = aioredis.Redis(connection_pool=pool)
+        return self._redis
+
+    async def connect(self) -> None:
+        try:
+            await self.run(self.redis.ping())
+        except redis.RedisError as e:
+            # Redis-backed features fail open, so the app can still start
+            logger.error(f"Redis is not reachable at startup: {e}")
+
+    async def close(self) -> None:
+        if self._redis is not None:
+            await self._redis.aclose(close_connection_pool=True)
+            self._redis = None
+
+    async def run(self, awaitable: Awaitable[T]) -> T:
+        """Await a Redis call within the per-call time budget."""
+        try:
+            return await asyncio.wait_for(awaitable, self.call_timeout)
+        except asyncio.TimeoutError as e:
+            raise redis.TimeoutError(f"Redis call exceeded {self.call_timeout}s") from e
+
+    async def pipelined(self, queue: Callable[[Pipeline], None], transaction: bool = False) -> List[Any]:
+        """Send the commands `queue` adds to a pipeline in one round trip."""
+        pipe = self.redis.pipeline(transaction=transaction)
+        queue(pipe)
+        return await self.run(pipe.execute())
+
+    def register_script(self, source: str) -> Script:
+        return Script(self, source)
+
+
+redis_client = RedisClient()
@@ -0,0 +1,164 @@
+import logging
+import math
+import secrets
+import time
+from datetime import datetime, timedelta, timezone
+from typing import List, Optional, Tuple
+
+import redis
+
+from app.core.config import settings
+from app.core.interval_index import to_naive_utc
+
+logger = logging.getLogger(__name__)
+
+# The hold itself, "doctor_id|member", expiring with the hold
+HOLD_KEY = "slot_hold:{}"
+# Sorted set of a doctor's holds, "id|start|end" members scored by expiry
+DOCTOR_HOLDS_KEY = "slot_holds:doctor:{}"
+
+# KEYS: the doctor's hold index, the new hold
+# ARGV: hold id, start, end (epoch seconds), now and expiry (epoch ms),
+#       ttl (ms), doctor id
+# Drops expired holds from the index, then adds the hold unless it
+# overlaps one still there; returns 1 if it was added.
+ACQUIRE_SCRIPT = """
+redis.call('ZREMRANGEBYSCORE', KEYS[1], '-inf', ARGV[4])
+local start, finish = tonumber(ARGV[2]), tonumber(ARGV[3])
+for _, held in ipairs(redis.call('ZRANGE', KEYS[1], 0, -1)) do
+    local held_start, held_end = string.match(held, '^[^|]*|([^|]*)|([^|]*)$')
+    if tonumber(held_start) < finish and tonumber(held_end) > start then
+        return 0
+    end
+end
+local member = ARGV[1] .. '|' .. ARGV[2] .. '|' .. ARGV[3]
+redis.call('ZADD', KEYS[1], ARGV[5], member)
+if redis.call('PTTL', KEYS[1]) < tonumber(ARGV[6]) then
+    redis.call('PEXPIRE', KEYS[1], ARGV[6])
+end
+redis.call('SET', KEYS[2], ARGV[7] .. '|' .. member, 'PX', ARGV[6])
+return 1
+"""
+
+
+def to_epoch(value: datetime) -> str:
+    return f"{to_naive_utc(value).replace(tzinfo=timezone.utc).timestamp():.6f}"
+
+
+def from_epoch(value: str) -> datetime:
+    return datetime.fromtimestamp(float(value), timezone.utc).replace(tzinfo=None)
+
+
+class SlotHold:
+    def __init__(self, id: str, doctor_id: int, start_time: datetime, end_time: datetime, expires_at: datetime):
+        self.id = id
+        self.doctor_id = doctor_id
+        self.start_time = start_time
+        self.end_time = end_time
+        self.expires_at = expires_at
+
+    def overlaps(self, start_time: datetime, end_time: datetime) -> bool:
+        return to_naive_utc(self.start_time) < to_naive_utc(end_time) and \
+            to_naive_utc(self.end_time) > to_naive_utc(start_time)
+
+
+def seconds_until_expiry(holds: List[SlotHold]) -> Optional[int]:
+    """Whole seconds until the first of `holds` expires, or None without holds."""
+    if not holds:
+        return None
+    remaining = min(hold.expires_at for hold in holds) - datetime.now(timezone.utc)
+    return max(math.ceil(remaining.total_seconds()), 1)
+
+
+def _parse_member(doctor_id: int, member: bytes, expiry_ms: float) -> SlotHold:
+    id, start, end = member.decode().split("|")
+    return SlotHold(
+        id, doctor_id, from_epoch(start), from_epoch(end),
+        datetime.fromtimestamp(expiry_ms / 1000, timezone.utc)
+    )
+
+
+class SlotHoldStore:
+    """
+    Short-lived slot reservations in Redis, shared by every replica.
+
+    A hold keeps other clients from booking or holding an overlapping time
+    with the same doctor until it expires, is released, or is used by the
+    booking that carries its id. Holds are taken atomically by a script
+    over the doctor's hold index. Checks made while booking fail open when
+    Redis is unreachable, since the database still rejects double
+    bookings; taking and releasing holds raise the RedisError. Called from
+    sync routes in the threadpool, so it uses a synchronous client.
+    """
+
+    def __init__(self, redis_url: str = settings.REDIS_URL):
+        self.redis = redis.from_url(redis_url)
+        self._acquire = self.redis.register_script(ACQUIRE_SCRIPT)
+
+    def acquire(
+        self, doctor_id: int, start_time: datetime, end_time: datetime,
+        ttl: int = settings.SLOT_HOLD_SECONDS
+    ) -> Optional[SlotHold]:
+        """Hold the slot, or return None if it overlaps another active hold."""
+        hold_id = secrets.token_urlsafe(16)
+        now_ms = int(time.time() * 1000)
+        expiry_ms = now_ms + ttl * 1000
+        acquired = self._acquire(
+            keys=[DOCTOR_HOLDS_KEY.format(doctor_id), HOLD_KEY.format(hold_id)],
+            args=[hold_id, to_epoch(start_time), to_epoch(end_time), now_ms, expiry_ms, ttl * 1000, doctor_id]
+        )
+        if not acquired:
+            return None
+        return SlotHold(hold_id, doctor_id, start_time, end_time, datetime.now(timezone.utc) + timedelta(seconds=ttl))
+
+    def get(self, hold_id: str) -> Optional[SlotHold]:
+        pipe = self.redis.pipeline()
+        pipe.get(HOLD_KEY.format(hold_id))
+        pipe.pttl(HOLD_KEY.format(hold_id))
+        value, ttl_ms = pipe.execute()
+        if value is None:
+            return None
+        doctor_id, member = value.split(b"|", 1)
+        return _parse_member(int(doctor_id), member, time.time() * 1000 + ttl_ms)
+
+    def release(self, hold_id: str) -> bool:
+        value = self.redis.get(HOLD_KEY.format(hold_id))
+        if value is None:
+            return False
+        doctor_id, member = value.split(b"|", 1)
+        pipe = self.redis.pipeline()
+        pipe.delete(HOLD_KEY.format(hold_id))
+        pipe.zrem(DOCTOR_HOLDS_KEY.format(int(doctor_id)), member)
+        deleted, _ = pipe.execute()
+        return bool(deleted)
+
+    def active(self, doctor_id: int) -> List[SlotHold]:
+        """The doctor's holds that have not expired."""
+        members = self.redis.zrangebyscore(
+            DOCTOR_HOLDS_KEY.format(doctor_id), f"({int(time.time() * 1000)}", "+inf", withscores=True
+        )
+        return [_parse_member(doctor_id, member, expiry_ms) for member, expiry_ms in members]
+
+    def held(self, doctor_id: int) -> List[SlotHold]:
+        """The doctor's active holds, or none when Redis is unreachable."""
+        try:
+            return self.active(doctor_id)
+        except redis.RedisError as e:
+            logger.error(f"Slot hold lookup failed: {e}")
+            return []
+
+    def is_blocked(
+        self, doctor_id: int, start_time: datetime, end_time: datetime,
+        hold_id: Optional[str] = None
+    ) -> bool:
+        """Whether the time overlaps an active hold other than `hold_id`."""
+        return any(
+            hold.id != hold_id and hold.overlaps(start_time, end_time)
+            for hold in self.held(doctor_id)
+        )
+
+    def held_intervals(self, doctor_id: int) -> List[Tuple[datetime, datetime]]:
+        return [(hold.start_time, hold.end_time) for hold in self.held(doctor_id)]
+
+
+slot_holds = SlotHoldStore()
@@ -0,0 +1,133 @@
+from bisect import bisect_right
+from collections import defaultdict
+from datetime import date, datetime, time, timedelta
+from typing import Any, Dict, Iterable, Iterator, List, Tuple
+
+from app.core.interval_index import to_naive_utc
+
+DEFAULT_SLOT_MINUTES = 30
+
+
+def merge_intervals(intervals: Iterable[Tuple[datetime, datetime]]) -> List[Tuple[datetime, datetime]]:
+    """
+    Sort intervals by start time and coalesce the ones that overlap or touch,
+    so the result has strictly increasing start and end times.
+    """
+    merged: List[Tuple[datetime, datetime]] = []
+    for start_time, end_time in sorted(
+        (to_naive_utc(start_time), to_naive_utc(end_time)) for start_time, end_time in intervals
+    ):
+        if merged and start_time <= merged[-1][1]:
+            if end_time > merged[-1][1]:
+                merged[-1] = (merged[-1][0], end_time)
+        else:
+            merged.append((start_time, end_time))
+    return merged
+
+
+def generate_slots(
+    day: date,
+    availabilities: Iterable[Tuple[time, time]],
+    busy: Iterable[Tuple[datetime, datetime]],
+    slot_minutes: int = DEFAULT_SLOT_MINUTES
+) -> List[Dict[str, Any]]:
+    """
+    Cut each availability window of `day` into consecutive slots of
+    `slot_minutes` and keep the ones that do not overlap a busy interval.
+
+    Busy intervals are merged once and then swept with a single pointer per
+    window, so the cost is linear in slots plus appointments rather than
+    their product.
+    """
+    step = timedelta(minutes=slot_minutes)
+    merged = merge_intervals(busy)
+    busy_ends = [end_time for _, end_time in merged]
+
+    slots = []
+    for window_start, window_end in availabilities:
+        current_time = datetime.combine(day, window_start)
+        end_time = datetime.combine(day, window_end)
+
+        # First busy interval that ends after the window starts
+        position = bisect_right(busy_ends, current_time)
+
+        slot_end_time = current_time + step
+        while slot_end_time <= end_time:
+            while position < len(merged) and merged[position][1] <= current_time:
+                position += 1
+
+            if position == len(merged) or merged[position][0] >= slot_end_time:
+                slots.append({
+                    "start_time": current_time.isoformat(),
+                    "end_time": slot_end_time.isoformat(),
+                    "is_available": True
+                })
+
+            current_time = slot_end_time
+            slot_end_time = current_time + step
+
+    return slots
+
+
+def _seconds_of_day(value: time) -> int:
+    return value.hour * 3600 + value.minute * 60 + value.second
+
+
+def _span_mask(low: int, high: int, size: int) -> int:
+    low, high = max(low, 0), min(high, size)
+    if high <= low:
+        return 0
+    return ((1 << (high - low)) - 1) << low
+
+
+def free_slot_bitmap(
+    first_day: date,
+    days: int,
+    availabilities: Iterable[Tuple[int, time, time]],
+    busy: Iterable[Tuple[datetime, datetime]],
+    slot_minutes: int = DEFAULT_SLOT_MINUTES
+) -> int:
+    """
+    Build a bitmap of free slots over `days` days starting at `first_day`.
+
+    Bit `i` stands for the slot starting `i * slot_minutes` after midnight of
+    `first_day`. A slot is free when it lies entirely inside one of the
+    `(day_of_week, start_time, end_time)` availability windows and overlaps
+    none of the busy intervals.
+    """
+    slot_seconds = slot_minutes * 60
+    size = days * 86400 // slot_seconds
+    origin = datetime.combine(first_day, time.min)
+
+    windows_by_weekday = defaultdict(list)
+    for day_of_week, start_time, end_time in availabilities:
+        windows_by_weekday[day_of_week].append((_seconds_of_day(start_time), _seconds_of_day(end_time)))
+
+    available = 0
+    for day_index in range(days):
+        day_offset = day_index * 86400
+        weekday = (first_day + timedelta(days=day_index)).weekday()
+        for start_seconds, end_seconds in windows_by_weekday.get(weekday, ()):
+            # Slots that start on or after the window opens and end before it closes
+            low = -(-(day_offset + start_seconds) // slot_seconds)
+            high = (day_offset + end_seconds) // slot_seconds
+            available |= _span_mask(low, high, size)
+
+    booked = 0
+    for start_time, end_time in busy:
+        start_seconds = (to_naive_utc(start_time) - origin).total_seconds()
+        end_seconds = (to_naive_utc(end_time) - origin).total_seconds()
+        # Every slot the interval touches
+        low = int(start_seconds // slot_seconds)
+        high = int(-(-end_seconds // slot_seconds))
+        booked |= _span_mask(low, high, size)
+
+    return available & ~booked
+
+
+def iter_set_bits(mask: int) -> Iterator[int]:
+    """Yield the positions of the set bits of `mask` in increasing order."""
+    while mask:
+        lowest = mask & -mask
+        yield lowest.bit_length() - 1
+        mask ^= lowest
@@ -0,0 +1,180 @@
+import functools
+import json
+import logging
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Iterable, Tuple
+
+import redis
+from pydantic import TypeAdapter
+
+from app.core.config import settings
+from app.core.metrics import record_cache_hit, record_cache_miss
+
+logger = logging.getLogger(__name__)
+
+_MISSING = object()
+
+
+class TwoTierCache:
+    """
+    Read-through cache with a bounded in-process LRU in front of Redis.
+
+    Values are pydantic-validated (`schema` of the `cached` decorator) so they
+    can be stored in Redis as JSON and handed out detached from any database
+    session. Writers call `delete` with the keys they change; this clears
+    Redis and the local tier of the current process, while other processes
+    drop their local copy within `local_ttl` seconds.
+    """
+
+    def __init__(
+        self,
+        namespace: str,
+        *,
+        max_entries: int = settings.DOCTOR_CACHE_LOCAL_MAX_ENTRIES,
+        local_ttl: int = settings.DOCTOR_CACHE_LOCAL_TTL_SECONDS,
+        redis_ttl: int = settings.DOCTOR_CACHE_REDIS_TTL_SECONDS,
+        use_redis: bool = settings.DOCTOR_CACHE_USE_REDIS,
+        redis_url: str = settings.REDIS_URL
+    ):
+        self.namespace = namespace
+        self.max_entries = max_entries
+        self.local_ttl = local_ttl
+        self.redis_ttl = redis_ttl
+        self.redis = redis.from_url(redis_url) if use_redis else None
+        self._local: "OrderedDict[str, Tuple[float, Any]]" = OrderedDict()
+        self._lock = threading.RLock()
+
+    def _redis_key(self, key: str) -> str:
+        return f"{self.namespace}:{key}"
+
+    def _get_local(self, key: str) -> Any:
+        with self._lock:
+            entry = self._local.get(key)
+            if entry is None:
+                return _MISSING
+            expires_at, value = entry
+            if time.monotonic() >= expires_at:
+                del self._local[key]
+                return _MISSING
+            self._local.move_to_end(key)
+            return value
+
+    def _set_local(self, key: str, value: Any) -> None:
+        with self._lock:
+            self._local[key] = (time.monotonic() + self.local_ttl, value)
+            self._local.move_to_end(key)
+            while len(self._local) > self.max_entries:
+                self._local.popitem(last=False)
+
+    def get(self, key: str, adapter: TypeAdapter) -> Any:
+        """The cached value for `key`, or `_MISSING`."""
+        value = self._get_local(key)
+        if value is not _MISSING:
+            record_cache_hit("local")
+            return value
+        record_cache_miss("local")
+
+        if self.redis is None:
+            return _MISSING
+
+        try:
+            cached = self.redis.get(self._redis_key(key))
+        except redis.RedisError as e:
+            logger.error(f"Cache lookup of {key} failed: {e}")
+            return _MISSING
+
+        if cached is None:
+            record_cache_miss("redis")
+            return _MISSING
+
+        record_cache_hit("redis")
+        value = adapter.validate_python(json.loads(cached))
+        self._set_local(key, value)
+        return value
+
+    def set(self, key: str, value: Any, adapter: TypeAdapter) -> None:
+        self._set_local(key, value)
+        if self.redis is None:
+            return
+        try:
+            self.redis.setex(
+                self._redis_key(key), self.redis_ttl,
+                json.dumps(adapter.dump_python(value, mode="json"))
+            )
+        except redis.RedisError as e:
+            logger.error(f"Cache store of {key} failed: {e}")
+
+    def delete(self, *keys: str) -> None:
+        with self._lock:
+            for key in keys:
+                self._local.pop(key, None)
+        if self.redis is None or not keys:
+            return
+        try:
+            self.redis.delete(*(self._redis_key(key) for key in keys))
+        except redis.RedisError as e:
+            logger.error(f"Cache invalidation of {keys} failed: {e}")
+
+    def clear_local(self) -> None:
+        with self._lock:
+            self._local.clear()
+
+    def cached(self, key: Callable[..., str], schema: Any) -> Callable:
+        """
+        Decorate a read method so its result is served from the cache.
+
+        `key` is called with the method's arguments and returns the cache key.
+        The result is converted to `schema` (from ORM attributes) before it is
+        cached and returned; None results are not cached.
+        """
+        adapter = TypeAdapter(schema)
+
+        def decorator(method: Callable) -> Callable:
+            @functools.wraps(method)
+            def wrapper(*args, **kwargs):
+                cache_key = key(*args, **kwargs)
+                value = self.get(cache_key, adapter)
+                if value is not _MISSING:
+                    return value
+
+                result = method(*args, **kwargs)
+                if result is None:
+                    return None
+
+                value = adapter.validate_python(result, from_attributes=True)
+                self.set(cache_key, value, adapter)
+                return value
+
+            return wrapper
+
+        return decorator
+
+    def warm(self, items: Iterable[Tuple[str, Any]], schema: Any) -> int:
+        """
+        Store `(key, value)` pairs, converting values to `schema`, in Redis in
+        one pipeline and return how many were stored.
+
+        The local tier is left alone: a warm-up larger than `max_entries`
+        would evict itself and the rest expires within `local_ttl`, so
+        processes fill it from Redis as they read. Without Redis nothing is
+        stored.
+        """
+        if self.redis is None:
+            return 0
+        adapter = TypeAdapter(schema)
+        pipeline = self.redis.pipeline(transaction=False)
+        count = 0
+        for key, value in items:
+            value = adapter.validate_python(value, from_attributes=True)
+            pipeline.setex(self._redis_key(key), self.redis_ttl, json.dumps(adapter.dump_python(value, mode="json")))
+            count += 1
+        try:
+            pipeline.execute()
+        except redis.RedisError as e:
+            logger.error(f"Cache warm-up failed: {e}")
+            return 0
+        return count
+
+doctor_cache = TwoTierCache("doctors")
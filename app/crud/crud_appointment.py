@@ -1,52 +1,179 @@
-from typing import List, Optional, Dict, Any
-from datetime import datetime
-from sqlalchemy.orm import Session
-from sqlalchemy import and_, or_
+from typing import Iterable, Iterator, List, Optional, Dict, Any, Set, Tuple, Union
+from collections import defaultdict
+from datetime import datetime, time, timedelta, timezone
+from sqlalchemy import func, insert, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session, selectinload
 
-from app.crud.crud_base import CRUDBase
-from app.db.models import Appointment, Patient, Doctor
-from app.schemas.appointment import AppointmentCreate, AppointmentUpdate, AppointmentStatus
+from app.core.booking_lock import doctor_locks
+from app.core.day_bitmap import schedule_cache
+from app.core.interval_index import DoctorIntervals, appointment_index, to_naive_utc
+from app.crud.crud_base import AsyncCRUDBase, CRUDBase, KeysetPagination
+from app.crud.crud_calendar import calendar_version
+from app.db.models import Appointment, AppointmentSeries, Availability, Patient, Doctor
+from app.db.replicas import read_from_primary
+from app.schemas.appointment import (
+    AppointmentCreate, AppointmentUpdate, AppointmentStatus,
+    AppointmentSeriesCreate, AppointmentSeriesUpdate, RecurrenceFrequency
+)
+
+HELD_ERROR = "The requested time is held by another booking in progress"
+PATIENT_ERROR = "Patient not found"
+
+
+def _is_active(appointment_obj: Appointment) -> bool:
+    status = getattr(appointment_obj.status, "value", appointment_obj.status)
+    return status != AppointmentStatus.CANCELLED.value
+
+
+def series_occurrences(obj_in: AppointmentSeriesCreate) -> List[AppointmentCreate]:
+    """Expand a series into its occurrences, keeping the wall-clock time."""
+    days = 7 if obj_in.frequency == RecurrenceFrequency.WEEKLY else 1
+    step = timedelta(days=days * obj_in.interval)
+    fields = obj_in.model_dump(include=set(AppointmentCreate.model_fields))
+    return [
+        AppointmentCreate(**{
+            **fields,
+            "start_time": obj_in.start_time + occurrence * step,
+            "end_time": obj_in.end_time + occurrence * step
+        })
+        for occurrence in range(obj_in.count)
+    ]
+
+
+# Columns selected alongside an appointment for AppointmentDetail
+DETAIL_COLUMNS = [
+    Patient.first_name.label("patient_first_name"),
+    Patient.last_name.label("patient_last_name"),
+    Doctor.first_name.label("doctor_first_name"),
+    Doctor.last_name.label("doctor_last_name"),
+    Doctor.specialization.label("doctor_specialization"),
+]
+
+
+def _with_details(result: Any) -> Dict[str, Any]:
+    appointment, patient_first_name, patient_last_name, doctor_first_name, doctor_last_name, doctor_specialization = result
+    return {
+        **appointment.__dict__,
+        "patient_name": f"{patient_first_name} {patient_last_name}",
+        "doctor_name": f"{doctor_first_name} {doctor_last_name}",
+        "doctor_specialization": doctor_specialization
+    }
+
+
+def _in_date_range(statement, start_date: Optional[datetime], end_date: Optional[datetime]):
+    # Works on both Query and select()
+    if start_date:
+        statement = statement.filter(Appointment.start_time >= start_date)
+    if end_date:
+        statement = statement.filter(Appointment.end_time <= end_date)
+    return statement
+
+
+def _last_change(model):
+    return select(func.max(func.coalesce(model.updated_at, model.created_at))).scalar_subquery()
+
+
+# Fingerprint of a details listing: the appointments' count, highest id and
+# latest change, plus the latest change to the doctors and patients named
+DETAILS_VERSION_COLUMNS = [
+    func.count(Appointment.id),
+    func.max(Appointment.id),
+    func.max(func.coalesce(Appointment.updated_at, Appointment.created_at)),
+    _last_change(Doctor),
+    _last_change(Patient),
+]
+
+
+class AppointmentOrdering(KeysetPagination):
+    def sort_columns(self) -> List[Any]:
+        return [Appointment.start_time, Appointment.id]
+
+    def parse_cursor_values(self, values: List[Any]) -> List[Any]:
+        return [datetime.fromisoformat(values[0]), int(values[1])]
+
+
+class CRUDAppointment(AppointmentOrdering, CRUDBase[Appointment, AppointmentCreate, AppointmentUpdate]):
+
+    def _index(self, appointment_obj: Appointment) -> None:
+        if _is_active(appointment_obj):
+            appointment_index.add(
+                appointment_obj.doctor_id, appointment_obj.id,
+                appointment_obj.start_time, appointment_obj.end_time
+            )
+            schedule_cache.add_booking(
+                appointment_obj.doctor_id, appointment_obj.id,
+                appointment_obj.start_time, appointment_obj.end_time
+            )
+        else:
+            appointment_index.discard(appointment_obj.doctor_id, appointment_obj.id)
+            schedule_cache.discard_booking(appointment_obj.id)
+
+    def _bump_calendars(self, db: Session, appointments: Iterable[Any]) -> None:
+        # Feed versions change in the same transaction as the appointments
+        appointments = list(appointments)
+        calendar_version.bump(
+            db,
+            doctor_ids=[appointment_obj.doctor_id for appointment_obj in appointments],
+            patient_ids=[appointment_obj.patient_id for appointment_obj in appointments]
+        )
+
+    def create(self, db: Session, *, obj_in: AppointmentCreate) -> Appointment:
+        self._bump_calendars(db, [obj_in])
+        appointment_obj = super().create(db, obj_in=obj_in)
+        self._index(appointment_obj)
+        return appointment_obj
+
+    def update(
+        self, db: Session, *, db_obj: Appointment,
+        obj_in: Union[AppointmentUpdate, Dict[str, Any]]
+    ) -> Appointment:
+        previous_doctor_id = db_obj.doctor_id
+        update_data = obj_in if isinstance(obj_in, dict) else obj_in.model_dump(exclude_unset=True)
+        calendar_version.bump(
+            db,
+            doctor_ids={db_obj.doctor_id, update_data.get("doctor_id", db_obj.doctor_id)},
+            patient_ids={db_obj.patient_id, update_data.get("patient_id", db_obj.patient_id)}
+        )
+        appointment_obj = super().update(db, db_obj=db_obj, obj_in=obj_in)
+        if previous_doctor_id != appointment_obj.doctor_id:
+            appointment_index.discard(previous_doctor_id, appointment_obj.id)
+        self._index(appointment_obj)
+        return appointment_obj
+
+    def remove(self, db: Session, *, id: int) -> Appointment:
+        appointment_obj = self.get(db, id=id)
+        if appointment_obj:
+            self._bump_calendars(db, [appointment_obj])
+        appointment_obj = super().remove(db, id=id)
+        appointment_index.discard(appointment_obj.doctor_id, id)
+        schedule_cache.discard_booking(id)
+        return appointment_obj
 
-class CRUDAppointment(CRUDBase[Appointment, AppointmentCreate, AppointmentUpdate]):
     def get_by_patient(
         self, db: Session, *, patient_id: int,
         start_date: Optional[datetime] = None,
         end_date: Optional[datetime] = None,
-        skip: int = 0, limit: int = 100
+        skip: int = 0, limit: int = 100,
+        cursor: Optional[str] = None
     ) -> List[Appointment]:
         query = db.query(Appointment).filter(Appointment.patient_id == patient_id)
-
-        if start_date:
-            query = query.filter(Appointment.start_time >= start_date)
-        if end_date:
-            query = query.filter(Appointment.end_time <= end_date)
-
-        return query.offset(skip).limit(limit).all()
+        query = _in_date_range(query, start_date, end_date)
+        return self.paginate(query, skip=skip, limit=limit, cursor=cursor)
 
     def get_by_doctor(
         self, db: Session, *, doctor_id: int,
         start_date: Optional[datetime] = None,
         end_date: Optional[datetime] = None,
-        skip: int = 0, limit: int = 100
+        skip: int = 0, limit: int = 100,
+        cursor: Optional[str] = None
     ) -> List[Appointment]:
         query = db.query(Appointment).filter(Appointment.doctor_id == doctor_id)
-
-        if start_date:
-            query = query.filter(Appointment.start_time >= start_date)
-        if end_date:
-            query = query.filter(Appointment.end_time <= end_date)
-
-        return query.offset(skip).limit(limit).all()
+        query = _in_date_range(query, start_date, end_date)
+        return self.paginate(query, skip=skip, limit=limit, cursor=cursor)
 
     def get_with_details(self, db: Session, *, id: int) -> Optional[Dict[str, Any]]:
-        result = db.query(
-            Appointment,
-            Patient.first_name.label("patient_first_name"),
-            Patient.last_name.label("patient_last_name"),
-            Doctor.first_name.label("doctor_first_name"),
-            Doctor.last_name.label("doctor_last_name"),
-            Doctor.specialization.label("doctor_specialization")
-        ).join(
+        result = db.query(Appointment, *DETAIL_COLUMNS).join(
             Patient, Appointment.patient_id == Patient.id
         ).join(
             Doctor, Appointment.doctor_id == Doctor.id
@@ -57,53 +184,93 @@ class CRUDAppointment(CRUDBase[Appointment, AppointmentCreate, AppointmentUpdate
         if not result:
             return None
 
-        appointment, patient_first_name, patient_last_name, doctor_first_name, doctor_last_name, doctor_specialization = result
-
-        return {
-            **appointment.__dict__,
-            "patient_name": f"{patient_first_name} {patient_last_name}",
-            "doctor_name": f"{doctor_first_name} {doctor_last_name}",
-            "doctor_specialization": doctor_specialization
-        }
+        return _with_details(result)
 
     def get_multi_with_details(
         self, db: Session, *,
         start_date: Optional[datetime] = None,
         end_date: Optional[datetime] = None,
-        skip: int = 0, limit: int = 100
+        skip: int = 0, limit: int = 100,
+        cursor: Optional[str] = None
     ) -> List[Dict[str, Any]]:
-        query = db.query(
-            Appointment,
-            Patient.first_name.label("patient_first_name"),
-            Patient.last_name.label("patient_last_name"),
-            Doctor.first_name.label("doctor_first_name"),
-            Doctor.last_name.label("doctor_last_name"),
-            Doctor.specialization.label("doctor_specialization")
+        query = db.query(Appointment, *DETAIL_COLUMNS).join(
+            Patient, Appointment.patient_id == Patient.id
         ).join(
+            Doctor, Appointment.doctor_id == Doctor.id
+        )
+        query = _in_date_range(query, start_date, end_date)
+
+        results = self.paginate(query, skip=skip, limit=limit, cursor=cursor)
+        return [_with_details(result) for result in results]
+
+    def details_version(
+        self, db: Session, *,
+        start_date: Optional[datetime] = None,
+        end_date: Optional[datetime] = None
+    ) -> Tuple[Any, ...]:
+        """
+        Fingerprint of `get_multi_with_details` results in one aggregate query.
+        """
+        query = _in_date_range(db.query(*DETAILS_VERSION_COLUMNS), start_date, end_date)
+        return tuple(query.one())
+
+    def stream_with_details(
+        self, db: Session, *,
+        patient_id: Optional[int] = None,
+        doctor_id: Optional[int] = None,
+        start_date: Optional[datetime] = None,
+        end_date: Optional[datetime] = None,
+        batch_size: int = 1000
+    ) -> Iterator[Dict[str, Any]]:
+        """
+        Yield appointments with patient and doctor names as flat dicts,
+        ordered by start time and fetched `batch_size` rows at a time through
+        a server-side cursor.
+        """
+        query = db.query(*Appointment.__table__.columns, *DETAIL_COLUMNS).join(
             Patient, Appointment.patient_id == Patient.id
         ).join(
             Doctor, Appointment.doctor_id == Doctor.id
         )
 
+        if patient_id is not None:
+            query = query.filter(Appointment.patient_id == patient_id)
+        if doctor_id is not None:
+            query = query.filter(Appointment.doctor_id == doctor_id)
         if start_date:
             query = query.filter(Appointment.start_time >= start_date)
         if end_date:
             query = query.filter(Appointment.end_time <= end_date)
 
-        results = query.offset(skip).limit(limit).all()
+        query = query.order_by(Appointment.start_time, Appointment.id)
 
-        appointments = []
-        for result in results:
-            appointment, patient_first_name, patient_last_name, doctor_first_name, doctor_last_name, doctor_specialization = result
+        for row in query.yield_per(batch_size):
+            result = row._asdict()
+            result["patient_name"] = f"{result.pop('patient_first_name')} {result.pop('patient_last_name')}"
+            result["doctor_name"] = f"{result.pop('doctor_first_name')} {result.pop('doctor_last_name')}"
+            yield result
+
+    def stream_by_owner(
+        self, db: Session, *,
+        patient_id: Optional[int] = None,
+        doctor_id: Optional[int] = None,
+        batch_size: int = 1000
+    ) -> Iterator[Dict[str, Any]]:
+        """
+        Yield the appointment rows of a patient or doctor as dicts, ordered by
+        start time, without joining the patient and doctor tables.
+        """
+        query = db.query(*Appointment.__table__.columns)
 
-            appointments.append({
-                **appointment.__dict__,
-                "patient_name": f"{patient_first_name} {patient_last_name}",
-                "doctor_name": f"{doctor_first_name} {doctor_last_name}",
-                "doctor_specialization": doctor_specialization
-            })
+        if patient_id is not None:
+            query = query.filter(Appointment.patient_id == patient_id)
+        if doctor_id is not None:
+            query = query.filter(Appointment.doctor_id == doctor_id)
 
-        return appointments
+        query = query.order_by(Appointment.start_time, Appointment.id)
+
+        for row in query.yield_per(batch_size):
+            yield row._asdict()
 
     def check_conflicts(
         self, db: Session, *,
@@ -115,30 +282,308 @@ class CRUDAppointment(CRUDBase[Appointment, AppointmentCreate, AppointmentUpdate
         """
         Check if there are any conflicting appointments for the doctor.
         If appointment_id is provided, exclude that appointment from the check.
+
+        Answered from the in-process interval index; the doctor's appointments
+        are loaded from the database on a cold miss.
         """
-        query = db.query(Appointment).filter(
+        has_conflict = appointment_index.overlaps(
+            doctor_id, start_time, end_time, exclude_id=appointment_id
+        )
+        if has_conflict is not None:
+            return has_conflict
+
+        # Cold miss: load the doctor's booked intervals once, then answer from the index
+        generation = appointment_index.generation(doctor_id)
+        read_from_primary(db)
+        rows = db.query(
+            Appointment.id, Appointment.start_time, Appointment.end_time
+        ).filter(
             Appointment.doctor_id == doctor_id,
-            Appointment.status != "cancelled",
-            or_(
-                and_(
-                    Appointment.start_time <= start_time,
-                    Appointment.end_time > start_time
-                ),
-                and_(
-                    Appointment.start_time < end_time,
-                    Appointment.end_time >= end_time
-                ),
-                and_(
-                    Appointment.start_time >= start_time,
-                    Appointment.end_time <= end_time
-                )
+            Appointment.status != "cancelled"
+        ).order_by(Appointment.start_time).all()
+        if not appointment_index.load(doctor_id, rows, generation=generation):
+            # A write raced the snapshot; answer from the database this time
+            return self._overlaps_in_db(
+                db, doctor_id=doctor_id, start_time=start_time, end_time=end_time,
+                appointment_id=appointment_id
             )
+
+        return appointment_index.overlaps(
+            doctor_id, start_time, end_time, exclude_id=appointment_id
         )
 
+    def _overlaps_in_db(
+        self, db: Session, *,
+        doctor_id: int,
+        start_time: datetime,
+        end_time: datetime,
+        appointment_id: Optional[int] = None
+    ) -> bool:
+        query = db.query(Appointment.id).filter(
+            Appointment.doctor_id == doctor_id,
+            Appointment.status != "cancelled",
+            Appointment.start_time < end_time,
+            Appointment.end_time > start_time
+        )
         if appointment_id:
             query = query.filter(Appointment.id != appointment_id)
+        return db.query(query.exists()).scalar()
+
+    def create_if_free(self, db: Session, *, obj_in: AppointmentCreate) -> Optional[Appointment]:
+        """
+        Create the appointment unless it overlaps another appointment of the
+        doctor, or return None.
+
+        The overlap check runs against the database while holding the
+        doctor's booking lock, so concurrent requests cannot double-book.
+        Callers should still run check_conflicts first to reject most
+        conflicts without taking the lock.
+        """
+        with doctor_locks(db, [obj_in.doctor_id]):
+            if self._overlaps_in_db(
+                db, doctor_id=obj_in.doctor_id,
+                start_time=obj_in.start_time, end_time=obj_in.end_time
+            ):
+                db.rollback()
+                return None
+            return self.create(db, obj_in=obj_in)
+
+    def update_if_free(
+        self, db: Session, *, db_obj: Appointment, obj_in: AppointmentUpdate
+    ) -> Optional[Appointment]:
+        """
+        Update the appointment unless its new time overlaps another
+        appointment of the doctor, or return None. See `create_if_free`.
+        """
+        with doctor_locks(db, [db_obj.doctor_id]):
+            if self._overlaps_in_db(
+                db, doctor_id=db_obj.doctor_id,
+                start_time=obj_in.start_time or db_obj.start_time,
+                end_time=obj_in.end_time or db_obj.end_time,
+                appointment_id=db_obj.id
+            ):
+                db.rollback()
+                return None
+            return self.update(db, db_obj=db_obj, obj_in=obj_in)
+
+    def create_batch(
+        self, db: Session, *, objs_in: List[AppointmentCreate],
+        held: Optional[Dict[int, List[Tuple[datetime, datetime]]]] = None
+    ) -> List[Dict[str, Any]]:
+        """
+        Validate and create many appointments in one transaction.
+
+        Every item is checked against the time other clients hold for its
+        doctor (`held`, by doctor id), its patient's existence, the doctor's
+        availability, the existing appointments and the items before it in
+        the same batch, using one query each for patients, availabilities
+        and existing appointments. Valid items are inserted with a single
+        multi-row INSERT. Returns one `{"index", "appointment", "error"}` result per
+        item, in input order.
+        """
+        if not objs_in:
+            return []
+
+        doctor_ids = {obj_in.doctor_id for obj_in in objs_in}
+        patient_ids = self._existing_patient_ids(db, patient_ids={obj_in.patient_id for obj_in in objs_in})
+        availabilities = self._availability_windows(db, doctor_ids=doctor_ids)
 
-        return query.count() > 0
+        results = []
+        rows = []
+        created = []
+
+        # Existing appointments are read and the batch inserted while holding
+        # the booking locks of every doctor in it
+        with doctor_locks(db, doctor_ids):
+            booked = self._booked_intervals(db, objs_in=objs_in)
+
+            for index, obj_in in enumerate(objs_in):
+                result = {"index": index, "appointment": None, "error": None}
+                results.append(result)
+
+                if any(
+                    to_naive_utc(start_time) < to_naive_utc(obj_in.end_time) and
+                    to_naive_utc(end_time) > to_naive_utc(obj_in.start_time)
+                    for start_time, end_time in (held or {}).get(obj_in.doctor_id, [])
+                ):
+                    result["error"] = HELD_ERROR
+                else:
+                    result["error"] = self._booking_error(
+                        obj_in, patient_ids, availabilities, booked, pending_id=-index - 1
+                    )
+                if result["error"] is None:
+                    rows.append(obj_in.model_dump())
+
+            if rows:
+                created = self._insert(db, rows)
+                self._bump_calendars(db, created)
+                db.commit()
+            else:
+                db.rollback()
+
+        created = iter(created)
+        for result in results:
+            if result["error"] is None:
+                result["appointment"] = next(created)
+                self._index(result["appointment"])
+
+        return results
+
+    def create_series(
+        self, db: Session, *, obj_in: AppointmentSeriesCreate
+    ) -> Tuple[Optional[AppointmentSeries], List[Dict[str, Any]]]:
+        """
+        Create a recurring series and all of its occurrences in one
+        transaction, or none of them.
+
+        Occurrences are checked like `create_batch` items, with one query for
+        the doctor's availability and one range query for the appointments
+        the series spans. Returns the series and an empty list, or None and
+        one `{"start_time", "error"}` entry per occurrence that cannot be
+        booked.
+        """
+        occurrences = series_occurrences(obj_in)
+        patient_ids = self._existing_patient_ids(db, patient_ids=[obj_in.patient_id])
+        availabilities = self._availability_windows(db, doctor_ids=[obj_in.doctor_id])
+
+        errors = []
+        with doctor_locks(db, [obj_in.doctor_id]):
+            booked = self._booked_intervals(db, objs_in=occurrences)
+
+            for index, occurrence in enumerate(occurrences):
+                error = self._booking_error(occurrence, patient_ids, availabilities, booked, pending_id=-index - 1)
+                if error is not None:
+                    errors.append({"start_time": occurrence.start_time, "error": error})
+
+            if errors:
+                db.rollback()
+                return None, errors
+
+            series_obj = AppointmentSeries(
+                patient_id=obj_in.patient_id,
+                doctor_id=obj_in.doctor_id,
+                frequency=obj_in.frequency.value,
+                interval=obj_in.interval,
+                count=obj_in.count
+            )
+            db.add(series_obj)
+            db.flush()
+
+            created = self._insert(db, [
+                {**occurrence.model_dump(), "series_id": series_obj.id} for occurrence in occurrences
+            ])
+            self._bump_calendars(db, [obj_in])
+            db.commit()
+
+        for appointment_obj in created:
+            self._index(appointment_obj)
+
+        db.refresh(series_obj)
+        return series_obj, []
+
+    def get_series(self, db: Session, *, id: int) -> Optional[AppointmentSeries]:
+        return db.query(AppointmentSeries).options(
+            selectinload(AppointmentSeries.appointments)
+        ).filter(AppointmentSeries.id == id).first()
+
+    def update_series(
+        self, db: Session, *, series_id: int, obj_in: AppointmentSeriesUpdate
+    ) -> List[int]:
+        """
+        Apply the update to every upcoming scheduled or confirmed occurrence
+        of the series with a single UPDATE, leaving past, completed, missed
+        and cancelled occurrences alone. Returns the ids of the updated
+        appointments.
+        """
+        values = obj_in.model_dump(exclude_unset=True)
+        if "status" in values:
+            values["status"] = AppointmentStatus(values["status"]).value
+        if not values:
+            return []
+
+        rows = db.execute(
+            update(Appointment).where(
+                Appointment.series_id == series_id,
+                Appointment.status.in_([AppointmentStatus.SCHEDULED.value, AppointmentStatus.CONFIRMED.value]),
+                Appointment.start_time >= to_naive_utc(datetime.now(timezone.utc))
+            ).values(**values).returning(Appointment.id, Appointment.doctor_id, Appointment.patient_id)
+        ).all()
+        self._bump_calendars(db, rows)
+        db.commit()
+
+        if values.get("status") == AppointmentStatus.CANCELLED.value:
+            for id, doctor_id, _ in rows:
+                appointment_index.discard(doctor_id, id)
+                schedule_cache.discard_booking(id)
+
+        return [id for id, _, _ in rows]
+
+    def _existing_patient_ids(self, db: Session, *, patient_ids: Iterable[int]) -> Set[int]:
+        return set(db.scalars(select(Patient.id).where(Patient.id.in_(patient_ids))))
+
+    def _availability_windows(
+        self, db: Session, *, doctor_ids: Iterable[int]
+    ) -> Dict[Tuple[int, int], List[Tuple[time, time]]]:
+        availabilities = defaultdict(list)
+        for availability in db.query(Availability).filter(
+            Availability.doctor_id.in_(doctor_ids),
+            Availability.is_available == True
+        ):
+            availabilities[(availability.doctor_id, availability.day_of_week)].append(
+                (availability.start_time, availability.end_time)
+            )
+        return availabilities
+
+    def _booked_intervals(
+        self, db: Session, *, objs_in: List[AppointmentCreate]
+    ) -> Dict[int, DoctorIntervals]:
+        # One range query covering every requested appointment
+        booked = defaultdict(lambda: DoctorIntervals(loaded_at=0))
+        for id, doctor_id, start_time, end_time in db.query(
+            Appointment.id, Appointment.doctor_id, Appointment.start_time, Appointment.end_time
+        ).filter(
+            Appointment.doctor_id.in_({obj_in.doctor_id for obj_in in objs_in}),
+            Appointment.status != "cancelled",
+            Appointment.start_time < max(to_naive_utc(obj_in.end_time) for obj_in in objs_in),
+            Appointment.end_time > min(to_naive_utc(obj_in.start_time) for obj_in in objs_in)
+        ):
+            booked[doctor_id].add(id, start_time, end_time)
+        return booked
+
+    def _booking_error(
+        self, obj_in: AppointmentCreate,
+        patient_ids: Set[int],
+        availabilities: Dict[Tuple[int, int], List[Tuple[time, time]]],
+        booked: Dict[int, DoctorIntervals],
+        pending_id: int
+    ) -> Optional[str]:
+        """
+        Check an appointment against the existing patients and the loaded
+        availability and bookings, and record it in `booked` under
+        `pending_id` if it fits. Negative pending ids keep requested
+        appointments apart from stored ones.
+        """
+        if obj_in.patient_id not in patient_ids:
+            return PATIENT_ERROR
+
+        is_available = any(
+            start_time <= obj_in.start_time.time() and end_time >= obj_in.end_time.time()
+            for start_time, end_time in availabilities[(obj_in.doctor_id, obj_in.start_time.weekday())]
+        )
+        if not is_available:
+            return "Doctor is not available at the requested time"
+
+        intervals = booked[obj_in.doctor_id]
+        if intervals.overlaps(obj_in.start_time, obj_in.end_time):
+            return "There is a scheduling conflict with another appointment"
+
+        intervals.add(pending_id, obj_in.start_time, obj_in.end_time)
+        return None
+
+    def _insert(self, db: Session, rows: List[Dict[str, Any]]) -> List[Appointment]:
+        # Multi-row INSERT; RETURNING rows come back in the order of `rows`
+        statement = insert(Appointment).returning(Appointment, sort_by_parameter_order=True)
+        return db.scalars(statement, rows).all()
 
     def update_status(self, db: Session, *, id: int, status: AppointmentStatus) -> Appointment:
         appointment = self.get(db, id=id)
@@ -147,8 +592,62 @@ class CRUDAppointment(CRUDBase[Appointment, AppointmentCreate, AppointmentUpdate
 
         appointment.status = status.value
         db.add(appointment)
+        self._bump_calendars(db, [appointment])
         db.commit()
         db.refresh(appointment)
+        self._index(appointment)
         return appointment
 
+class AsyncCRUDAppointment(AppointmentOrdering, AsyncCRUDBase[Appointment, AppointmentCreate, AppointmentUpdate]):
+    """Reads of CRUDAppointment for `async def` routes; bookings stay sync."""
+
+    async def get_by_patient(
+        self, db: AsyncSession, *, patient_id: int,
+        start_date: Optional[datetime] = None,
+        end_date: Optional[datetime] = None,
+        skip: int = 0, limit: int = 100,
+        cursor: Optional[str] = None
+    ) -> List[Appointment]:
+        statement = select(Appointment).filter(Appointment.patient_id == patient_id)
+        statement = _in_date_range(statement, start_date, end_date)
+        return await self.paginate(db, statement, skip=skip, limit=limit, cursor=cursor)
+
+    async def get_by_doctor(
+        self, db: AsyncSession, *, doctor_id: int,
+        start_date: Optional[datetime] = None,
+        end_date: Optional[datetime] = None,
+        skip: int = 0, limit: int = 100,
+        cursor: Optional[str] = None
+    ) -> List[Appointment]:
+        statement = select(Appointment).filter(Appointment.doctor_id == doctor_id)
+        statement = _in_date_range(statement, start_date, end_date)
+        return await self.paginate(db, statement, skip=skip, limit=limit, cursor=cursor)
+
+    async def get_multi_with_details(
+        self, db: AsyncSession, *,
+        start_date: Optional[datetime] = None,
+        end_date: Optional[datetime] = None,
+        skip: int = 0, limit: int = 100,
+        cursor: Optional[str] = None
+    ) -> List[Dict[str, Any]]:
+        statement = select(Appointment, *DETAIL_COLUMNS).join(
+            Patient, Appointment.patient_id == Patient.id
+        ).join(
+            Doctor, Appointment.doctor_id == Doctor.id
+        )
+        statement = _in_date_range(statement, start_date, end_date)
+
+        page = self.page_statement(statement, skip=skip, limit=limit, cursor=cursor)
+        return [_with_details(result) for result in await db.execute(page)]
+
+    async def details_version(
+        self, db: AsyncSession, *,
+        start_date: Optional[datetime] = None,
+        end_date: Optional[datetime] = None
+    ) -> Tuple[Any, ...]:
+        statement = _in_date_range(select(*DETAILS_VERSION_COLUMNS), start_date, end_date)
+        return tuple((await db.execute(statement)).one())
+
+
 appointment = CRUDAppointment(Appointment)
+async_appointment = AsyncCRUDAppointment(Appointment)
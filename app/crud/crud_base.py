@@ -1,16 +1,72 @@
-from typing import Any, Dict, Generic, List, Optional, Type, TypeVar, Union
+from typing import Any, Dict, Generic, Iterator, List, Optional, Tuple, Type, TypeVar, Union
 
 from fastapi.encoders import jsonable_encoder
 from pydantic import BaseModel
-from sqlalchemy.orm import Session
+from sqlalchemy import func, select, tuple_
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Query, Session
+from sqlalchemy.sql import Select
 
+from app.core.pagination import decode_cursor, encode_cursor
 from app.db.models import Base
 
 ModelType = TypeVar("ModelType", bound=Base)
 CreateSchemaType = TypeVar("CreateSchemaType", bound=BaseModel)
 UpdateSchemaType = TypeVar("UpdateSchemaType", bound=BaseModel)
 
-class CRUDBase(Generic[ModelType, CreateSchemaType, UpdateSchemaType]):
+class KeysetPagination:
+    """Stable ordering and cursors shared by the sync and async CRUD classes."""
+
+    model: Any
+
+    def sort_columns(self) -> List[Any]:
+        return [self.model.id]
+
+    def parse_cursor_values(self, values: List[Any]) -> List[Any]:
+        return [int(values[0])]
+
+    def page_statement(
+        self, statement: Union[Query, Select], *, skip: int = 0, limit: int = 100,
+        cursor: Optional[str] = None
+    ) -> Union[Query, Select]:
+        """
+        Restrict a query or select() to one page in a stable order.
+
+        With a cursor the page starts right after the row the cursor points
+        at (keyset pagination); without one, `skip` is used as an OFFSET.
+        Raises ValueError for a malformed cursor.
+        """
+        sort_columns = self.sort_columns()
+        statement = statement.order_by(*sort_columns)
+        if cursor is not None:
+            try:
+                values = self.parse_cursor_values(decode_cursor(cursor, len(sort_columns)))
+            except (TypeError, ValueError) as e:
+                raise ValueError("Invalid cursor") from e
+            statement = statement.filter(tuple_(*sort_columns) > tuple_(*values))
+        else:
+            statement = statement.offset(skip)
+        return statement.limit(limit)
+
+    def next_cursor(self, items: List[Any], *, limit: int) -> Optional[str]:
+        """Cursor for the page after `items`, or None if it was the last page."""
+        if not items or len(items) < limit:
+            return None
+        last = items[-1]
+        if not isinstance(last, dict):
+            last = last.__dict__
+        return encode_cursor([last[column.key] for column in self.sort_columns()])
+
+    def version_columns(self) -> List[Any]:
+        """Count, highest id and latest change of the selected rows."""
+        return [
+            func.count(self.model.id),
+            func.max(self.model.id),
+            func.max(func.coalesce(self.model.updated_at, self.model.created_at))
+        ]
+
+
+class CRUDBase(KeysetPagination, Generic[ModelType, CreateSchemaType, UpdateSchemaType]):
     def __init__(self, model: Type[ModelType]):
         """
         CRUD object with default methods to Create, Read, Update, Delete (CRUD).
@@ -26,9 +82,34 @@ class CRUDBase(Generic[ModelType, CreateSchemaType, UpdateSchemaType]):
         return db.query(self.model).filter(self.model.id == id).first()
 
     def get_multi(
-        self, db: Session, *, skip: int = 0, limit: int = 100
+        self, db: Session, *, skip: int = 0, limit: int = 100,
+        cursor: Optional[str] = None
     ) -> List[ModelType]:
-        return db.query(self.model).offset(skip).limit(limit).all()
+        return self.paginate(db.query(self.model), skip=skip, limit=limit, cursor=cursor)
+
+    def paginate(
+        self, query: Query, *, skip: int = 0, limit: int = 100,
+        cursor: Optional[str] = None
+    ) -> List[Any]:
+        """Return one page of `query`; see `page_statement`."""
+        return self.page_statement(query, skip=skip, limit=limit, cursor=cursor).all()
+
+    def collection_version(self, query: Query) -> Tuple[Any, ...]:
+        """
+        Cheap fingerprint of the rows `query` selects: their count, highest id
+        and latest change, from one aggregate query. Inserts, deletes and
+        updates of those rows change it.
+        """
+        return tuple(query.with_entities(*self.version_columns()).one())
+
+    def stream(self, db: Session, *, batch_size: int = 1000) -> Iterator[Dict[str, Any]]:
+        """
+        Yield every row as a dict of column values, ordered by id, fetching
+        `batch_size` rows at a time through a server-side cursor.
+        """
+        query = db.query(*self.model.__table__.columns).order_by(self.model.id)
+        for row in query.yield_per(batch_size):
+            yield row._asdict()
 
     def create(self, db: Session, *, obj_in: CreateSchemaType) -> ModelType:
         # Use model_dump() for Pydantic v2, or dict() for v1
@@ -68,3 +149,66 @@ class CRUDBase(Generic[ModelType, CreateSchemaType, UpdateSchemaType]):
         db.commit()
         return obj
 
+
+
+class AsyncCRUDBase(KeysetPagination, Generic[ModelType, CreateSchemaType, UpdateSchemaType]):
+    def __init__(self, model: Type[ModelType]):
+        """
+        asyncio counterpart of CRUDBase for `async def` routes, on an
+        AsyncSession. Writes with side effects on in-process caches and
+        indexes stay on the sync CRUD classes.
+        """
+        self.model = model
+
+    async def get(self, db: AsyncSession, id: Any) -> Optional[ModelType]:
+        return await db.get(self.model, id)
+
+    async def get_multi(
+        self, db: AsyncSession, *, skip: int = 0, limit: int = 100,
+        cursor: Optional[str] = None
+    ) -> List[ModelType]:
+        return await self.paginate(db, select(self.model), skip=skip, limit=limit, cursor=cursor)
+
+    async def paginate(
+        self, db: AsyncSession, statement: Select, *, skip: int = 0, limit: int = 100,
+        cursor: Optional[str] = None
+    ) -> List[Any]:
+        """Return one page of model rows selected by `statement`; see `page_statement`."""
+        page = self.page_statement(statement, skip=skip, limit=limit, cursor=cursor)
+        return list((await db.scalars(page)).all())
+
+    async def collection_version(self, db: AsyncSession, statement: Select) -> Tuple[Any, ...]:
+        """Fingerprint of the rows `statement` selects; see CRUDBase.collection_version."""
+        return tuple((await db.execute(statement.with_only_columns(*self.version_columns()))).one())
+
+    async def create(self, db: AsyncSession, *, obj_in: CreateSchemaType) -> ModelType:
+        db_obj = self.model(**obj_in.model_dump())
+        db.add(db_obj)
+        await db.commit()
+        await db.refresh(db_obj)
+        return db_obj
+
+    async def update(
+        self,
+        db: AsyncSession,
+        *,
+        db_obj: ModelType,
+        obj_in: Union[UpdateSchemaType, Dict[str, Any]]
+    ) -> ModelType:
+        if isinstance(obj_in, dict):
+            update_data = obj_in
+        else:
+            update_data = obj_in.model_dump(exclude_unset=True)
+        for column in self.model.__table__.columns:
+            if column.key in update_data:
+                setattr(db_obj, column.key, update_data[column.key])
+        db.add(db_obj)
+        await db.commit()
+        await db.refresh(db_obj)
+        return db_obj
+
+    async def remove(self, db: AsyncSession, *, id: int) -> Optional[ModelType]:
+        obj = await db.get(self.model, id)
+        await db.delete(obj)
+        await db.commit()
+        return obj
@@ -0,0 +1,77 @@
+from typing import Iterable
+
+from sqlalchemy import select
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+
+from app.db.models import CalendarVersion
+
+DOCTOR = "doctor"
+PATIENT = "patient"
+
+
+class CRUDCalendarVersion:
+    """
+    Per-doctor and per-patient change counters for calendar feeds.
+
+    Appointment writes bump the counters of the doctor and patient involved
+    in the same transaction, so a feed's version can be read without
+    touching the appointments table.
+    """
+
+    def get(self, db: Session, *, owner_type: str, owner_id: int) -> int:
+        version = db.query(CalendarVersion.version).filter(
+            CalendarVersion.owner_type == owner_type,
+            CalendarVersion.owner_id == owner_id
+        ).scalar()
+        return version or 0
+
+    def bump(
+        self, db: Session, *,
+        doctor_ids: Iterable[int] = (),
+        patient_ids: Iterable[int] = ()
+    ) -> None:
+        """Increment the counters of the given owners. Does not commit."""
+        keys = sorted(
+            {(DOCTOR, doctor_id) for doctor_id in doctor_ids} |
+            {(PATIENT, patient_id) for patient_id in patient_ids}
+        )
+        if not keys:
+            return
+
+        dialect = db.get_bind().dialect.name
+        if dialect in ("postgresql", "sqlite"):
+            insert = postgresql.insert if dialect == "postgresql" else sqlite.insert
+            statement = insert(CalendarVersion).values([
+                {"owner_type": owner_type, "owner_id": owner_id, "version": 1}
+                for owner_type, owner_id in keys
+            ])
+            db.execute(statement.on_conflict_do_update(
+                index_elements=[CalendarVersion.owner_type, CalendarVersion.owner_id],
+                set_={"version": CalendarVersion.version + 1}
+            ))
+            return
+
+        for owner_type, owner_id in keys:
+            updated = db.query(CalendarVersion).filter(
+                CalendarVersion.owner_type == owner_type,
+                CalendarVersion.owner_id == owner_id
+            ).update({CalendarVersion.version: CalendarVersion.version + 1}, synchronize_session=False)
+            if not updated:
+                db.add(CalendarVersion(owner_type=owner_type, owner_id=owner_id, version=1))
+        db.flush()
+
+class AsyncCRUDCalendarVersion:
+    """Reads of the calendar change counters for `async def` routes."""
+
+    async def get(self, db: AsyncSession, *, owner_type: str, owner_id: int) -> int:
+        version = await db.scalar(select(CalendarVersion.version).filter(
+            CalendarVersion.owner_type == owner_type,
+            CalendarVersion.owner_id == owner_id
+        ))
+        return version or 0
+
+
+calendar_version = CRUDCalendarVersion()
+async_calendar_version = AsyncCRUDCalendarVersion()
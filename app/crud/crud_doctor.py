@@ -1,22 +1,113 @@
-from typing import List, Optional, Dict, Any
-from datetime import datetime, time, timedelta
-from sqlalchemy.orm import Session, joinedload
+from typing import Any, Dict, Iterable, List, Optional, Tuple, Union
+from collections import defaultdict
+from datetime import date as date_type, datetime, time, timedelta, timezone
+from heapq import merge
+from itertools import dropwhile, islice, repeat
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session, joinedload, selectinload
 
 
-from app.crud.crud_base import CRUDBase
+from app.core.day_bitmap import CELL_MINUTES, DayWindows, bitmap_slots, cells_mask, is_within_windows, schedule_cache
+from app.core.interval_index import to_naive_utc
+from app.core.slots import DEFAULT_SLOT_MINUTES, free_slot_bitmap, generate_slots, iter_set_bits
+from app.core.two_tier_cache import doctor_cache
+from app.crud.crud_base import AsyncCRUDBase, CRUDBase
 from app.db.models import Doctor, Availability, Appointment
-from app.schemas.doctor import DoctorCreate, DoctorUpdate, AvailabilityCreate
+from app.db.replicas import read_from_primary
+from app.schemas.doctor import (
+    Doctor as DoctorSchema, DoctorCreate, DoctorUpdate, DoctorWithAvailability, AvailabilityCreate
+)
+
+Windows = List[Tuple[time, time]]
+
+
+def _doctor_keys(doctor_obj: Doctor) -> List[str]:
+    return [f"doctor:{doctor_obj.id}", f"specialization:{doctor_obj.specialization}"]
+
 
 class CRUDDoctor(CRUDBase[Doctor, DoctorCreate, DoctorUpdate]):
     def get_by_email(self, db: Session, *, email: str) -> Optional[Doctor]:
         return db.query(Doctor).filter(Doctor.email == email).first()
 
-    def get_by_specialization(self, db: Session, *, specialization: str) -> List[Doctor]:
-        return db.query(Doctor).filter(Doctor.specialization == specialization).all()
+    def create(self, db: Session, *, obj_in: DoctorCreate) -> Doctor:
+        doctor_obj = super().create(db, obj_in=obj_in)
+        doctor_cache.delete(*_doctor_keys(doctor_obj))
+        return doctor_obj
+
+    def update(
+        self, db: Session, *, db_obj: Doctor,
+        obj_in: Union[DoctorUpdate, Dict[str, Any]]
+    ) -> Doctor:
+        previous_keys = _doctor_keys(db_obj)
+        doctor_obj = super().update(db, db_obj=db_obj, obj_in=obj_in)
+        doctor_cache.delete(*previous_keys, *_doctor_keys(doctor_obj))
+        return doctor_obj
+
+    def remove(self, db: Session, *, id: int) -> Doctor:
+        doctor_obj = super().remove(db, id=id)
+        doctor_cache.delete(
+            *_doctor_keys(doctor_obj),
+            *(f"windows:{id}:{day_of_week}" for day_of_week in range(7))
+        )
+        return doctor_obj
+
+    @doctor_cache.cached(
+        lambda self, db, *, specialization: f"specialization:{specialization}",
+        schema=List[DoctorSchema]
+    )
+    def get_by_specialization(self, db: Session, *, specialization: str) -> List[DoctorSchema]:
+        read_from_primary(db)
+        return db.query(Doctor).filter(Doctor.specialization == specialization).order_by(Doctor.id).all()
 
-    def get_with_availability(self, db: Session, *, id: int) -> Optional[Doctor]:
+    @doctor_cache.cached(lambda self, db, *, id: f"doctor:{id}", schema=DoctorWithAvailability)
+    def get_with_availability(self, db: Session, *, id: int) -> Optional[DoctorWithAvailability]:
+        read_from_primary(db)
         return db.query(Doctor).options(joinedload(Doctor.availabilities)).filter(Doctor.id == id).first()
 
+    @doctor_cache.cached(
+        lambda self, db, *, doctor_id, day_of_week: f"windows:{doctor_id}:{day_of_week}",
+        schema=Windows
+    )
+    def get_availability_windows(self, db: Session, *, doctor_id: int, day_of_week: int) -> Windows:
+        """Available (start_time, end_time) windows of a doctor on a weekday."""
+        read_from_primary(db)
+        rows = db.query(Availability.start_time, Availability.end_time).filter(
+            Availability.doctor_id == doctor_id,
+            Availability.day_of_week == day_of_week,
+            Availability.is_available == True
+        ).order_by(Availability.id).all()
+        return [tuple(row) for row in rows]
+
+    def warm_cache(self, db: Session) -> int:
+        """
+        Load every doctor with availability into the doctor cache's Redis
+        tier: profiles, specialization lists and weekday windows. Returns the
+        number of doctors, or 0 when the cache does not use Redis.
+        """
+        if doctor_cache.redis is None:
+            return 0
+        doctors = db.query(Doctor).options(selectinload(Doctor.availabilities)).order_by(Doctor.id).all()
+
+        by_specialization = defaultdict(list)
+        windows = {}
+        for doctor_obj in doctors:
+            by_specialization[doctor_obj.specialization].append(doctor_obj)
+            for day_of_week in range(7):
+                windows[f"windows:{doctor_obj.id}:{day_of_week}"] = [
+                    (availability.start_time, availability.end_time)
+                    for availability in sorted(doctor_obj.availabilities, key=lambda availability: availability.id)
+                    if availability.day_of_week == day_of_week and availability.is_available
+                ]
+
+        doctor_cache.warm(((f"doctor:{doctor_obj.id}", doctor_obj) for doctor_obj in doctors), DoctorWithAvailability)
+        doctor_cache.warm(
+            ((f"specialization:{specialization}", members) for specialization, members in by_specialization.items()),
+            List[DoctorSchema]
+        )
+        doctor_cache.warm(windows.items(), Windows)
+        return len(doctors)
+
     def add_availability(self, db: Session, *, doctor_id: int, availability: AvailabilityCreate) -> Doctor:
         db_availability = Availability(
             doctor_id=doctor_id,
@@ -28,67 +119,182 @@ class CRUDDoctor(CRUDBase[Doctor, DoctorCreate, DoctorUpdate]):
         db.add(db_availability)
         db.commit()
 
+        doctor_cache.delete(f"doctor:{doctor_id}", f"windows:{doctor_id}:{availability.day_of_week}")
+
+        if availability.is_available:
+            schedule_cache.add_window(
+                doctor_id, availability.day_of_week, availability.start_time, availability.end_time
+            )
+
         return self.get_with_availability(db, id=doctor_id)
 
-    def check_availability(self, db: Session, *, doctor_id: int, start_time: datetime, end_time: datetime) -> bool:
-        day_of_week = start_time.weekday()
+    def get_day_windows(self, db: Session, *, doctor_id: int, day_of_week: int) -> DayWindows:
+        windows = schedule_cache.windows(doctor_id, day_of_week)
+        if windows is None:
+            rows = self.get_availability_windows(db, doctor_id=doctor_id, day_of_week=day_of_week)
+            windows = schedule_cache.load_windows(doctor_id, day_of_week, rows)
+        return windows
 
-        availability = db.query(Availability).filter(
-            Availability.doctor_id == doctor_id,
-            Availability.day_of_week == day_of_week,
-            Availability.is_available == True,
-            Availability.start_time <= start_time.time(),
-            Availability.end_time >= end_time.time()
-        ).first()
+    def get_booked_cells(self, db: Session, *, doctor_id: int, day: date_type) -> int:
+        booked = schedule_cache.booked(doctor_id, day)
+        if booked is None:
+            read_from_primary(db)
+            rows = db.query(Appointment.id, Appointment.start_time, Appointment.end_time).filter(
+                Appointment.doctor_id == doctor_id,
+                Appointment.start_time >= datetime.combine(day, time.min),
+                Appointment.end_time <= datetime.combine(day, time.max),
+                Appointment.status != "cancelled"
+            ).all()
+            booked = schedule_cache.load_bookings(doctor_id, day, rows)
+        return booked
 
-        return availability is not None
+    def check_availability(self, db: Session, *, doctor_id: int, start_time: datetime, end_time: datetime) -> bool:
+        windows = self.get_day_windows(db, doctor_id=doctor_id, day_of_week=start_time.weekday())
 
-    def get_available_slots(self, db: Session, *, doctor_id: int, date: datetime) -> List[Dict[str, Any]]:
-        day_of_week = date.weekday()
+        if windows.aligned and start_time < end_time and start_time.date() == end_time.date():
+            return is_within_windows(windows.masks(), start_time.time(), end_time.time())
 
-        availabilities = db.query(Availability).filter(
-            Availability.doctor_id == doctor_id,
-            Availability.day_of_week == day_of_week,
-            Availability.is_available == True
-        ).all()
+        return any(
+            window_start <= start_time.time() and window_end >= end_time.time()
+            for window_start, window_end in windows.windows
+        )
+
+    def get_available_slots(
+        self, db: Session, *, doctor_id: int, date: datetime,
+        slot_minutes: int = DEFAULT_SLOT_MINUTES,
+        held: Iterable[Tuple[datetime, datetime]] = ()
+    ) -> List[Dict[str, Any]]:
+        """
+        Free slots of the doctor on `date`. Intervals in `held` (for example
+        active slot holds) are treated as booked.
+        """
+        windows = self.get_day_windows(db, doctor_id=doctor_id, day_of_week=date.weekday())
 
-        if not availabilities:
+        if not windows.windows:
             return []
 
+        held = list(held)
+
+        if windows.aligned and slot_minutes % CELL_MINUTES == 0:
+            booked = self.get_booked_cells(db, doctor_id=doctor_id, day=date.date())
+            midnight = datetime.combine(date.date(), time.min)
+            for start_time, end_time in held:
+                booked |= cells_mask(
+                    (to_naive_utc(start_time) - midnight).total_seconds(),
+                    (to_naive_utc(end_time) - midnight).total_seconds()
+                )
+            return bitmap_slots(date.date(), windows.windows, booked, slot_minutes)
+
+        # Off-grid availability or slot length: sweep the day's appointments instead
         start_of_day = datetime.combine(date.date(), time.min)
         end_of_day = datetime.combine(date.date(), time.max)
 
-        appointments = db.query(Appointment).filter(
+        appointments = db.query(Appointment.start_time, Appointment.end_time).filter(
             Appointment.doctor_id == doctor_id,
             Appointment.start_time >= start_of_day,
             Appointment.end_time <= end_of_day,
             Appointment.status != "cancelled"
         ).all()
 
-        slots = []
-        for availability in availabilities:
-            current_time = datetime.combine(date.date(), availability.start_time)
-            end_time = datetime.combine(date.date(), availability.end_time)
+        return generate_slots(
+            date.date(),
+            windows.windows,
+            [(appointment.start_time, appointment.end_time) for appointment in appointments] + held,
+            slot_minutes=slot_minutes
+        )
 
-            while current_time + timedelta(minutes=30) <= end_time:
-                slot_end_time = current_time + timedelta(minutes=30)
+    def find_first_available_slots(
+        self, db: Session, *, specialization: str,
+        start_date: date_type, end_date: date_type,
+        slot_minutes: int = DEFAULT_SLOT_MINUTES, limit: int = 10,
+        now: Optional[datetime] = None
+    ) -> List[Dict[str, Any]]:
+        """
+        Find the earliest free slots across all doctors of a specialization
+        between start_date and end_date (inclusive). Slots that have ended
+        by `now` (the current UTC time by default) are skipped.
 
-                is_available = True
-                for appointment in appointments:
-                    if (current_time < appointment.end_time and
-                        slot_end_time > appointment.start_time):
-                        is_available = False
-                        break
+        Availabilities and appointments of every matching doctor are loaded
+        with one query each and turned into one free-slot bitmap per doctor;
+        the bitmaps are then merged in time order to pick the first `limit`
+        slots. Slots are aligned to multiples of slot_minutes from midnight
+        of start_date.
+        """
+        days = (end_date - start_date).days + 1
+        range_start = datetime.combine(start_date, time.min)
+        range_end = range_start + timedelta(days=days)
 
-                if is_available:
-                    slots.append({
-                        "start_time": current_time.isoformat(),
-                        "end_time": slot_end_time.isoformat(),
-                        "is_available": True
-                    })
+        rows = db.query(
+            Availability.doctor_id,
+            Availability.day_of_week,
+            Availability.start_time,
+            Availability.end_time,
+            Doctor.first_name,
+            Doctor.last_name
+        ).join(
+            Doctor, Availability.doctor_id == Doctor.id
+        ).filter(
+            Doctor.specialization == specialization,
+            Availability.is_available == True
+        ).all()
 
-                current_time = slot_end_time
+        if not rows:
+            return []
+
+        availabilities = defaultdict(list)
+        doctor_names = {}
+        for doctor_id, day_of_week, start_time, end_time, first_name, last_name in rows:
+            availabilities[doctor_id].append((day_of_week, start_time, end_time))
+            doctor_names[doctor_id] = f"{first_name} {last_name}"
+
+        appointments = db.query(
+            Appointment.doctor_id, Appointment.start_time, Appointment.end_time
+        ).join(
+            Doctor, Appointment.doctor_id == Doctor.id
+        ).filter(
+            Doctor.specialization == specialization,
+            Appointment.status != "cancelled",
+            Appointment.start_time < range_end,
+            Appointment.end_time > range_start
+        ).all()
+
+        busy = defaultdict(list)
+        for doctor_id, start_time, end_time in appointments:
+            busy[doctor_id].append((start_time, end_time))
+
+        free_slots = [
+            zip(iter_set_bits(free_slot_bitmap(
+                start_date, days, doctor_availabilities, busy[doctor_id], slot_minutes
+            )), repeat(doctor_id))
+            for doctor_id, doctor_availabilities in availabilities.items()
+        ]
+
+        step = timedelta(minutes=slot_minutes)
+        # Slots before this index have ended already
+        first_index = (to_naive_utc(now or datetime.now(timezone.utc)) - range_start) // step
+        upcoming = dropwhile(lambda slot: slot[0] < first_index, merge(*free_slots))
+
+        slots = []
+        for index, doctor_id in islice(upcoming, limit):
+            slot_start_time = range_start + index * step
+            slots.append({
+                "doctor_id": doctor_id,
+                "doctor_name": doctor_names[doctor_id],
+                "start_time": slot_start_time.isoformat(),
+                "end_time": (slot_start_time + step).isoformat(),
+                "is_available": True
+            })
 
         return slots
 
+class AsyncCRUDDoctor(AsyncCRUDBase[Doctor, DoctorCreate, DoctorUpdate]):
+    async def get_by_email(self, db: AsyncSession, *, email: str) -> Optional[Doctor]:
+        return (await db.scalars(select(Doctor).filter(Doctor.email == email))).first()
+
+    async def get_with_availability(self, db: AsyncSession, *, id: int) -> Optional[Doctor]:
+        statement = select(Doctor).options(selectinload(Doctor.availabilities)).filter(Doctor.id == id)
+        return (await db.scalars(statement)).first()
+
+
 doctor = CRUDDoctor(Doctor)
+async_doctor = AsyncCRUDDoctor(Doctor)
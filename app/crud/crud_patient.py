@@ -1,23 +1,36 @@
 from typing import List, Optional
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
-from sqlalchemy import or_
+from sqlalchemy import or_, select
 
-from app.crud.crud_base import CRUDBase
+from app.crud.crud_base import AsyncCRUDBase, CRUDBase
 from app.db.models import Patient
 from app.schemas.patient import PatientCreate, PatientUpdate
 
+def _matches(query: str):
+    search_query = f"%{query}%"
+    return or_(
+        Patient.first_name.ilike(search_query),
+        Patient.last_name.ilike(search_query),
+        Patient.email.ilike(search_query)
+    )
+
+
 class CRUDPatient(CRUDBase[Patient, PatientCreate, PatientUpdate]):
     def get_by_email(self, db: Session, *, email: str) -> Optional[Patient]:
         return db.query(Patient).filter(Patient.email == email).first()
 
     def search(self, db: Session, *, query: str) -> List[Patient]:
-        search_query = f"%{query}%"
-        return db.query(Patient).filter(
-            or_(
-                Patient.first_name.ilike(search_query),
-                Patient.last_name.ilike(search_query),
-                Patient.email.ilike(search_query)
-            )
-        ).all()
+        return db.query(Patient).filter(_matches(query)).all()
+
+
+class AsyncCRUDPatient(AsyncCRUDBase[Patient, PatientCreate, PatientUpdate]):
+    async def get_by_email(self, db: AsyncSession, *, email: str) -> Optional[Patient]:
+        return (await db.scalars(select(Patient).filter(Patient.email == email))).first()
+
+    async def search(self, db: AsyncSession, *, query: str) -> List[Patient]:
+        return list((await db.scalars(select(Patient).filter(_matches(query)))).all())
+
 
 patient = CRUDPatient(Patient)
+async_patient = AsyncCRUDPatient(Patient)
@@ -1,6 +1,9 @@
-from typing import Optional
+from typing import Any, Dict, Optional, Union
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
 
+from app.core.cache import invalidate_tags
+from app.core.principal_cache import principals
 from app.core.security import get_password_hash, verify_password
 from app.crud.crud_base import CRUDBase
 from app.db.models import User
@@ -27,6 +30,21 @@ class CRUDUser(CRUDBase[User, UserCreate, UserUpdate]):
         db.refresh(db_obj)
         return db_obj
     
+    def update(
+        self, db: Session, *, db_obj: User, obj_in: Union[UserUpdate, Dict[str, Any]]
+    ) -> User:
+        user_obj = super().update(db, db_obj=db_obj, obj_in=obj_in)
+        # Deactivation and role changes must reach authentication and cached responses
+        principals.invalidate(user_obj.id)
+        invalidate_tags(f"user:{user_obj.id}")
+        return user_obj
+
+    def remove(self, db: Session, *, id: int) -> User:
+        user_obj = super().remove(db, id=id)
+        principals.invalidate(id)
+        invalidate_tags(f"user:{id}")
+        return user_obj
+
     def authenticate(self, db: Session, *, email: str, password: str) -> Optional[User]:
         user = self.get_by_email(db, email=email)
         if not user:
@@ -35,5 +53,15 @@ class CRUDUser(CRUDBase[User, UserCreate, UserUpdate]):
             return None
         return user
 
+class AsyncCRUDUser:
+    """
+    Read-only user lookups on an AsyncSession. Writes go through `user`,
+    which keeps the principal cache and cached responses in step.
+    """
+
+    async def get(self, db: AsyncSession, id: Any) -> Optional[User]:
+        return await db.get(User, id)
+
 user = CRUDUser(User)
+async_user = AsyncCRUDUser()
 
@@ -0,0 +1,152 @@
+import logging
+from typing import Callable, List, Set, Tuple
+
+from sqlalchemy import Column, DateTime, Index, Integer, MetaData, String, Table, inspect, select, text
+from sqlalchemy.engine import Connection, Engine
+from sqlalchemy.schema import DropIndex
+from sqlalchemy.sql import func
+
+from app.db.models import Appointment, AppointmentSeries, Availability, Base, CalendarVersion
+
+logger = logging.getLogger(__name__)
+
+# Key of the advisory lock that keeps replicas from migrating concurrently
+MIGRATION_LOCK_KEY = 4207000
+
+schema_migrations = Table(
+    "schema_migrations",
+    MetaData(),
+    Column("version", Integer, primary_key=True),
+    Column("description", String),
+    Column("applied_at", DateTime(timezone=True), server_default=func.now()),
+)
+
+
+def _create_schema(connection: Connection) -> None:
+    # Creates missing tables; a database created before migrations existed
+    # already has them and is left alone
+    Base.metadata.create_all(bind=connection)
+
+
+# Indexes added by migration 2; later indexes belong to their own migrations
+ACCESS_PATH_INDEXES = {
+    "ix_appointments_doctor_id_start_time",
+    "ix_appointments_patient_id_start_time",
+    "ix_appointments_start_time_id",
+    "ix_appointments_status",
+    "ix_appointments_active_doctor_id_start_time",
+    "ix_availabilities_doctor_id_day_of_week",
+}
+
+
+# Indexes that migrations add to tables already holding rows. On PostgreSQL
+# they are left out of the migration transaction and built afterwards with
+# CREATE INDEX CONCURRENTLY, which does not block writes to the table
+CONCURRENT_INDEXES = ACCESS_PATH_INDEXES | {"ix_appointments_series_id"}
+
+# Indexes whose concurrent build was interrupted, which PostgreSQL leaves
+# behind unusable
+INVALID_INDEXES_QUERY = (
+    "SELECT class.relname FROM pg_index JOIN pg_class class ON class.oid = pg_index.indexrelid "
+    "WHERE NOT pg_index.indisvalid"
+)
+
+
+def _create_indexes(connection: Connection, table: Table, names: Set[str]) -> None:
+    if connection.dialect.name == "postgresql":
+        names = names - CONCURRENT_INDEXES
+    for index in table.indexes:
+        if index.name in names:
+            index.create(bind=connection, checkfirst=True)
+
+
+def concurrent_indexes() -> List[Index]:
+    """Copies of CONCURRENT_INDEXES that PostgreSQL creates and drops concurrently."""
+    indexes = []
+    for table in (Appointment.__table__, Availability.__table__):
+        # Copied so the models' own indexes stay usable in create_all
+        for index in table.to_metadata(MetaData()).indexes:
+            if index.name in CONCURRENT_INDEXES:
+                index.dialect_kwargs["postgresql_concurrently"] = True
+                indexes.append(index)
+    return indexes
+
+
+def _create_indexes_concurrently(engine: Engine) -> None:
+    with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as connection:
+        # A session lock, as there is no transaction to hold one
+        connection.execute(text("SELECT pg_advisory_lock(:key)"), {"key": MIGRATION_LOCK_KEY})
+        try:
+            invalid = set(connection.execute(text(INVALID_INDEXES_QUERY)).scalars())
+            for index in concurrent_indexes():
+                if index.name in invalid:
+                    logger.info(f"Rebuilding interrupted index {index.name}")
+                    connection.execute(DropIndex(index, if_exists=True))
+                index.create(bind=connection, checkfirst=True)
+        finally:
+            connection.execute(text("SELECT pg_advisory_unlock(:key)"), {"key": MIGRATION_LOCK_KEY})
+
+
+def _create_access_path_indexes(connection: Connection) -> None:
+    for table in (Appointment.__table__, Availability.__table__):
+        _create_indexes(connection, table, ACCESS_PATH_INDEXES)
+
+
+def _add_appointment_series(connection: Connection) -> None:
+    AppointmentSeries.__table__.create(bind=connection, checkfirst=True)
+    columns = {column["name"] for column in inspect(connection).get_columns("appointments")}
+    if "series_id" not in columns:
+        connection.execute(text(
+            "ALTER TABLE appointments ADD COLUMN series_id INTEGER REFERENCES appointment_series (id)"
+        ))
+    _create_indexes(connection, Appointment.__table__, {"ix_appointments_series_id"})
+
+
+def _add_calendar_versions(connection: Connection) -> None:
+    CalendarVersion.__table__.create(bind=connection, checkfirst=True)
+
+
+MIGRATIONS: List[Tuple[int, str, Callable[[Connection], None]]] = [
+    (1, "initial schema", _create_schema),
+    (2, "composite and partial indexes for appointment and availability lookups", _create_access_path_indexes),
+    (3, "recurring appointment series", _add_appointment_series),
+    (4, "per-owner calendar change counters", _add_calendar_versions),
+]
+
+
+def run_migrations(engine: Engine) -> List[int]:
+    """
+    Apply pending migrations in version order inside a single transaction and
+    return the versions applied. On PostgreSQL an advisory lock makes
+    replicas starting at the same time wait for each other, and the
+    CONCURRENT_INDEXES are then built outside the transaction.
+    """
+    applied_now = []
+    with engine.begin() as connection:
+        if connection.dialect.name == "postgresql":
+            connection.execute(text("SELECT pg_advisory_xact_lock(:key)"), {"key": MIGRATION_LOCK_KEY})
+
+        schema_migrations.create(bind=connection, checkfirst=True)
+        applied = set(connection.execute(select(schema_migrations.c.version)).scalars())
+
+        for version, description, migrate in MIGRATIONS:
+            if version in applied:
+                continue
+            logger.info(f"Applying migration {version}: {description}")
+            migrate(connection)
+            connection.execute(
+                schema_migrations.insert().values(version=version, description=description)
+            )
+            applied_now.append(version)
+
+    if engine.dialect.name == "postgresql":
+        _create_indexes_concurrently(engine)
+    return applied_now
+
+
+if __name__ == "__main__":
+    # Run once per deployment before the app starts: python -m app.db.migrations
+    from app.db.session import engine
+
+    logging.basicConfig(level=logging.INFO)
+    logger.info(f"Applied migrations {run_migrations(engine)}")
@@ -1,4 +1,4 @@
-from sqlalchemy import Boolean, Column, ForeignKey, Integer, String, DateTime, Date, Time, Text
+from sqlalchemy import Boolean, Column, ForeignKey, Index, Integer, String, DateTime, Date, Time, Text, text
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
@@ -80,6 +80,25 @@ class Availability(Base):
     # Relationships
     doctor = relationship("Doctor", back_populates="availabilities")
 
+    __table_args__ = (
+        Index("ix_availabilities_doctor_id_day_of_week", "doctor_id", "day_of_week"),
+    )
+
+class AppointmentSeries(Base):
+    __tablename__ = "appointment_series"
+
+    id = Column(Integer, primary_key=True, index=True)
+    patient_id = Column(Integer, ForeignKey("patients.id"))
+    doctor_id = Column(Integer, ForeignKey("doctors.id"))
+    frequency = Column(String)  # daily or weekly
+    interval = Column(Integer, default=1)
+    count = Column(Integer)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    updated_at = Column(DateTime(timezone=True), onupdate=func.now())
+
+    # Relationships
+    appointments = relationship("Appointment", back_populates="series", order_by="Appointment.start_time")
+
 class Appointment(Base):
     __tablename__ = "appointments"
 
@@ -90,14 +109,37 @@ class Appointment(Base):
     end_time = Column(DateTime(timezone=True))
     status = Column(String)
     notes = Column(Text, nullable=True)
+    series_id = Column(Integer, ForeignKey("appointment_series.id"), nullable=True, index=True)
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     updated_at = Column(DateTime(timezone=True), onupdate=func.now())
 
     # Relationships
     patient = relationship("Patient", back_populates="appointments")
     doctor = relationship("Doctor", back_populates="appointments")
+    series = relationship("AppointmentSeries", back_populates="appointments")
     medical_records = relationship("MedicalRecord", back_populates="appointment")
 
+    __table_args__ = (
+        Index("ix_appointments_doctor_id_start_time", "doctor_id", "start_time"),
+        Index("ix_appointments_patient_id_start_time", "patient_id", "start_time"),
+        Index("ix_appointments_start_time_id", "start_time", "id"),
+        Index("ix_appointments_status", "status"),
+        # Conflict and free-slot lookups only ever look at live appointments
+        Index(
+            "ix_appointments_active_doctor_id_start_time", "doctor_id", "start_time", "end_time",
+            postgresql_where=text("status <> 'cancelled'"),
+            sqlite_where=text("status <> 'cancelled'")
+        ),
+    )
+
+class CalendarVersion(Base):
+    """Change counter of a doctor's or patient's appointments, bumped by every appointment write."""
+    __tablename__ = "calendar_versions"
+
+    owner_type = Column(String, primary_key=True)  # doctor or patient
+    owner_id = Column(Integer, primary_key=True)
+    version = Column(Integer, nullable=False, default=0)
+
 class MedicalRecord(Base):
     __tablename__ = "medical_records"
 
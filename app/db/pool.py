@@ -0,0 +1,61 @@
+import time
+from typing import Any, Dict
+
+from sqlalchemy.engine import make_url
+from sqlalchemy.pool import AsyncAdaptedQueuePool, QueuePool
+
+from app.core.config import settings
+from app.core.metrics import record_db_pool, record_db_pool_checkout
+
+
+class InstrumentedPoolMixin:
+    """
+    Reports a queue pool's usage after every checkout and checkin, and how
+    long each checkout took, labelled with the pool's logging name.
+
+    Usage is read once the pool has handed a connection out or taken it
+    back; the pool's `checkin` event fires before the connection is back in
+    the queue, so its counts would be off by one.
+    """
+
+    def _record_usage(self) -> None:
+        record_db_pool(self.logging_name, self.checkedout(), self.checkedin(), max(self.overflow(), 0))
+
+    def connect(self):
+        started = time.perf_counter()
+        try:
+            return super().connect()
+        finally:
+            record_db_pool_checkout(self.logging_name, time.perf_counter() - started)
+            self._record_usage()
+
+    def _return_conn(self, record) -> None:
+        super()._return_conn(record)
+        self._record_usage()
+
+
+class InstrumentedQueuePool(InstrumentedPoolMixin, QueuePool):
+    pass
+
+
+class InstrumentedAsyncQueuePool(InstrumentedPoolMixin, AsyncAdaptedQueuePool):
+    pass
+
+
+def pool_options(url: str, name: str, is_async: bool = False) -> Dict[str, Any]:
+    """
+    create_engine() pool arguments from the DB_POOL_* settings. SQLite, used
+    for development and tests, keeps the dialect's default pool.
+    """
+    if make_url(url).get_backend_name() == "sqlite":
+        return {}
+    return {
+        "poolclass": InstrumentedAsyncQueuePool if is_async else InstrumentedQueuePool,
+        "pool_size": settings.DB_POOL_SIZE,
+        "max_overflow": settings.DB_MAX_OVERFLOW,
+        "pool_timeout": settings.DB_POOL_TIMEOUT_SECONDS,
+        "pool_recycle": settings.DB_POOL_RECYCLE_SECONDS,
+        "pool_pre_ping": settings.DB_POOL_PRE_PING,
+        # Recreated pools keep the name, which labels their metrics
+        "pool_logging_name": name,
+    }
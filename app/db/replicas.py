@@ -0,0 +1,217 @@
+import itertools
+import logging
+import threading
+from typing import List, Optional, Union
+
+from sqlalchemy import text
+from sqlalchemy.engine import Engine
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession
+from sqlalchemy.orm import Session
+
+from app.core.config import settings
+from app.core.metrics import record_db_replica
+
+logger = logging.getLogger(__name__)
+
+ROUND_ROBIN = "round_robin"
+LEAST_CONNECTIONS = "least_connections"
+
+# PostgreSQL lag is measured against the primary's WAL position: a standby
+# that has replayed up to it is not behind however quiet the primary is,
+# and one that has not is behind by the age of its last replayed commit.
+# Other databases are only checked for reachability.
+PRIMARY_LSN_QUERY = "SELECT pg_current_wal_lsn()"
+REPLICA_LAG_QUERY = (
+    "SELECT (SELECT status FROM pg_stat_wal_receiver), "
+    "pg_last_wal_replay_lsn() >= CAST(:primary_lsn AS pg_lsn), "
+    "EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp())"
+)
+
+
+class Replica:
+    """A read replica's engines and its last known health."""
+
+    def __init__(self, name: str, engine: Engine, async_engine: AsyncEngine):
+        self.name = name
+        self.engine = engine
+        self.async_engine = async_engine
+        self.healthy = True
+        self.lag: Optional[float] = None
+        # Sessions currently reading from this replica
+        self.sessions = 0
+
+
+class ReplicaSet:
+    """
+    Read replicas that sessions are balanced across, round-robin or to the
+    replica with the fewest sessions reading from it.
+
+    A background thread measures every replica's lag behind `primary` each
+    `check_interval` seconds. Replicas more than `max_lag` seconds behind,
+    unreachable, or no longer receiving WAL are ejected until a later check
+    finds them caught up again. The thread starts with the first session
+    that asks for a replica.
+    """
+
+    def __init__(
+        self,
+        replicas: List[Replica],
+        primary: Optional[Engine] = None,
+        balancing: str = settings.DATABASE_REPLICA_BALANCING,
+        max_lag: float = settings.DATABASE_REPLICA_MAX_LAG_SECONDS,
+        check_interval: float = settings.DATABASE_REPLICA_CHECK_INTERVAL_SECONDS
+    ):
+        if balancing not in (ROUND_ROBIN, LEAST_CONNECTIONS):
+            raise ValueError(f"Unknown replica balancing {balancing}")
+        self.replicas = replicas
+        self.primary = primary
+        self.balancing = balancing
+        self.max_lag = max_lag
+        self.check_interval = check_interval
+        self._counter = itertools.count()
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+        self._stopped = threading.Event()
+
+    def _start(self) -> None:
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="replica-lag-check", daemon=True)
+            self._thread.start()
+
+    def _run(self) -> None:
+        self.check()
+        while not self._stopped.wait(self.check_interval):
+            self.check()
+
+    def stop(self) -> None:
+        self._stopped.set()
+        if self._thread is not None:
+            self._thread.join()
+
+    def acquire(self) -> Optional[Replica]:
+        """A healthy replica for a session to read from, or None to use the primary."""
+        if not self.replicas:
+            return None
+        self._start()
+        with self._lock:
+            healthy = [replica for replica in self.replicas if replica.healthy]
+            if not healthy:
+                return None
+            if self.balancing == LEAST_CONNECTIONS:
+                replica = min(healthy, key=lambda replica: replica.sessions)
+            else:
+                replica = healthy[next(self._counter) % len(healthy)]
+            replica.sessions += 1
+            return replica
+
+    def release(self, replica: Replica) -> None:
+        with self._lock:
+            replica.sessions -= 1
+
+    def measure_lag(self, replica: Replica) -> Optional[float]:
+        """Seconds `replica` is behind the primary, or None if it is not replicating."""
+        if replica.engine.dialect.name != "postgresql" or self.primary is None:
+            with replica.engine.connect() as connection:
+                connection.execute(text("SELECT 1"))
+            return 0.0
+
+        with self.primary.connect() as connection:
+            primary_lsn = connection.execute(text(PRIMARY_LSN_QUERY)).scalar()
+        with replica.engine.connect() as connection:
+            status, caught_up, lag = connection.execute(
+                text(REPLICA_LAG_QUERY), {"primary_lsn": primary_lsn}
+            ).one()
+
+        # A stopped receiver replays nothing new, so it would look caught up
+        if status != "streaming":
+            logger.error(f"Replica {replica.name} WAL receiver is {status or 'not running'}")
+            return None
+        if caught_up:
+            return 0.0
+        # Behind without having replayed any commit yet
+        return float("inf") if lag is None else float(lag)
+
+    def check(self) -> None:
+        """Measure every replica's lag and eject or readmit it."""
+        for replica in self.replicas:
+            try:
+                lag = self.measure_lag(replica)
+            except SQLAlchemyError as e:
+                logger.error(f"Replica {replica.name} lag check failed: {e}")
+                lag = None
+
+            healthy = lag is not None and lag <= self.max_lag
+            if healthy != replica.healthy:
+                if healthy:
+                    logger.info(f"Replica {replica.name} readmitted, {lag:.1f}s behind")
+                else:
+                    behind = "unavailable" if lag is None else f"{lag:.1f}s behind"
+                    logger.warning(f"Replica {replica.name} ejected, {behind}")
+            replica.lag, replica.healthy = lag, healthy
+            record_db_replica(replica.name, lag, healthy)
+
+
+class RoutingSession(Session):
+    """
+    Session that sends plain SELECTs to a replica when `replica_reads` is set.
+
+    The replica is picked from `replicas` at the session's first read and
+    kept for the rest of it. Flushes and every other statement go to the
+    primary, and once the session has sent one there all its later reads
+    do too, so a request sees its own writes. Without a healthy replica
+    everything goes to the primary. `is_async` sessions are the sync
+    sessions behind an AsyncSession and route to the replicas' async
+    engines.
+
+    Reads whose results fill a cache call `read_from_primary` first: a
+    replica that has not replayed a write yet would put the state the
+    write just invalidated back into the cache.
+    """
+
+    def __init__(
+        self, *args, replicas: Optional[ReplicaSet] = None, replica_reads: bool = False,
+        is_async: bool = False, **kwargs
+    ):
+        super().__init__(*args, **kwargs)
+        self.replicas = replicas
+        self.replica_reads = replica_reads
+        self.is_async = is_async
+        self.replica: Optional[Replica] = None
+        self.used_primary = False
+
+    def get_bind(self, mapper=None, clause=None, **kwargs):
+        if self._flushing or (clause is not None and not getattr(clause, "is_select", False)):
+            self.used_primary = True
+        elif self.replica_reads and not self.used_primary and clause is not None and self.replicas is not None:
+            if self.replica is None:
+                self.replica = self.replicas.acquire()
+            if self.replica is not None:
+                return self.replica.async_engine.sync_engine if self.is_async else self.replica.engine
+        return super().get_bind(mapper=mapper, clause=clause, **kwargs)
+
+    def read_from_primary(self) -> None:
+        """Send this and every later read of the session to the primary."""
+        if self.replica is not None and not self.used_primary:
+            # Objects already loaded from the replica may be behind
+            self.expire_all()
+        self.used_primary = True
+
+    def close(self) -> None:
+        try:
+            super().close()
+        finally:
+            if self.replica is not None:
+                self.replicas.release(self.replica)
+                self.replica = None
+            self.used_primary = False
+
+
+def read_from_primary(db: Union[Session, AsyncSession]) -> None:
+    """
+    Send the rest of a session's reads to the primary, before loading what
+    goes into a cache. Sessions that do not route reads are left alone.
+    """
+    session = db.sync_session if isinstance(db, AsyncSession) else db
+    if isinstance(session, RoutingSession):
+        session.read_from_primary()
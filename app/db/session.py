@@ -1,18 +1,73 @@
+from typing import Tuple
+
+from fastapi import Request
 from sqlalchemy import create_engine
+from sqlalchemy.engine import URL, Engine, make_url
+from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession, async_sessionmaker, create_async_engine
 from sqlalchemy.orm import sessionmaker
 
+from app.core.cache import may_cache
 from app.core.config import settings
+from app.core.query_metrics import instrument_engine
+from app.db.pool import pool_options
+from app.db.replicas import Replica, ReplicaSet, RoutingSession
+
+# asyncio drivers of the database backends DATABASE_URL may point at
+ASYNC_DRIVERS = {"postgresql": "postgresql+asyncpg", "sqlite": "sqlite+aiosqlite"}
+
+# Requests whose sessions may read from a replica
+READ_METHODS = ("GET", "HEAD")
+
+
+def async_database_url(url: str) -> URL:
+    """The URL of the same database through its asyncio driver."""
+    url = make_url(url)
+    return url.set(drivername=ASYNC_DRIVERS.get(url.get_backend_name(), url.drivername))
+
+
+def create_engines(url: str, name: str) -> Tuple[Engine, AsyncEngine]:
+    """Instrumented sync and async engines of one database; `name` labels their metrics."""
+    sync_engine = create_engine(url, **pool_options(url, name))
+    instrument_engine(sync_engine)
+    asyncio_engine = create_async_engine(async_database_url(url), **pool_options(url, f"{name}_async", is_async=True))
+    instrument_engine(asyncio_engine.sync_engine)
+    return sync_engine, asyncio_engine
 
-# Create SQLAlchemy engine
-engine = create_engine(settings.DATABASE_URL)
 
-# Create SessionLocal class
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+# Create SQLAlchemy engines; the async engine serves `async def` routes
+engine, async_engine = create_engines(settings.DATABASE_URL, "primary")
+
+# Read replicas for GET requests, if any are configured
+replicas = ReplicaSet([
+    Replica(f"replica{i}", *create_engines(url, f"replica{i}"))
+    for i, url in enumerate(settings.DATABASE_REPLICA_URLS)
+], primary=engine)
+
+# Create SessionLocal class; sessions use the primary unless created with
+# replica_reads=True
+SessionLocal = sessionmaker(
+    class_=RoutingSession, autocommit=False, autoflush=False, bind=engine, replicas=replicas
+)
+
+# Objects stay usable after commit since async sessions cannot lazy-load
+# expired attributes
+AsyncSessionLocal = async_sessionmaker(
+    async_engine, sync_session_class=RoutingSession, autoflush=False, expire_on_commit=False,
+    replicas=replicas, is_async=True
+)
+
+def replica_reads(request: Request) -> bool:
+    """Whether the request's sessions may read from a replica."""
+    return request.method in READ_METHODS and not may_cache(request)
 
 # Database dependency
-def get_db():
-    db = SessionLocal()
+def get_db(request: Request):
+    db = SessionLocal(replica_reads=replica_reads(request))
     try:
         yield db
     finally:
         db.close()
+
+async def get_async_db(request: Request):
+    async with AsyncSessionLocal(replica_reads=replica_reads(request)) as db:
+        yield db
@@ -3,24 +3,85 @@ from fastapi.middleware.cors import CORSMiddleware
 from fastapi.openapi.utils import get_openapi
 from sqlalchemy.orm import Session
 import uvicorn
+import asyncio
+import logging
 import os
+from contextlib import asynccontextmanager
 from app.api.routes import patient_router, doctor_router, appointment_router, auth_router
+from app.core.cache import CACHE_STATUS_HEADER, CacheMiddleware
+from app.core.compression import CompressionMiddleware
 from app.core.config import settings
-from app.db.session import engine, get_db
-from app.db import models
+from app.core.pagination import NEXT_CURSOR_HEADER
+from app.core.query_metrics import QueryBudgetMiddleware
+from app.core.rate_limiter import RATE_LIMIT_HEADERS, RateLimiter, token_buckets
+from app.core.redis_client import redis_client
+from app.db.session import SessionLocal, async_engine, engine, get_db, replicas
+from app.crud.crud_doctor import doctor
 from app.api.deps import get_current_user
 
 # Import metrics (Prometheus)
 from app.core.metrics import PrometheusMiddleware, metrics_endpoint, set_app_info
 
-models.Base.metadata.create_all(bind=engine)
+logger = logging.getLogger(__name__)
+
+def warm_doctor_cache():
+    """Load the doctor directory into the doctor cache's Redis tier, if it has one, before serving traffic."""
+    db = SessionLocal()
+    try:
+        logger.info(f"Warmed doctor cache with {doctor.warm_cache(db)} doctors")
+    except Exception as e:
+        logger.error(f"Doctor cache warm-up failed: {e}")
+    finally:
+        db.close()
+
+def stop_background_threads():
+    """Flush the local rate limit buckets and stop their sync and the replica lag checks."""
+    if rate_limit_buckets is not None:
+        rate_limit_buckets.stop()
+    replicas.stop()
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """
+    Warm the doctor cache and hold the shared asyncio Redis pool open while
+    serving; on shutdown stop the background threads and close the pools.
+    """
+    await asyncio.to_thread(warm_doctor_cache)
+    await redis_client.connect()
+    try:
+        yield
+    finally:
+        await asyncio.to_thread(stop_background_threads)
+        await redis_client.close()
+        for replica in replicas.replicas:
+            await replica.async_engine.dispose()
+            replica.engine.dispose()
+        await async_engine.dispose()
+        engine.dispose()
 
 app = FastAPI(
     title="Healthcare Appointment System",
     description="API for managing healthcare appointments",
     version="1.0.0",
+    lifespan=lifespan,
 )
 
+# Cache tagged GET responses in Redis
+if settings.RESPONSE_CACHE_ENABLED:
+    app.add_middleware(CacheMiddleware)
+
+# Compress large uncached responses; cache hits arrive already compressed
+app.add_middleware(CompressionMiddleware)
+
+# Per-user, per-role and per-route token buckets in Redis, created here so
+# the lifespan can stop them
+rate_limit_buckets = token_buckets() if settings.RATE_LIMIT_ENABLED else None
+if rate_limit_buckets is not None:
+    app.add_middleware(RateLimiter, buckets=rate_limit_buckets)
+
+# Warn about requests running more queries than DB_QUERY_BUDGET
+app.add_middleware(QueryBudgetMiddleware)
+
 # Add Prometheus metrics middleware
 app.add_middleware(PrometheusMiddleware)
 
@@ -36,6 +97,7 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=[NEXT_CURSOR_HEADER, CACHE_STATUS_HEADER, "ETag", *RATE_LIMIT_HEADERS],
 )
 
 # Metrics endpoint for Prometheus scraping
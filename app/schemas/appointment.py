@@ -33,6 +33,7 @@ class AppointmentUpdate(BaseModel):
 # Properties shared by models stored in DB
 class AppointmentInDBBase(AppointmentBase):
     id: int
+    series_id: Optional[int] = None
     created_at: datetime
     updated_at: Optional[datetime] = None
 
@@ -53,3 +54,63 @@ class AppointmentDetail(Appointment):
     doctor_name: str
     doctor_specialization: str
 
+
+# Bulk booking
+class AppointmentBatchCreate(BaseModel):
+    appointments: List[AppointmentCreate] = Field(..., min_length=1, max_length=5000)
+
+class AppointmentBatchItemResult(BaseModel):
+    index: int
+    success: bool
+    appointment: Optional[Appointment] = None
+    error: Optional[str] = None
+
+class AppointmentBatchResult(BaseModel):
+    created: int
+    failed: int
+    results: List[AppointmentBatchItemResult]
+
+# Slot holds
+class SlotHoldCreate(BaseModel):
+    doctor_id: int
+    start_time: datetime
+    end_time: datetime
+    ttl_seconds: Optional[int] = Field(None, ge=1)
+
+class SlotHold(BaseModel):
+    id: str
+    doctor_id: int
+    start_time: datetime
+    end_time: datetime
+    expires_at: datetime
+
+    class Config:
+        orm_mode = True
+
+# Recurring series
+class RecurrenceFrequency(str, Enum):
+    DAILY = "daily"
+    WEEKLY = "weekly"
+
+class AppointmentSeriesCreate(AppointmentBase):
+    frequency: RecurrenceFrequency = RecurrenceFrequency.WEEKLY
+    interval: int = Field(1, ge=1, le=52)
+    count: int = Field(..., ge=2, le=260)
+
+class AppointmentSeriesUpdate(BaseModel):
+    status: Optional[AppointmentStatus] = None
+    notes: Optional[str] = None
+
+class AppointmentSeries(BaseModel):
+    id: int
+    patient_id: int
+    doctor_id: int
+    frequency: RecurrenceFrequency
+    interval: int
+    count: int
+    created_at: datetime
+    updated_at: Optional[datetime] = None
+    appointments: List[Appointment] = []
+
+    class Config:
+        orm_mode = True
@@ -45,6 +45,21 @@ class User(UserInDBBase):
 class UserInDB(UserInDBBase):
     hashed_password: str
 
+# Authenticated user as resolved by get_current_user; role is kept as a
+# plain string so it compares and formats like the database column
+class Principal(BaseModel):
+    id: int
+    email: str
+    username: str
+    role: str
+    is_active: bool
+    reference_id: Optional[int] = None
+    created_at: datetime
+    updated_at: Optional[datetime] = None
+
+    class Config:
+        orm_mode = True
+
 # Token schemas
 class Token(BaseModel):
     access_token: str
@@ -1,14 +1,33 @@
+import csv
+import io
+import json
+import secrets
 import pytest
 from fastapi.testclient import TestClient
 from sqlalchemy import create_engine
 from sqlalchemy.orm import sessionmaker
-from datetime import datetime, timedelta
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+from sqlalchemy.pool import NullPool
+from datetime import datetime, timedelta, timezone
 
 from app.main import app
+import app.main as main_module
+import app.api.deps as deps
+import app.api.routes.appointment as appointment_routes
 from app.db.models import Base
-from app.db.session import get_db
+from app.db.session import get_async_db, get_db
 from app.schemas.user import UserCreate, UserRole
 from app.crud.crud_user import user
+from app.core.day_bitmap import schedule_cache
+from app.core.interval_index import appointment_index
+from app.core.two_tier_cache import doctor_cache
+from app.core.principal_cache import principals, verified_tokens
+from app.core import cache as cache_module
+from app.core.cache import CACHE_STATUS_HEADER, CacheMiddleware, ResponseCache
+from app.core.config import settings
+from app.core.redis_client import redis_client
+from app.core.slot_holds import SlotHold, SlotHoldStore
+from app.schemas.user import UserUpdate
 SQLALCHEMY_DATABASE_URL = "sqlite:///./test.db"
 engine = create_engine(SQLALCHEMY_DATABASE_URL, connect_args={"check_same_thread": False})
 TestingSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
@@ -20,13 +39,84 @@ def override_get_db():
     finally:
         db.close()
 
+# TestClient runs each request on a fresh event loop, so async connections
+# cannot be pooled across requests
+async_engine = create_async_engine("sqlite+aiosqlite:///./test.db", poolclass=NullPool)
+TestingAsyncSessionLocal = async_sessionmaker(async_engine, autoflush=False, expire_on_commit=False)
+
+async def override_get_async_db():
+    async with TestingAsyncSessionLocal() as db:
+        yield db
+
+class MemorySlotHoldStore(SlotHoldStore):
+    """Slot holds kept in a dict instead of Redis."""
+
+    def __init__(self):
+        self.holds = {}
+
+    def acquire(self, doctor_id, start_time, end_time, ttl=settings.SLOT_HOLD_SECONDS):
+        if self.is_blocked(doctor_id, start_time, end_time):
+            return None
+        expires_at = datetime.now(timezone.utc) + timedelta(seconds=ttl)
+        hold = SlotHold(secrets.token_urlsafe(16), doctor_id, start_time, end_time, expires_at)
+        self.holds[hold.id] = hold
+        return hold
+
+    def get(self, hold_id):
+        return self.holds.get(hold_id)
+
+    def release(self, hold_id):
+        return self.holds.pop(hold_id, None) is not None
+
+    def active(self, doctor_id):
+        now = datetime.now(timezone.utc)
+        return [hold for hold in self.holds.values() if hold.doctor_id == doctor_id and hold.expires_at > now]
+
+class MemoryResponseCache(ResponseCache):
+    """Cached responses kept in dicts instead of Redis."""
+
+    def __init__(self):
+        self.ttl = 60
+        self.entries = {}
+        self.tags = {}
+
+    async def get(self, key):
+        return self.entries.get(key)
+
+    async def set(self, key, data, tags, ttl=None):
+        self.entries[key] = data
+        for tag in tags:
+            self.tags.setdefault(tag, set()).add(key)
+
+    def invalidate(self, tags):
+        for tag in tags:
+            for key in self.tags.pop(tag, set()):
+                self.entries.pop(key, None)
+
+    async def acquire_lock(self, key):
+        return "token"
+
+    async def release_lock(self, key, token):
+        pass
+
+slot_holds = MemorySlotHoldStore()
+appointment_routes.slot_holds = slot_holds
+
 app.dependency_overrides[get_db] = override_get_db
+app.dependency_overrides[get_async_db] = override_get_async_db
+deps.AsyncSessionLocal = TestingAsyncSessionLocal
 
 client = TestClient(app)
 
 @pytest.fixture(scope="module")
 def test_db():
     Base.metadata.create_all(bind=engine)
+    appointment_index.invalidate()
+    schedule_cache.invalidate()
+    doctor_cache.clear_local()
+    slot_holds.holds.clear()
+    principals.invalidate()
+    verified_tokens.clear()
     yield
     Base.metadata.drop_all(bind=engine)
 
@@ -110,6 +200,25 @@ def test_health_check():
     assert data["service"] == "healthcare-api"
     assert data["version"] == "1.0.0"
 
+def test_lifespan(monkeypatch):
+    warmed, stopped = [], []
+
+    class RecordingBuckets:
+        def stop(self):
+            stopped.append("rate_limit_buckets")
+
+    monkeypatch.setattr(main_module, "warm_doctor_cache", lambda: warmed.append(True))
+    monkeypatch.setattr(main_module, "rate_limit_buckets", RecordingBuckets())
+    monkeypatch.setattr(main_module.replicas, "stop", lambda: stopped.append("replicas"))
+    with TestClient(app) as lifespan_client:
+        assert warmed == [True]
+        assert lifespan_client.get("/health").status_code == 200
+        assert stopped == []
+    # The background threads are stopped and the shared Redis pool is closed
+    # on shutdown
+    assert stopped == ["rate_limit_buckets", "replicas"]
+    assert redis_client._redis is None
+
 def test_create_patient(admin_token):
     patient_data = {
         "first_name": "Alice",
@@ -214,3 +323,428 @@ def test_get_doctor_available_slots(admin_token, doctor_data):
         assert "start_time" in slot
         assert "end_time" in slot
         assert "is_available" in slot
+
+def test_get_first_available_slots(admin_token, doctor_data):
+    tomorrow = datetime.now() + timedelta(days=1)
+    while tomorrow.weekday() != 1:
+        tomorrow += timedelta(days=1)
+
+    response = client.get(
+        f"/api/appointments/specialization/{doctor_data['specialization']}/first-available",
+        params={
+            "start_date": tomorrow.date().isoformat(),
+            "end_date": (tomorrow + timedelta(days=6)).date().isoformat(),
+            "limit": 3
+        },
+        headers={"Authorization": f"Bearer {admin_token}"}
+    )
+
+    assert response.status_code == 200
+    data = response.json()
+    # The 10:00 slot was booked by test_create_appointment
+    assert [slot["start_time"][11:16] for slot in data] == ["09:00", "09:30", "10:30"]
+    assert all(slot["doctor_id"] == doctor_data["id"] for slot in data)
+
+def test_create_appointments_batch(admin_token, patient_data, doctor_data):
+    day = datetime.now() + timedelta(days=8)
+    while day.weekday() != 1:
+        day += timedelta(days=1)
+
+    def item(hour, minute, length=30):
+        start_time = day.replace(hour=hour, minute=minute, second=0, microsecond=0)
+        return {
+            "patient_id": patient_data["id"],
+            "doctor_id": doctor_data["id"],
+            "start_time": start_time.isoformat(),
+            "end_time": (start_time + timedelta(minutes=length)).isoformat()
+        }
+
+    response = client.post(
+        "/api/appointments/batch",
+        json={"appointments": [
+            item(9, 0),
+            item(9, 15),   # overlaps the first item of the batch
+            item(18, 0),   # outside the doctor's availability
+            item(9, 30),
+            {**item(10, 30), "patient_id": 999999},   # unknown patient
+            item(11, 30),
+        ]},
+        headers={"Authorization": f"Bearer {admin_token}"}
+    )
+
+    assert response.status_code == 200
+    data = response.json()
+    assert data["created"] == 3
+    assert data["failed"] == 3
+    assert [result["success"] for result in data["results"]] == [True, False, False, True, False, True]
+    assert data["results"][0]["appointment"]["id"] is not None
+    assert "conflict" in data["results"][1]["error"]
+    assert "not available" in data["results"][2]["error"]
+    assert data["results"][4]["error"] == "Patient not found"
+
+def test_appointment_series(admin_token, patient_data, doctor_data):
+    headers = {"Authorization": f"Bearer {admin_token}"}
+    day = datetime.now() + timedelta(days=30)
+    while day.weekday() != 1:
+        day += timedelta(days=1)
+    start_time = day.replace(hour=11, minute=0, second=0, microsecond=0)
+    series = {
+        "patient_id": patient_data["id"],
+        "doctor_id": doctor_data["id"],
+        "start_time": start_time.isoformat(),
+        "end_time": (start_time + timedelta(minutes=30)).isoformat(),
+        "frequency": "weekly",
+        "count": 4
+    }
+
+    response = client.post("/api/appointments/series", json=series, headers=headers)
+    assert response.status_code == 200
+    data = response.json()
+    assert [appointment["start_time"] for appointment in data["appointments"]] == [
+        (start_time + timedelta(weeks=week)).isoformat() for week in range(4)
+    ]
+    assert {appointment["series_id"] for appointment in data["appointments"]} == {data["id"]}
+
+    # Overlapping series are rejected as a whole
+    response = client.post(
+        "/api/appointments/series",
+        json={**series, "start_time": (start_time + timedelta(weeks=3)).isoformat(),
+              "end_time": (start_time + timedelta(weeks=3, minutes=30)).isoformat()},
+        headers=headers
+    )
+    assert response.status_code == 400
+    assert len(response.json()["detail"]) == 1
+
+    # Completed occurrences are left alone when the series is cancelled
+    first_id = data["appointments"][0]["id"]
+    client.put(f"/api/appointments/{first_id}/status", params={"status": "completed"}, headers=headers)
+
+    response = client.delete(f"/api/appointments/series/{data['id']}", headers=headers)
+    assert response.status_code == 200
+    assert [appointment["status"] for appointment in response.json()["appointments"]] == [
+        "completed", "cancelled", "cancelled", "cancelled"
+    ]
+
+    # Cancelled times are free again
+    response = client.post(
+        "/api/appointments/",
+        json={key: series[key] for key in ("patient_id", "doctor_id")} | {
+            "start_time": (start_time + timedelta(weeks=1)).isoformat(),
+            "end_time": (start_time + timedelta(weeks=1, minutes=30)).isoformat()
+        },
+        headers=headers
+    )
+    assert response.status_code == 200
+
+def test_doctor_calendar_feed(admin_token, patient_data, doctor_data):
+    headers = {"Authorization": f"Bearer {admin_token}"}
+    url = f"/api/appointments/doctor/{doctor_data['id']}/calendar.ics"
+
+    response = client.get(url, headers=headers)
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/calendar")
+    assert response.text.startswith("BEGIN:VCALENDAR\r\n")
+    etag = response.headers["ETag"]
+
+    response = client.get(url, headers={**headers, "If-None-Match": etag})
+    assert response.status_code == 304
+
+    day = datetime.now() + timedelta(days=50)
+    while day.weekday() != 1:
+        day += timedelta(days=1)
+    start_time = day.replace(hour=14, minute=0, second=0, microsecond=0)
+    created = client.post(
+        "/api/appointments/",
+        json={
+            "patient_id": patient_data["id"],
+            "doctor_id": doctor_data["id"],
+            "start_time": start_time.isoformat(),
+            "end_time": (start_time + timedelta(minutes=30)).isoformat()
+        },
+        headers=headers
+    ).json()
+
+    # The booking bumps the doctor's feed version
+    response = client.get(url, headers={**headers, "If-None-Match": etag})
+    assert response.status_code == 200
+    assert response.headers["ETag"] != etag
+    assert f"UID:appointment-{created['id']}@healthcare-api" in response.text
+    assert f"DTSTART:{start_time.strftime('%Y%m%dT%H%M%SZ')}" in response.text
+
+def test_deactivated_user_is_rejected(test_db):
+    db = TestingSessionLocal()
+    staff_user = user.create(db, obj_in=UserCreate(
+        email="staff@example.com",
+        username="staff",
+        password="password",
+        role=UserRole.STAFF
+    ))
+
+    token = client.post(
+        "/api/auth/login",
+        data={"username": "staff@example.com", "password": "password"}
+    ).json()["access_token"]
+    headers = {"Authorization": f"Bearer {token}"}
+
+    # The second request is authenticated from the token and principal caches
+    assert client.get("/api/doctors/", headers=headers).status_code == 200
+    assert client.get("/api/doctors/", headers=headers).status_code == 200
+
+    user.update(db, db_obj=staff_user, obj_in=UserUpdate(is_active=False))
+    db.close()
+
+    response = client.get("/api/doctors/", headers=headers)
+    assert response.status_code == 400
+    assert response.json()["detail"] == "Inactive user"
+
+def test_async_routes_authenticate_without_a_sync_session(admin_token, monkeypatch):
+    def no_sync_session():
+        raise AssertionError("opened a sync session")
+        yield
+
+    monkeypatch.setitem(app.dependency_overrides, get_db, no_sync_session)
+    principals.invalidate()
+    response = client.get("/api/doctors/", headers={"Authorization": f"Bearer {admin_token}"})
+    assert response.status_code == 200
+
+def test_cursor_pagination(admin_token):
+    headers = {"Authorization": f"Bearer {admin_token}"}
+
+    everyone = client.get("/api/patients/", headers=headers).json()
+    assert len(everyone) >= 2
+
+    seen = []
+    params = {"limit": 1}
+    while True:
+        response = client.get("/api/patients/", params=params, headers=headers)
+        assert response.status_code == 200
+        seen.extend(patient["id"] for patient in response.json())
+        if "X-Next-Cursor" not in response.headers:
+            break
+        params = {"limit": 1, "cursor": response.headers["X-Next-Cursor"]}
+
+    assert seen == sorted(patient["id"] for patient in everyone)
+
+    response = client.get("/api/appointments/", params={"limit": 1}, headers=headers)
+    assert response.status_code == 200
+    first_page = response.json()
+    response = client.get(
+        "/api/appointments/",
+        params={"limit": 1, "cursor": response.headers["X-Next-Cursor"]},
+        headers=headers
+    )
+    assert response.status_code == 200
+    assert response.json()[0]["start_time"] >= first_page[0]["start_time"]
+    assert response.json()[0]["id"] != first_page[0]["id"]
+
+    response = client.get("/api/doctors/", params={"cursor": "not-a-cursor"}, headers=headers)
+    assert response.status_code == 400
+
+def test_export_appointments_and_patients(admin_token):
+    headers = {"Authorization": f"Bearer {admin_token}"}
+
+    response = client.get("/api/appointments/export", headers=headers)
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("application/x-ndjson")
+    rows = [json.loads(line) for line in response.text.splitlines()]
+    assert len(rows) > 0
+    assert {"id", "start_time", "patient_name", "doctor_name"} <= set(rows[0])
+
+    response = client.get("/api/patients/export", params={"format": "csv"}, headers=headers)
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/csv")
+    patients = list(csv.DictReader(io.StringIO(response.text)))
+    assert "john.doe@example.com" in {patient["email"] for patient in patients}
+
+def test_slot_hold(admin_token, patient_data, doctor_data):
+    headers = {"Authorization": f"Bearer {admin_token}"}
+    day = datetime.now() + timedelta(days=15)
+    while day.weekday() != 1:
+        day += timedelta(days=1)
+    start_time = day.replace(hour=15, minute=0, second=0, microsecond=0)
+    end_time = start_time + timedelta(minutes=30)
+    slot = {"doctor_id": doctor_data["id"], "start_time": start_time.isoformat(), "end_time": end_time.isoformat()}
+
+    response = client.post("/api/appointments/holds", json=slot, headers=headers)
+    assert response.status_code == 200
+    hold_id = response.json()["id"]
+
+    # A second hold on the same time is refused
+    response = client.post("/api/appointments/holds", json=slot, headers=headers)
+    assert response.status_code == 409
+
+    # Held slots are hidden from the available slots
+    response = client.get(
+        f"/api/appointments/doctor/{doctor_data['id']}/available-slots",
+        params={"date": start_time.isoformat()},
+        headers=headers
+    )
+    assert start_time.isoformat() not in {slot["start_time"] for slot in response.json()}
+
+    appointment_data = {**slot, "patient_id": patient_data["id"]}
+    response = client.post("/api/appointments/", json=appointment_data, headers=headers)
+    assert response.status_code == 409
+
+    response = client.post(
+        "/api/appointments/", json=appointment_data, params={"hold_id": hold_id}, headers=headers
+    )
+    assert response.status_code == 200
+
+    # Booking used up the hold
+    response = client.delete(f"/api/appointments/holds/{hold_id}", headers=headers)
+    assert response.status_code == 404
+
+def test_batch_items_respect_slot_holds(admin_token, patient_data, doctor_data):
+    headers = {"Authorization": f"Bearer {admin_token}"}
+    day = datetime.now() + timedelta(days=29)
+    while day.weekday() != 1:
+        day += timedelta(days=1)
+    start_time = day.replace(hour=14, minute=0, second=0, microsecond=0)
+    slot = {
+        "doctor_id": doctor_data["id"],
+        "start_time": start_time.isoformat(),
+        "end_time": (start_time + timedelta(minutes=30)).isoformat()
+    }
+
+    response = client.post("/api/appointments/holds", json=slot, headers=headers)
+    assert response.status_code == 200
+
+    later = {
+        **slot,
+        "start_time": (start_time + timedelta(hours=1)).isoformat(),
+        "end_time": (start_time + timedelta(hours=1, minutes=30)).isoformat()
+    }
+    response = client.post(
+        "/api/appointments/batch",
+        json={"appointments": [{**slot, "patient_id": patient_data["id"]}, {**later, "patient_id": patient_data["id"]}]},
+        headers=headers
+    )
+    assert response.status_code == 200
+    results = response.json()["results"]
+    assert [result["success"] for result in results] == [False, True]
+    assert "held" in results[0]["error"]
+
+def test_read_and_reschedule_appointment(admin_token, patient_data, doctor_data, monkeypatch):
+    monkeypatch.setattr(settings, "RESPONSE_CACHE_ENABLED", True)
+    headers = {"Authorization": f"Bearer {admin_token}"}
+    day = datetime.now() + timedelta(days=70)
+    while day.weekday() != 1:
+        day += timedelta(days=1)
+    start_time = day.replace(hour=9, minute=0, second=0, microsecond=0)
+
+    def slot(hour):
+        return {
+            "start_time": start_time.replace(hour=hour).isoformat(),
+            "end_time": start_time.replace(hour=hour, minute=30).isoformat()
+        }
+
+    def book(hour):
+        return client.post("/api/appointments/", json={
+            "patient_id": patient_data["id"], "doctor_id": doctor_data["id"], **slot(hour)
+        }, headers=headers).json()
+
+    booked = book(9)
+    book(11)
+
+    # The test app runs without CacheMiddleware, so the tags reach the client
+    response = client.get(f"/api/appointments/{booked['id']}", headers=headers)
+    assert response.status_code == 200
+    assert response.json()["id"] == booked["id"]
+    assert response.headers["X-Cache-Tags"] == (
+        f"appointment:{booked['id']} doctor:{doctor_data['id']} patient:{patient_data['id']}"
+    )
+
+    response = client.post("/api/appointments/holds", json={"doctor_id": doctor_data["id"], **slot(10)}, headers=headers)
+    assert response.status_code == 200
+    response = client.put(f"/api/appointments/{booked['id']}", json=slot(10), headers=headers)
+    assert response.status_code == 409
+
+    # Moving onto another booking is refused, moving to a free time is not
+    response = client.put(f"/api/appointments/{booked['id']}", json=slot(11), headers=headers)
+    assert response.status_code == 400
+    response = client.put(f"/api/appointments/{booked['id']}", json=slot(12), headers=headers)
+    assert response.status_code == 200
+    assert response.json()["start_time"] == slot(12)["start_time"]
+
+    # Slot responses stay fresh no longer than the hold shown in them
+    response = client.get(
+        f"/api/appointments/doctor/{doctor_data['id']}/available-slots",
+        params={"date": start_time.isoformat()},
+        headers=headers
+    )
+    assert 0 < int(response.headers["X-Cache-TTL"]) <= settings.SLOT_HOLD_SECONDS
+
+def test_patient_edits_invalidate_cached_appointments(admin_token, doctor_data, monkeypatch):
+    store = MemoryResponseCache()
+    monkeypatch.setattr(settings, "RESPONSE_CACHE_ENABLED", True)
+    monkeypatch.setattr(cache_module, "response_cache", store)
+    cached_client = TestClient(CacheMiddleware(app, cache=store, early_expiry_beta=0))
+    headers = {"Authorization": f"Bearer {admin_token}"}
+
+    patient_id = client.post("/api/patients/", json={
+        "first_name": "Cached",
+        "last_name": "Patient",
+        "date_of_birth": "1985-05-05",
+        "email": "cached.patient@example.com",
+        "phone": "1234567890",
+        "address": "1 Cache St"
+    }, headers=headers).json()["id"]
+    day = datetime.now() + timedelta(days=80)
+    while day.weekday() != 1:
+        day += timedelta(days=1)
+    start_time = day.replace(hour=9, minute=0, second=0, microsecond=0)
+    appointment_id = client.post("/api/appointments/", json={
+        "patient_id": patient_id,
+        "doctor_id": doctor_data["id"],
+        "start_time": start_time.isoformat(),
+        "end_time": (start_time + timedelta(minutes=30)).isoformat()
+    }, headers=headers).json()["id"]
+
+    def patient_names():
+        listed = cached_client.get("/api/appointments/", params={"start_date": start_time.isoformat()}, headers=headers)
+        detail = cached_client.get(f"/api/appointments/{appointment_id}", headers=headers)
+        names = {item["patient_name"] for item in listed.json() if item["id"] == appointment_id}
+        return {listed.headers[CACHE_STATUS_HEADER], detail.headers[CACHE_STATUS_HEADER]}, names | {detail.json()["patient_name"]}
+
+    assert patient_names() == ({"MISS"}, {"Cached Patient"})
+    assert patient_names() == ({"HIT"}, {"Cached Patient"})
+
+    client.put(f"/api/patients/{patient_id}", json={"last_name": "Renamed"}, headers=headers)
+    assert patient_names() == ({"MISS"}, {"Cached Renamed"})
+
+def test_conditional_requests(admin_token, patient_data, doctor_data):
+    headers = {"Authorization": f"Bearer {admin_token}"}
+
+    for path in ("/api/doctors/", f"/api/doctors/{doctor_data['id']}",
+                 "/api/patients/", f"/api/patients/{patient_data['id']}", "/api/appointments/"):
+        response = client.get(path, headers=headers)
+        assert response.status_code == 200
+        etag = response.headers["ETag"]
+        assert etag.startswith('W/"')
+
+        response = client.get(path, headers={**headers, "If-None-Match": etag})
+        assert response.status_code == 304
+        assert response.headers["ETag"] == etag
+        assert response.content == b""
+
+    # Writes change the ETag
+    patient_path = f"/api/patients/{patient_data['id']}"
+    etag = client.get(patient_path, headers=headers).headers["ETag"]
+    client.put(patient_path, json={"phone": "5550001111"}, headers=headers)
+    response = client.get(patient_path, headers={**headers, "If-None-Match": etag})
+    assert response.status_code == 200
+    assert response.headers["ETag"] != etag
+
+    etag = client.get("/api/appointments/", headers=headers).headers["ETag"]
+    day = datetime.now() + timedelta(days=22)
+    while day.weekday() != 1:
+        day += timedelta(days=1)
+    start_time = day.replace(hour=11, minute=0, second=0, microsecond=0)
+    client.post("/api/appointments/", json={
+        "patient_id": patient_data["id"],
+        "doctor_id": doctor_data["id"],
+        "start_time": start_time.isoformat(),
+        "end_time": (start_time + timedelta(minutes=30)).isoformat()
+    }, headers=headers)
+    response = client.get("/api/appointments/", headers={**headers, "If-None-Match": etag})
+    assert response.status_code == 200
@@ -0,0 +1,295 @@
+import asyncio
+import time
+from collections import defaultdict
+
+import httpx
+import pytest
+import redis
+from fastapi import FastAPI, Request, Response
+from fastapi.testclient import TestClient
+
+from app.core import cache as cache_module
+from app.core.cache import CACHE_STATUS_HEADER, CACHE_TAGS_HEADER, CacheMiddleware, ResponseCache
+from app.core.compression import CompressionMiddleware, negotiate
+from app.core.config import settings
+from app.core.redis_client import RedisClient
+from app.core.security import create_access_token
+from app.db.session import replica_reads
+
+
+class MemoryResponseCache(ResponseCache):
+    """ResponseCache keeping entries in dicts instead of Redis."""
+
+    def __init__(self):
+        self.ttl = 60
+        self.entries = {}
+        self.tags = defaultdict(set)
+        self.locks = {}
+
+    async def get(self, key):
+        return self.entries.get(key)
+
+    async def set(self, key, data, tags, ttl=None):
+        self.entries[key] = data
+        for tag in tags:
+            self.tags[tag].add(key)
+
+    def invalidate(self, tags):
+        for tag in tags:
+            for key in self.tags.pop(tag, set()):
+                self.entries.pop(key, None)
+
+    async def acquire_lock(self, key):
+        if key in self.locks:
+            return None
+        self.locks[key] = "token"
+        return "token"
+
+    async def release_lock(self, key, token):
+        if self.locks.get(key) == token:
+            del self.locks[key]
+
+
+def make_app(monkeypatch, store, delay=0.0):
+    monkeypatch.setattr(settings, "RESPONSE_CACHE_ENABLED", True)
+    monkeypatch.setattr(cache_module, "response_cache", store)
+
+    app = FastAPI()
+    app.add_middleware(CacheMiddleware, cache=store, early_expiry_beta=0, lock_wait=0.2)
+    calls = []
+
+    @app.get("/doctors/{id}")
+    def read(id: int, response: Response):
+        calls.append(id)
+        time.sleep(delay)
+        cache_module.set_cache_tags(response, f"doctor:{id}")
+        response.headers["ETag"] = f'W/"doctor-{id}"'
+        return {"id": id, "calls": len(calls)}
+
+    @app.put("/doctors/{id}")
+    def write(id: int):
+        cache_module.invalidate_tags(f"doctor:{id}")
+        return {"id": id}
+
+    @app.get("/slots")
+    def slots(response: Response):
+        calls.append(None)
+        cache_module.set_cache_tags(response, "slots", ttl=1)
+        return []
+
+    @app.get("/untagged")
+    def untagged():
+        calls.append(None)
+        return {}
+
+    @app.get("/appointments")
+    def appointments(response: Response):
+        calls.append(None)
+        cache_module.set_cache_tags(response, "appointments")
+        return [{"id": i, "status": "scheduled"} for i in range(200)]
+
+    return app, calls
+
+
+def make_client(monkeypatch):
+    app, calls = make_app(monkeypatch, MemoryResponseCache())
+    return TestClient(app), calls
+
+
+def auth(user_id):
+    return {"Authorization": f"Bearer {create_access_token(user_id, 'patient')}"}
+
+
+def test_responses_are_cached_per_principal(monkeypatch):
+    client, calls = make_client(monkeypatch)
+
+    first = client.get("/doctors/1", headers=auth(1))
+    assert first.headers[CACHE_STATUS_HEADER] == "MISS"
+    assert CACHE_TAGS_HEADER not in first.headers
+
+    second = client.get("/doctors/1", headers=auth(1))
+    assert second.headers[CACHE_STATUS_HEADER] == "HIT"
+    assert second.json() == first.json()
+
+    # Another user never gets the first user's entry
+    assert client.get("/doctors/1", headers=auth(2)).headers[CACHE_STATUS_HEADER] == "MISS"
+
+    # Anonymous and untagged responses are not cached
+    client.get("/doctors/1")
+    client.get("/untagged", headers=auth(1))
+    client.get("/untagged", headers=auth(1))
+    assert len(calls) == 5
+
+
+def test_writes_invalidate_by_tag(monkeypatch):
+    client, calls = make_client(monkeypatch)
+
+    client.get("/doctors/1", headers=auth(1))
+    client.get("/doctors/2", headers=auth(1))
+    client.put("/doctors/1", headers=auth(1))
+
+    assert client.get("/doctors/1", headers=auth(1)).headers[CACHE_STATUS_HEADER] == "MISS"
+    assert client.get("/doctors/2", headers=auth(1)).headers[CACHE_STATUS_HEADER] == "HIT"
+
+
+def test_routes_can_shorten_freshness(monkeypatch):
+    client, calls = make_client(monkeypatch)
+
+    response = client.get("/slots", headers=auth(1))
+    assert response.headers[CACHE_STATUS_HEADER] == "MISS"
+    assert "X-Cache-TTL" not in response.headers
+    assert client.get("/slots", headers=auth(1)).headers[CACHE_STATUS_HEADER] == "HIT"
+
+    time.sleep(1.1)
+    assert client.get("/slots", headers=auth(1)).headers[CACHE_STATUS_HEADER] == "MISS"
+    assert len(calls) == 2
+
+
+def test_cacheable_requests_read_from_primary(monkeypatch):
+    def request(method, headers):
+        return Request({
+            "type": "http", "method": method, "path": "/", "query_string": b"",
+            "headers": [(name.lower().encode(), value.encode()) for name, value in headers.items()]
+        })
+
+    assert replica_reads(request("GET", auth(1)))
+    monkeypatch.setattr(settings, "RESPONSE_CACHE_ENABLED", True)
+    assert not replica_reads(request("GET", auth(1)))
+    assert replica_reads(request("GET", {}))
+    assert not replica_reads(request("POST", {}))
+
+
+def test_requests_pass_through_when_redis_is_down(monkeypatch):
+    shared = RedisClient("redis://localhost:1/0")
+    app, calls = make_app(monkeypatch, ResponseCache("redis://localhost:1/0", client=shared))
+
+    # One event loop for all requests, as under a server
+    with TestClient(app) as client:
+        for _ in range(2):
+            started = time.monotonic()
+            response = client.get("/doctors/1", headers=auth(1))
+            assert response.status_code == 200
+            assert response.headers[CACHE_STATUS_HEADER] == "MISS"
+            # Failed connections do not wait out the call budget
+            assert time.monotonic() - started < shared.call_timeout
+    assert len(calls) == 2
+
+
+@pytest.mark.asyncio
+async def test_redis_calls_have_a_time_budget():
+    with pytest.raises(redis.TimeoutError):
+        await RedisClient(call_timeout=0.01).run(asyncio.sleep(1))
+
+
+@pytest.mark.asyncio
+async def test_failed_connections_release_their_pool_slot():
+    shared = RedisClient("redis://localhost:1/0", max_connections=1)
+    # A leaked slot would leave the later calls waiting out the budget
+    for _ in range(3):
+        with pytest.raises(redis.ConnectionError):
+            await shared.run(shared.redis.get("key"))
+    await shared.close()
+
+
+def test_cache_hits_answer_conditional_requests(monkeypatch):
+    client, calls = make_client(monkeypatch)
+
+    etag = client.get("/doctors/1", headers=auth(1)).headers["ETag"]
+
+    response = client.get("/doctors/1", headers={**auth(1), "If-None-Match": etag})
+    assert response.status_code == 304
+    assert response.headers[CACHE_STATUS_HEADER] == "HIT"
+    assert response.headers["ETag"] == etag
+
+    response = client.get("/doctors/1", headers={**auth(1), "If-None-Match": 'W/"other"'})
+    assert response.status_code == 200
+    assert len(calls) == 1
+
+
+def test_cached_bodies_are_served_precompressed(monkeypatch):
+    store = MemoryResponseCache()
+    app, calls = make_app(monkeypatch, store)
+    client = TestClient(app)
+
+    identity = client.get("/appointments", headers={**auth(1), "Accept-Encoding": "identity"})
+    assert "content-encoding" not in identity.headers
+    entry, = store.entries.values()
+    assert "gzip" in entry["encoded"]
+
+    response = client.get("/appointments", headers={**auth(1), "Accept-Encoding": "gzip"})
+    assert response.headers[CACHE_STATUS_HEADER] == "HIT"
+    assert response.headers["content-encoding"] == "gzip"
+    assert response.headers["vary"] == "Accept-Encoding"
+    assert int(response.headers["content-length"]) < int(identity.headers["content-length"])
+    assert response.json() == identity.json()
+    assert len(calls) == 1
+
+    # Small bodies are stored uncompressed
+    client.get("/doctors/1", headers=auth(1))
+    assert store.entries[next(key for key in store.entries if "/doctors/1" in key)]["encoded"] == {}
+
+
+# Compressed on the event loop and in a worker thread
+@pytest.mark.parametrize("thread_minimum_size", [65536, 1024])
+def test_large_uncached_responses_are_compressed(thread_minimum_size):
+    app = FastAPI()
+    app.add_middleware(CompressionMiddleware, minimum_size=1024, thread_minimum_size=thread_minimum_size)
+
+    @app.get("/large")
+    def large():
+        return ["x" * 100] * 100
+
+    @app.get("/small")
+    def small():
+        return {"ok": True}
+
+    client = TestClient(app)
+
+    response = client.get("/large", headers={"Accept-Encoding": "gzip"})
+    assert response.headers["content-encoding"] == "gzip"
+    assert response.json() == ["x" * 100] * 100
+
+    assert "content-encoding" not in client.get("/small", headers={"Accept-Encoding": "gzip"}).headers
+    assert "content-encoding" not in client.get("/large", headers={"Accept-Encoding": "identity"}).headers
+
+
+def test_negotiate():
+    assert negotiate("gzip, deflate", ["gzip"]) == "gzip"
+    assert negotiate("gzip;q=0, *;q=0.5", ["gzip"]) is None
+    assert negotiate("*", ["gzip"]) == "gzip"
+    assert negotiate("deflate", ["gzip"]) is None
+    assert negotiate(None, ["gzip"]) is None
+
+
+@pytest.mark.asyncio
+async def test_concurrent_misses_are_coalesced(monkeypatch):
+    app, calls = make_app(monkeypatch, MemoryResponseCache(), delay=0.2)
+
+    async with httpx.AsyncClient(app=app, base_url="http://test") as client:
+        responses = await asyncio.gather(*(client.get("/doctors/1", headers=auth(1)) for _ in range(5)))
+
+    assert len(calls) == 1
+    assert sorted(response.headers[CACHE_STATUS_HEADER] for response in responses) == ["HIT"] * 4 + ["MISS"]
+
+
+def test_stale_entry_is_served_while_another_replica_refreshes(monkeypatch):
+    store = MemoryResponseCache()
+    app, calls = make_app(monkeypatch, store)
+    client = TestClient(app)
+
+    client.get("/doctors/1", headers=auth(1))
+    for entry in store.entries.values():
+        entry["fresh_until"] = time.time() - 1
+
+    # Another replica holds the recompute lock
+    for key in store.entries:
+        store.locks[key] = "other"
+    response = client.get("/doctors/1", headers=auth(1))
+    assert response.headers[CACHE_STATUS_HEADER] == "STALE"
+    assert len(calls) == 1
+
+    # Once the lock is free this request refreshes the entry
+    store.locks.clear()
+    assert client.get("/doctors/1", headers=auth(1)).headers[CACHE_STATUS_HEADER] == "MISS"
+    assert len(calls) == 2
+    assert client.get("/doctors/1", headers=auth(1)).headers[CACHE_STATUS_HEADER] == "HIT"
@@ -1,26 +1,71 @@
+import logging
 import pytest
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional
 from datetime import datetime, timedelta, time
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, select, text
 from sqlalchemy.orm import sessionmaker, Session
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
 
 from app.schemas.patient import PatientCreate
-from app.schemas.doctor import DoctorCreate, AvailabilityCreate
-from app.schemas.appointment import AppointmentCreate, AppointmentStatus
+from app.schemas.doctor import DoctorCreate, DoctorUpdate, AvailabilityCreate
+from app.schemas.appointment import (
+    AppointmentCreate, AppointmentStatus, AppointmentSeriesCreate, AppointmentSeriesUpdate
+)
 from app.schemas.user import UserCreate, UserRole
-from app.crud.crud_patient import patient
-from app.crud.crud_doctor import doctor
-from app.crud.crud_appointment import appointment
+from app.crud.crud_patient import async_patient, patient
+from app.crud.crud_doctor import async_doctor, doctor
+from app.crud.crud_appointment import appointment, async_appointment
 from app.crud.crud_user import user
-from app.db.models import Base
+import app.api.deps as deps
+from app.api.deps import get_current_user
+from app.core.day_bitmap import schedule_cache
+from app.core.interval_index import appointment_index
+from app.core.two_tier_cache import doctor_cache
+from app.core.principal_cache import principals, verified_tokens
+from app.core.security import create_access_token
+from app.db.models import Availability, Base, Doctor
+from app.db.pool import InstrumentedQueuePool
+from app.db.replicas import LEAST_CONNECTIONS, Replica, ReplicaSet, RoutingSession
+from app.core.query_metrics import QueryBudgetMiddleware, classify, instrument_engine
+from app.core.metrics import (
+    DB_CONNECTIONS_ACTIVE, DB_CONNECTIONS_IDLE, DB_CONNECTIONS_OVERFLOW, DB_POOL_CHECKOUT, DB_QUERY_DURATION
+)
 
 # Create test database
 SQLALCHEMY_DATABASE_URL = "sqlite:///./test_crud.db"
 engine = create_engine(SQLALCHEMY_DATABASE_URL, connect_args={"check_same_thread": False})
 TestingSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+class MemoryRedis:
+    """The parts of a Redis client the doctor cache uses, over a dict."""
+
+    def __init__(self):
+        self.values = {}
+
+    def get(self, key):
+        return self.values.get(key)
+
+    def setex(self, key, ttl, value):
+        self.values[key] = value
+
+    def delete(self, *keys):
+        for key in keys:
+            self.values.pop(key, None)
+
+    def pipeline(self, transaction=True):
+        # Commands apply immediately
+        return self
+
+    def execute(self):
+        return []
+
 @pytest.fixture(scope="module")
 def test_db():
     Base.metadata.create_all(bind=engine)
+    appointment_index.invalidate()
+    schedule_cache.invalidate()
+    doctor_cache.clear_local()
     yield
     Base.metadata.drop_all(bind=engine)
 
@@ -94,6 +139,53 @@ def test_doctor_availability(db: Session):
     assert doctor_with_availability.availabilities[0].start_time == availability_in.start_time
     assert doctor_with_availability.availabilities[0].end_time == availability_in.end_time
 
+def test_doctor_cache_is_invalidated_by_writes(db: Session):
+    doctor_obj = doctor.create(db, obj_in=DoctorCreate(
+        first_name="Cached",
+        last_name="Doctor",
+        email="cached.doctor@example.com",
+        phone="5550001111",
+        specialization="Cache Specialty"
+    ))
+
+    cached = doctor.get_with_availability(db, id=doctor_obj.id)
+    assert doctor.get_with_availability(db, id=doctor_obj.id) is cached
+    assert [member.id for member in doctor.get_by_specialization(db, specialization="Cache Specialty")] == [doctor_obj.id]
+
+    doctor.add_availability(db, doctor_id=doctor_obj.id, availability=AvailabilityCreate(
+        day_of_week=3, start_time=time(8, 0), end_time=time(12, 0)
+    ))
+    assert len(doctor.get_with_availability(db, id=doctor_obj.id).availabilities) == 1
+    assert doctor.get_availability_windows(db, doctor_id=doctor_obj.id, day_of_week=3) == [(time(8, 0), time(12, 0))]
+
+    doctor.update(db, db_obj=doctor.get(db, id=doctor_obj.id), obj_in=DoctorUpdate(specialization="Other Specialty"))
+    assert doctor.get_by_specialization(db, specialization="Cache Specialty") == []
+    assert doctor.get_with_availability(db, id=doctor_obj.id).specialization == "Other Specialty"
+
+    # Without Redis there is nothing to warm
+    doctor_cache.clear_local()
+    assert doctor.warm_cache(db) == 0
+    assert doctor_cache._local == {}
+
+def test_doctor_cache_warm_up_fills_redis(db: Session, monkeypatch):
+    doctor_obj = doctor.create(db, obj_in=DoctorCreate(
+        first_name="Warm",
+        last_name="Doctor",
+        email="warm.doctor@example.com",
+        phone="5550002222",
+        specialization="Warm Specialty"
+    ))
+    monkeypatch.setattr(doctor_cache, "redis", MemoryRedis())
+    doctor_cache.clear_local()
+
+    # Warm-up fills Redis from one query over all doctors; processes fill
+    # their local tier from it as they read
+    assert doctor.warm_cache(db) >= 1
+    assert doctor_cache._local == {}
+    assert f"doctors:doctor:{doctor_obj.id}" in doctor_cache.redis.values
+    assert doctor.get_with_availability(db, id=doctor_obj.id).specialization == "Warm Specialty"
+    assert f"doctor:{doctor_obj.id}" in doctor_cache._local
+
 def test_create_appointment(db: Session):
     patient_in = PatientCreate(
         first_name="Appointment",
@@ -171,3 +263,502 @@ def test_user_authentication(db: Session):
 
     wrong_password_user = user.authenticate(db, email=user_in.email, password="wrongpassword")
     assert wrong_password_user is None
+
+def test_check_conflicts_tracks_writes(db: Session):
+    appointment_index.invalidate()
+
+    patient_obj = patient.create(db, obj_in=PatientCreate(
+        first_name="Conflict",
+        last_name="Patient",
+        date_of_birth=datetime(1990, 1, 1).date(),
+        email="conflict.patient@example.com",
+        phone="1234567890",
+        address="123 Test St"
+    ))
+    doctor_obj = doctor.create(db, obj_in=DoctorCreate(
+        first_name="Conflict",
+        last_name="Doctor",
+        email="conflict.doctor@example.com",
+        phone="0987654321",
+        specialization="Test Specialty"
+    ))
+
+    start_time = datetime(2030, 1, 1, 10, 0)
+    end_time = datetime(2030, 1, 1, 11, 0)
+
+    # Cold miss loads the (empty) calendar from the database
+    assert not appointment.check_conflicts(
+        db, doctor_id=doctor_obj.id, start_time=start_time, end_time=end_time
+    )
+
+    appointment_obj = appointment.create(db, obj_in=AppointmentCreate(
+        patient_id=patient_obj.id,
+        doctor_id=doctor_obj.id,
+        start_time=start_time,
+        end_time=end_time
+    ))
+
+    assert appointment.check_conflicts(
+        db, doctor_id=doctor_obj.id,
+        start_time=datetime(2030, 1, 1, 10, 30), end_time=datetime(2030, 1, 1, 11, 30)
+    )
+    assert not appointment.check_conflicts(
+        db, doctor_id=doctor_obj.id,
+        start_time=end_time, end_time=datetime(2030, 1, 1, 11, 30)
+    )
+    assert not appointment.check_conflicts(
+        db, doctor_id=doctor_obj.id, start_time=start_time, end_time=end_time,
+        appointment_id=appointment_obj.id
+    )
+
+    appointment.update(db, db_obj=appointment_obj, obj_in={
+        "start_time": datetime(2030, 1, 1, 14, 0),
+        "end_time": datetime(2030, 1, 1, 15, 0)
+    })
+    assert not appointment.check_conflicts(
+        db, doctor_id=doctor_obj.id, start_time=start_time, end_time=end_time
+    )
+
+    appointment.update_status(db, id=appointment_obj.id, status=AppointmentStatus.CANCELLED)
+    assert not appointment.check_conflicts(
+        db, doctor_id=doctor_obj.id,
+        start_time=datetime(2030, 1, 1, 14, 0), end_time=datetime(2030, 1, 1, 15, 0)
+    )
+
+    appointment.update_status(db, id=appointment_obj.id, status=AppointmentStatus.CONFIRMED)
+    assert appointment.check_conflicts(
+        db, doctor_id=doctor_obj.id,
+        start_time=datetime(2030, 1, 1, 14, 0), end_time=datetime(2030, 1, 1, 15, 0)
+    )
+
+    appointment.remove(db, id=appointment_obj.id)
+    assert not appointment.check_conflicts(
+        db, doctor_id=doctor_obj.id,
+        start_time=datetime(2030, 1, 1, 14, 0), end_time=datetime(2030, 1, 1, 15, 0)
+    )
+
+def test_concurrent_booking_never_double_books(db: Session):
+    patient_obj = patient.create(db, obj_in=PatientCreate(
+        first_name="Race",
+        last_name="Patient",
+        date_of_birth=datetime(1990, 1, 1).date(),
+        email="race.patient@example.com",
+        phone="1234567890",
+        address="123 Test St"
+    ))
+    doctor_obj = doctor.create(db, obj_in=DoctorCreate(
+        first_name="Race",
+        last_name="Doctor",
+        email="race.doctor@example.com",
+        phone="0987654321",
+        specialization="Test Specialty"
+    ))
+    appointment_in = AppointmentCreate(
+        patient_id=patient_obj.id,
+        doctor_id=doctor_obj.id,
+        start_time=datetime(2030, 2, 5, 10, 0),
+        end_time=datetime(2030, 2, 5, 10, 30)
+    )
+
+    def book(_):
+        thread_db = TestingSessionLocal()
+        try:
+            return appointment.create_if_free(thread_db, obj_in=appointment_in) is not None
+        finally:
+            thread_db.close()
+
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        outcomes = list(executor.map(book, range(16)))
+
+    assert outcomes.count(True) == 1
+    assert len(appointment.get_by_doctor(db, doctor_id=doctor_obj.id)) == 1
+
+
+@pytest.mark.asyncio
+async def test_async_crud_matches_sync(db: Session):
+    async_engine = create_async_engine("sqlite+aiosqlite:///./test_crud.db")
+    try:
+        async with AsyncSession(async_engine, expire_on_commit=False) as async_db:
+            doctors = await async_doctor.get_multi(async_db, limit=2)
+            assert [d.id for d in doctors] == [d.id for d in doctor.get_multi(db, limit=2)]
+            cursor = async_doctor.next_cursor(doctors, limit=2)
+            assert [d.id for d in await async_doctor.get_multi(async_db, limit=2, cursor=cursor)] == \
+                [d.id for d in doctor.get_multi(db, limit=2, cursor=cursor)]
+            assert await async_doctor.collection_version(async_db, select(Doctor)) == \
+                doctor.collection_version(db.query(Doctor))
+
+            with_availability = await async_doctor.get_with_availability(async_db, id=doctors[0].id)
+            assert len(with_availability.availabilities) == len(doctor.get_with_availability(db, id=doctors[0].id).availabilities)
+
+            def columns(rows):
+                return [{k: v for k, v in row.items() if k != "_sa_instance_state"} for row in rows]
+
+            assert columns(await async_appointment.get_multi_with_details(async_db)) == \
+                columns(appointment.get_multi_with_details(db))
+            assert await async_appointment.details_version(async_db) == appointment.details_version(db)
+
+            found = await async_patient.get_by_email(async_db, email="test.patient@example.com")
+            assert found.id == patient.get_by_email(db, email="test.patient@example.com").id
+    finally:
+        await async_engine.dispose()
+
+
+def test_instrumented_pool_reports_usage():
+    pool_engine = create_engine(
+        SQLALCHEMY_DATABASE_URL, connect_args={"check_same_thread": False},
+        poolclass=InstrumentedQueuePool, pool_size=1, max_overflow=1, pool_logging_name="test_pool"
+    )
+
+    def gauges():
+        return tuple(
+            gauge.labels(pool="test_pool")._value.get()
+            for gauge in (DB_CONNECTIONS_ACTIVE, DB_CONNECTIONS_IDLE, DB_CONNECTIONS_OVERFLOW)
+        )
+
+    try:
+        first, second = pool_engine.connect(), pool_engine.connect()
+        assert gauges() == (2, 0, 1)
+        first.close()
+        second.close()
+        # The overflow connection is closed, the other one goes back to the pool
+        assert gauges() == (0, 1, 0)
+        assert DB_POOL_CHECKOUT.labels(pool="test_pool")._sum.get() > 0
+    finally:
+        pool_engine.dispose()
+
+
+def test_classify_query():
+    assert classify('SELECT patients.id FROM patients WHERE patients.id = ?') == ("select", "patients")
+    assert classify('INSERT INTO "appointments" (patient_id) VALUES (?)') == ("insert", "appointments")
+    assert classify("UPDATE public.doctors SET phone=%(phone)s") == ("update", "doctors")
+    assert classify("SELECT count(*) FROM (SELECT id FROM availabilities) AS anon_1") == ("select", "availabilities")
+    assert classify("SELECT 1") == ("select", "none")
+
+
+def test_query_budget_counts_sync_and_async_queries(caplog):
+    from fastapi import FastAPI
+    from fastapi.testclient import TestClient
+
+    sync_engine = create_engine(SQLALCHEMY_DATABASE_URL, connect_args={"check_same_thread": False})
+    async_engine = create_async_engine("sqlite+aiosqlite:///./test_crud.db")
+    instrument_engine(sync_engine)
+    instrument_engine(async_engine.sync_engine)
+
+    budget_app = FastAPI()
+    budget_app.add_middleware(QueryBudgetMiddleware, budget=2)
+
+    @budget_app.get("/sync/{n}")
+    def run_sync(n: int):
+        with sync_engine.connect() as connection:
+            for _ in range(n):
+                connection.execute(text("SELECT id FROM doctors"))
+
+    @budget_app.get("/async/{n}")
+    async def run_async(n: int):
+        async with async_engine.connect() as connection:
+            for _ in range(n):
+                await connection.execute(text("SELECT id FROM doctors"))
+
+    before = DB_QUERY_DURATION.labels(operation="select", table="doctors")._sum.get()
+    try:
+        with caplog.at_level(logging.WARNING, logger="app.core.query_metrics"):
+            with TestClient(budget_app) as budget_client:
+                for path in ("/sync/2", "/async/2", "/sync/3", "/async/3"):
+                    assert budget_client.get(path).status_code == 200
+    finally:
+        sync_engine.dispose()
+
+    warnings = [record.getMessage() for record in caplog.records]
+    assert len(warnings) == 2
+    assert warnings[0].startswith("GET /sync/3 ran 3 queries (budget 2)")
+    assert "3x SELECT id FROM doctors" in warnings[1]
+    assert DB_QUERY_DURATION.labels(operation="select", table="doctors")._sum.get() > before
+
+
+class FixedLagReplicaSet(ReplicaSet):
+    lag = 0.0
+
+    def measure_lag(self, replica: Replica) -> Optional[float]:
+        return self.lag
+
+
+def test_replica_routing(db: Session, tmp_path):
+    replica_url = f"sqlite:///{tmp_path / 'replica.db'}"
+    replica_engine = create_engine(replica_url, connect_args={"check_same_thread": False})
+    Base.metadata.create_all(bind=replica_engine)
+    with sessionmaker(bind=replica_engine)() as replica_db:
+        replica_db.add(Doctor(first_name="Replica", last_name="Doctor", email="replica.doctor@example.com",
+                              phone="0000000000", specialization="Replication"))
+        replica_db.commit()
+
+    replicas = FixedLagReplicaSet(
+        [Replica("test_replica", replica_engine, create_async_engine(f"sqlite+aiosqlite:///{tmp_path / 'replica.db'}"))],
+        max_lag=5, check_interval=3600
+    )
+    RoutedSession = sessionmaker(class_=RoutingSession, bind=engine, replicas=replicas)
+    primary_doctors = db.query(Doctor).count()
+    try:
+        with RoutedSession(replica_reads=True) as routed:
+            assert routed.query(Doctor).count() == 1
+            # Anything but a plain SELECT goes to the primary, and so does every read after it
+            routed.execute(text("SELECT 1"))
+            assert routed.query(Doctor).count() == primary_doctors
+        assert replicas.replicas[0].sessions == 0
+
+        with RoutedSession() as routed:
+            assert routed.query(Doctor).count() == primary_doctors
+
+        replicas.lag = 10.0
+        replicas.check()
+        with RoutedSession(replica_reads=True) as routed:
+            assert routed.query(Doctor).count() == primary_doctors
+
+        replicas.lag = 0.0
+        replicas.check()
+        with RoutedSession(replica_reads=True) as routed:
+            assert routed.query(Doctor).count() == 1
+
+        # A replica that stopped replicating is ejected too
+        replicas.lag = None
+        replicas.check()
+        assert not replicas.replicas[0].healthy
+    finally:
+        replicas.stop()
+        replica_engine.dispose()
+
+
+def test_least_connections_balancing():
+    replicas = FixedLagReplicaSet(
+        [Replica(name, engine, None) for name in ("a", "b")], balancing=LEAST_CONNECTIONS, check_interval=3600
+    )
+    try:
+        first = replicas.acquire()
+        second = replicas.acquire()
+        assert {first.name, second.name} == {"a", "b"}
+        replicas.release(first)
+        assert replicas.acquire() is first
+    finally:
+        replicas.stop()
+
+
+@pytest.mark.asyncio
+async def test_async_replica_routing(tmp_path):
+    replica_url = f"sqlite:///{tmp_path / 'replica.db'}"
+    replica_engine = create_engine(replica_url)
+    Base.metadata.create_all(bind=replica_engine)
+    replica_engine.dispose()
+
+    replica_async_engine = create_async_engine(f"sqlite+aiosqlite:///{tmp_path / 'replica.db'}")
+    primary_async_engine = create_async_engine("sqlite+aiosqlite:///./test_crud.db")
+    replicas = FixedLagReplicaSet([Replica("test_replica", replica_engine, replica_async_engine)], check_interval=3600)
+    try:
+        async with AsyncSession(
+            primary_async_engine, sync_session_class=RoutingSession, replicas=replicas, is_async=True, replica_reads=True
+        ) as routed:
+            assert await async_doctor.get_multi(routed) == []
+    finally:
+        replicas.stop()
+        await replica_async_engine.dispose()
+        await primary_async_engine.dispose()
+
+
+def test_cache_fills_read_from_primary(db: Session, tmp_path):
+    patient_obj = patient.create(db, obj_in=PatientCreate(
+        first_name="Lagging",
+        last_name="Patient",
+        date_of_birth=datetime(1990, 1, 1).date(),
+        email="lagging.patient@example.com",
+        phone="1234567890",
+        address="123 Test St"
+    ))
+    doctor_obj = doctor.create(db, obj_in=DoctorCreate(
+        first_name="Lagging",
+        last_name="Doctor",
+        email="lagging.doctor@example.com",
+        phone="0987654321",
+        specialization="Lagging Specialty"
+    ))
+
+    # The replica has the doctor but not the writes that follow
+    replica_engine = create_engine(f"sqlite:///{tmp_path / 'replica.db'}", connect_args={"check_same_thread": False})
+    Base.metadata.create_all(bind=replica_engine)
+    with sessionmaker(bind=replica_engine)() as replica_db:
+        replica_db.add(Doctor(id=doctor_obj.id, first_name="Lagging", last_name="Doctor",
+                              email="lagging.doctor@example.com", phone="0987654321", specialization="Lagging Specialty"))
+        replica_db.commit()
+
+    doctor.add_availability(db, doctor_id=doctor_obj.id, availability=AvailabilityCreate(
+        day_of_week=2, start_time=time(9, 0), end_time=time(17, 0), is_available=True
+    ))
+    start_time = datetime(2030, 3, 6, 10, 0)
+    appointment.create(db, obj_in=AppointmentCreate(
+        patient_id=patient_obj.id, doctor_id=doctor_obj.id,
+        start_time=start_time, end_time=start_time + timedelta(minutes=30)
+    ))
+    # Caches left cold by the writes, as in any other process
+    schedule_cache.invalidate()
+    doctor_cache.clear_local()
+    appointment_index.invalidate()
+
+    replicas = FixedLagReplicaSet([Replica("lagging", replica_engine, None)], max_lag=5, check_interval=3600)
+    RoutedSession = sessionmaker(class_=RoutingSession, bind=engine, replicas=replicas)
+    try:
+        with RoutedSession(replica_reads=True) as routed:
+            assert routed.query(Availability).filter(Availability.doctor_id == doctor_obj.id).count() == 0
+            assert doctor.check_availability(
+                routed, doctor_id=doctor_obj.id, start_time=start_time, end_time=start_time + timedelta(hours=1)
+            )
+            assert doctor.get_booked_cells(routed, doctor_id=doctor_obj.id, day=start_time.date()) != 0
+            assert appointment.check_conflicts(
+                routed, doctor_id=doctor_obj.id, start_time=start_time, end_time=start_time + timedelta(minutes=30)
+            )
+            assert doctor.get_with_availability(routed, id=doctor_obj.id).availabilities
+    finally:
+        replicas.stop()
+        replica_engine.dispose()
+
+    # The caches hold the state after the writes
+    assert schedule_cache.windows(doctor_obj.id, 2).windows == [(time(9, 0), time(17, 0))]
+    assert schedule_cache.booked(doctor_obj.id, start_time.date()) != 0
+    assert doctor.get_with_availability(db, id=doctor_obj.id).availabilities
+
+
+@pytest.mark.asyncio
+async def test_principal_cache_fills_read_from_primary(db: Session, tmp_path, monkeypatch):
+    user_obj = user.create(db, obj_in=UserCreate(
+        email="lagging.user@example.com", username="lagging", password="password", role=UserRole.STAFF
+    ))
+
+    replica_url = f"sqlite:///{tmp_path / 'replica.db'}"
+    replica_engine = create_engine(replica_url)
+    Base.metadata.create_all(bind=replica_engine)
+    replica_engine.dispose()
+
+    replica_async_engine = create_async_engine(f"sqlite+aiosqlite:///{tmp_path / 'replica.db'}")
+    primary_async_engine = create_async_engine("sqlite+aiosqlite:///./test_crud.db")
+    replicas = FixedLagReplicaSet([Replica("lagging", replica_engine, replica_async_engine)], check_interval=3600)
+    principals.invalidate()
+    verified_tokens.clear()
+    # Sessions made like the app's AsyncSessionLocal, which can reach the replica
+    monkeypatch.setattr(deps, "AsyncSessionLocal", async_sessionmaker(
+        primary_async_engine, sync_session_class=RoutingSession, replicas=replicas, is_async=True
+    ))
+    try:
+        principal = await get_current_user(create_access_token(user_obj.id, "staff"))
+    finally:
+        replicas.stop()
+        await replica_async_engine.dispose()
+        await primary_async_engine.dispose()
+
+    assert principal.id == user_obj.id
+    assert principals.get(user_obj.id) == principal
+
+
+def test_index_load_drops_snapshot_raced_by_a_write(db: Session, monkeypatch):
+    patient_obj = patient.create(db, obj_in=PatientCreate(
+        first_name="Racing",
+        last_name="Patient",
+        date_of_birth=datetime(1990, 1, 1).date(),
+        email="racing.patient@example.com",
+        phone="1234567890",
+        address="123 Test St"
+    ))
+    doctor_obj = doctor.create(db, obj_in=DoctorCreate(
+        first_name="Racing",
+        last_name="Doctor",
+        email="racing.doctor@example.com",
+        phone="0987654321",
+        specialization="Racing Specialty"
+    ))
+    start_time = datetime(2030, 4, 2, 10, 0)
+    booking = AppointmentCreate(
+        patient_id=patient_obj.id, doctor_id=doctor_obj.id,
+        start_time=start_time, end_time=start_time + timedelta(minutes=30)
+    )
+    appointment_index.invalidate(doctor_obj.id)
+
+    # Another request books the slot after the cold-miss query, before its load
+    load = appointment_index.load
+
+    def load_after_booking(doctor_id, rows, generation=None):
+        with TestingSessionLocal() as other_db:
+            appointment.create(other_db, obj_in=booking)
+        return load(doctor_id, rows, generation=generation)
+
+    monkeypatch.setattr(appointment_index, "load", load_after_booking)
+    assert appointment.check_conflicts(
+        db, doctor_id=doctor_obj.id, start_time=start_time, end_time=start_time + timedelta(minutes=30)
+    )
+    assert not appointment_index.is_loaded(doctor_obj.id)
+
+    monkeypatch.setattr(appointment_index, "load", load)
+    assert appointment.check_conflicts(
+        db, doctor_id=doctor_obj.id, start_time=start_time, end_time=start_time + timedelta(minutes=30)
+    )
+    assert appointment_index.is_loaded(doctor_obj.id)
+
+
+def test_first_available_slots_skip_ended_slots(db: Session):
+    doctor_obj = doctor.create(db, obj_in=DoctorCreate(
+        first_name="Early",
+        last_name="Doctor",
+        email="early.doctor@example.com",
+        phone="0987654321",
+        specialization="Early Specialty"
+    ))
+    for day_of_week in range(7):
+        doctor.add_availability(db, doctor_id=doctor_obj.id, availability=AvailabilityCreate(
+            day_of_week=day_of_week, start_time=time(9, 0), end_time=time(17, 0), is_available=True
+        ))
+
+    now = datetime(2030, 3, 5, 12, 10)
+    slots = doctor.find_first_available_slots(
+        db, specialization="Early Specialty", start_date=now.date(), end_date=now.date(), limit=2, now=now
+    )
+    assert [slot["start_time"] for slot in slots] == ["2030-03-05T12:00:00", "2030-03-05T12:30:00"]
+
+    evening = datetime(2030, 3, 5, 17, 0)
+    assert doctor.find_first_available_slots(
+        db, specialization="Early Specialty", start_date=now.date(), end_date=now.date(), now=evening
+    ) == []
+
+
+def test_update_series_leaves_past_occurrences(db: Session):
+    patient_obj = patient.create(db, obj_in=PatientCreate(
+        first_name="Series",
+        last_name="Patient",
+        date_of_birth=datetime(1990, 1, 1).date(),
+        email="series.patient@example.com",
+        phone="1234567890",
+        address="123 Test St"
+    ))
+    doctor_obj = doctor.create(db, obj_in=DoctorCreate(
+        first_name="Series",
+        last_name="Doctor",
+        email="series.doctor@example.com",
+        phone="0987654321",
+        specialization="Series Specialty"
+    ))
+    for day_of_week in range(7):
+        doctor.add_availability(db, doctor_id=doctor_obj.id, availability=AvailabilityCreate(
+            day_of_week=day_of_week, start_time=time(9, 0), end_time=time(17, 0), is_available=True
+        ))
+
+    # Two weekly occurrences in the past, two upcoming
+    start_time = (datetime.utcnow() - timedelta(days=13)).replace(hour=10, minute=0, second=0, microsecond=0)
+    series_obj, errors = appointment.create_series(db, obj_in=AppointmentSeriesCreate(
+        patient_id=patient_obj.id,
+        doctor_id=doctor_obj.id,
+        start_time=start_time,
+        end_time=start_time + timedelta(minutes=30),
+        count=4
+    ))
+    assert errors == []
+
+    updated = appointment.update_series(
+        db, series_id=series_obj.id, obj_in=AppointmentSeriesUpdate(status=AppointmentStatus.CANCELLED)
+    )
+
+    occurrences = sorted(appointment.get_series(db, id=series_obj.id).appointments, key=lambda a: a.start_time)
+    assert [occurrence.status for occurrence in occurrences] == ["scheduled", "scheduled", "cancelled", "cancelled"]
+    assert sorted(updated) == [occurrence.id for occurrence in occurrences[2:]]
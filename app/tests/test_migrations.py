@@ -0,0 +1,85 @@
+from sqlalchemy import create_engine, inspect, text
+from sqlalchemy.dialects import postgresql
+from sqlalchemy.schema import CreateIndex
+
+from app.db.migrations import CONCURRENT_INDEXES, MIGRATIONS, concurrent_indexes, run_migrations
+from app.db.models import Appointment, Availability, Base
+
+INDEX_PACK = {
+    "ix_appointments_doctor_id_start_time",
+    "ix_appointments_patient_id_start_time",
+    "ix_appointments_start_time_id",
+    "ix_appointments_status",
+    "ix_appointments_active_doctor_id_start_time",
+    "ix_availabilities_doctor_id_day_of_week",
+}
+
+
+def test_run_migrations_on_fresh_database(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'fresh.db'}")
+
+    assert run_migrations(engine) == [version for version, _, _ in MIGRATIONS]
+    assert run_migrations(engine) == []
+
+    indexes = {index["name"] for index in inspect(engine).get_indexes("appointments")}
+    assert "ix_appointments_active_doctor_id_start_time" in indexes
+
+
+def test_run_migrations_adds_indexes_to_existing_database(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'existing.db'}")
+
+    # A database created by create_all before the index pack existed
+    Base.metadata.create_all(bind=engine)
+    with engine.begin() as connection:
+        for table in (Appointment.__table__, Availability.__table__):
+            for index in table.indexes:
+                if index.name in INDEX_PACK:
+                    index.drop(bind=connection)
+
+    run_migrations(engine)
+
+    indexes = {
+        index["name"]
+        for table in ("appointments", "availabilities")
+        for index in inspect(engine).get_indexes(table)
+    }
+    assert INDEX_PACK <= indexes
+
+
+def test_run_migrations_adds_series_to_existing_database(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'legacy.db'}")
+
+    # An appointments table from before recurring series existed
+    legacy_tables = {"appointments", "appointment_series", "medical_records"}
+    Base.metadata.create_all(
+        bind=engine, tables=[table for table in Base.metadata.sorted_tables if table.name not in legacy_tables]
+    )
+    with engine.begin() as connection:
+        connection.execute(text(
+            "CREATE TABLE appointments (id INTEGER PRIMARY KEY, patient_id INTEGER, doctor_id INTEGER, "
+            "start_time DATETIME, end_time DATETIME, status VARCHAR, notes TEXT, "
+            "created_at DATETIME, updated_at DATETIME)"
+        ))
+
+    run_migrations(engine)
+
+    inspector = inspect(engine)
+    assert "appointment_series" in inspector.get_table_names()
+    assert "series_id" in {column["name"] for column in inspector.get_columns("appointments")}
+    assert INDEX_PACK <= {index["name"] for index in inspector.get_indexes("appointments")} | {
+        index["name"] for index in inspector.get_indexes("availabilities")
+    }
+
+
+def test_indexes_on_existing_tables_are_built_concurrently_on_postgresql():
+    indexes = concurrent_indexes()
+    assert {index.name for index in indexes} == CONCURRENT_INDEXES
+    for index in indexes:
+        statement = str(CreateIndex(index).compile(dialect=postgresql.dialect()))
+        assert statement.startswith("CREATE INDEX CONCURRENTLY")
+
+    # The models' own indexes are unchanged, so create_all can run them in a
+    # transaction
+    for table in (Appointment.__table__, Availability.__table__):
+        for index in table.indexes:
+            assert "CONCURRENTLY" not in str(CreateIndex(index).compile(dialect=postgresql.dialect()))
@@ -0,0 +1,168 @@
+import pytest
+import redis
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from app.core.rate_limiter import Bucket, LocalTokenBuckets, RateLimiter, RedisTokenBuckets
+from app.core.security import create_access_token
+
+
+class MemoryTokenBuckets(RedisTokenBuckets):
+    """RedisTokenBuckets keeping buckets in a dict, with a settable clock."""
+
+    def __init__(self):
+        self.now = 0.0
+        self.levels = {}
+        self.fail = False
+
+    async def take(self, buckets):
+        if self.fail:
+            raise redis.ConnectionError("down")
+        levels = []
+        for bucket in buckets:
+            tokens, ts = self.levels.get(bucket.key, (bucket.capacity, self.now))
+            levels.append(min(bucket.capacity, tokens + (self.now - ts) * bucket.refill_rate))
+        allowed = all(level >= 1 for level in levels)
+        if allowed:
+            levels = [level - 1 for level in levels]
+        for bucket, level in zip(buckets, levels):
+            self.levels[bucket.key] = (level, self.now)
+        return allowed, levels
+
+
+def make_client(store, **limits):
+    app = FastAPI()
+    app.add_middleware(RateLimiter, buckets=store, **limits)
+
+    @app.get("/doctors/{id}")
+    def read(id: int):
+        return {"id": id}
+
+    @app.post("/login")
+    def login():
+        return {}
+
+    return TestClient(app)
+
+
+def auth(user_id, role):
+    return {"Authorization": f"Bearer {create_access_token(user_id, role)}"}
+
+
+def test_requests_over_the_quota_are_rejected():
+    store = MemoryTokenBuckets()
+    client = make_client(store, rate_limit_per_minute=3, role_limits={}, route_limits={})
+
+    for remaining in (2, 1, 0):
+        response = client.get("/doctors/1", headers=auth(1, "patient"))
+        assert response.status_code == 200
+        assert response.headers["X-RateLimit-Limit"] == "3"
+        assert response.headers["X-RateLimit-Remaining"] == str(remaining)
+
+    response = client.get("/doctors/2", headers=auth(1, "patient"))
+    assert response.status_code == 429
+    assert response.headers["Retry-After"] == "20"
+
+    # Other users have their own bucket, and tokens refill over time
+    assert client.get("/doctors/1", headers=auth(2, "patient")).status_code == 200
+    store.now += 20
+    assert client.get("/doctors/1", headers=auth(1, "patient")).status_code == 200
+
+
+def test_role_and_route_quotas():
+    store = MemoryTokenBuckets()
+    client = make_client(
+        store, rate_limit_per_minute=2,
+        role_limits={"admin": 100}, route_limits={"POST /login": 1, "GET /doctors/{id}": 50}
+    )
+
+    assert client.get("/doctors/1", headers=auth(1, "admin")).headers["X-RateLimit-Limit"] == "50"
+    assert client.post("/login", headers=auth(1, "admin")).status_code == 200
+    response = client.post("/login", headers=auth(1, "admin"))
+    assert response.status_code == 429
+    assert response.headers["X-RateLimit-Limit"] == "1"
+
+    # The rejected request took no token from the user's bucket
+    assert store.levels["rate_limit:{user:1}"][0] == 98
+
+    # Anonymous clients are limited by IP with the default quota
+    client.get("/doctors/1")
+    client.get("/doctors/1")
+    assert client.get("/doctors/1").status_code == 429
+
+
+def test_requests_pass_when_redis_is_down():
+    store = MemoryTokenBuckets()
+    store.fail = True
+    client = make_client(store, rate_limit_per_minute=1, role_limits={}, route_limits={})
+
+    response = client.get("/doctors/1")
+    assert response.status_code == 200
+    assert "X-RateLimit-Limit" not in response.headers
+
+
+def make_local_buckets(shared, max_error=0.5):
+    """LocalTokenBuckets whose reconcile script applies to the `shared` dict."""
+    buckets = LocalTokenBuckets(sync_interval=3600, max_error=max_error)
+
+    def reconcile(keys, args):
+        if shared.get("down"):
+            raise redis.ConnectionError("down")
+        levels = []
+        for i, key in enumerate(keys):
+            capacity, _, taken = args[3 * i:3 * i + 3]
+            shared[key] = max(shared.get(key, capacity) - taken, -capacity)
+            levels.append(str(shared[key]))
+        return levels
+
+    buckets._reconcile = reconcile
+    return buckets
+
+
+@pytest.mark.asyncio
+async def test_local_buckets_reconcile_with_redis():
+    shared = {}
+    first, second = make_local_buckets(shared), make_local_buckets(shared)
+    bucket = Bucket("rate_limit:{user:1}", 10, 1e-6)
+
+    # Each process takes at most half the bucket between syncs
+    assert [(await first.take([bucket]))[0] for _ in range(6)] == [True] * 5 + [False]
+    assert [(await second.take([bucket]))[0] for _ in range(5)] == [True] * 5
+
+    first.sync()
+    second.sync()
+    assert shared[bucket.key] == 0
+    # The first process learns of the second's tokens on its next sync
+    first.sync()
+    assert not (await first.take([bucket]))[0]
+    assert not (await second.take([bucket]))[0]
+    first.stop()
+    second.stop()
+
+
+@pytest.mark.asyncio
+async def test_local_buckets_keep_counts_while_redis_is_down():
+    shared = {"down": True}
+    buckets = make_local_buckets(shared, max_error=1.0)
+    bucket = Bucket("rate_limit:{user:1}", 10, 1e-6)
+
+    for _ in range(3):
+        assert (await buckets.take([bucket]))[0]
+    buckets.sync()
+
+    del shared["down"]
+    buckets.sync()
+    assert shared[bucket.key] == 7
+    buckets.stop()
+
+
+@pytest.mark.asyncio
+async def test_local_buckets_flush_on_stop():
+    shared = {}
+    buckets = make_local_buckets(shared)
+    bucket = Bucket("rate_limit:{user:1}", 10, 1e-6)
+
+    for _ in range(2):
+        await buckets.take([bucket])
+    buckets.stop()
+    assert shared[bucket.key] == 8
@@ -0,0 +1,116 @@
+import random
+from datetime import date, datetime, time, timedelta
+
+from app.core.interval_index import DoctorIntervals
+from app.core.day_bitmap import DayBitmapCache, DayWindows, bitmap_slots, is_within_windows
+from app.core.slots import free_slot_bitmap, generate_slots, iter_set_bits, merge_intervals
+
+
+def nested_loop_slots(day, availabilities, appointments, slot_minutes=30):
+    slots = []
+    for window_start, window_end in availabilities:
+        current_time = datetime.combine(day, window_start)
+        end_time = datetime.combine(day, window_end)
+        while current_time + timedelta(minutes=slot_minutes) <= end_time:
+            slot_end_time = current_time + timedelta(minutes=slot_minutes)
+            if not any(
+                current_time < appointment_end and slot_end_time > appointment_start
+                for appointment_start, appointment_end in appointments
+            ):
+                slots.append({
+                    "start_time": current_time.isoformat(),
+                    "end_time": slot_end_time.isoformat(),
+                    "is_available": True
+                })
+            current_time = slot_end_time
+    return slots
+
+
+def test_merge_intervals():
+    day = datetime(2030, 1, 1)
+    merged = merge_intervals([
+        (day.replace(hour=11), day.replace(hour=12)),
+        (day.replace(hour=9), day.replace(hour=10)),
+        (day.replace(hour=10), day.replace(hour=10, minute=30)),
+    ])
+    assert merged == [
+        (day.replace(hour=9), day.replace(hour=10, minute=30)),
+        (day.replace(hour=11), day.replace(hour=12)),
+    ]
+
+
+def test_generate_slots_matches_nested_loop():
+    rng = random.Random(7)
+    day = date(2030, 1, 1)
+    availabilities = [(time(13, 0), time(18, 0)), (time(8, 0), time(12, 15))]
+
+    for slot_minutes in (15, 30, 45):
+        appointments = []
+        for _ in range(40):
+            start_time = datetime.combine(day, time(7, 0)) + timedelta(minutes=rng.randrange(0, 12 * 60, 5))
+            appointments.append((start_time, start_time + timedelta(minutes=rng.choice([0, 10, 20, 30, 90]))))
+
+        assert generate_slots(day, availabilities, appointments, slot_minutes) == \
+            nested_loop_slots(day, availabilities, appointments, slot_minutes)
+
+
+def test_free_slot_bitmap():
+    day = date(2030, 1, 1)  # Tuesday
+    availabilities = [(day.weekday(), time(9, 0), time(11, 0))]
+    busy = [(datetime(2030, 1, 1, 9, 45), datetime(2030, 1, 1, 10, 0))]
+
+    mask = free_slot_bitmap(day, 2, availabilities, busy, slot_minutes=30)
+
+    assert [datetime.combine(day, time.min) + timedelta(minutes=30 * i) for i in iter_set_bits(mask)] == [
+        datetime(2030, 1, 1, 9, 0),
+        datetime(2030, 1, 1, 10, 0),
+        datetime(2030, 1, 1, 10, 30),
+    ]
+
+
+def test_bitmap_slots_match_sweep():
+    rng = random.Random(11)
+    day = date(2030, 1, 1)
+    windows = [(time(13, 0), time(18, 0)), (time(8, 0), time(12, 15))]
+    cache = DayBitmapCache(ttl=0)
+
+    appointments = []
+    for id in range(30):
+        start_time = datetime.combine(day, time(7, 0)) + timedelta(minutes=rng.randrange(0, 12 * 60, 5))
+        appointments.append((id, start_time, start_time + timedelta(minutes=rng.choice([0, 10, 20, 30, 90]))))
+
+    booked = cache.load_bookings(1, day, appointments[:20])
+    for id, start_time, end_time in appointments[20:]:
+        cache.add_booking(1, id, start_time, end_time)
+    for id, _, _ in appointments[:5]:
+        cache.discard_booking(id)
+    booked = cache.booked(1, day)
+
+    remaining = [(start_time, end_time) for _, start_time, end_time in appointments[5:]]
+    for slot_minutes in (15, 30, 60):
+        assert bitmap_slots(day, windows, booked, slot_minutes) == \
+            generate_slots(day, windows, remaining, slot_minutes)
+
+
+def test_is_within_windows():
+    masks = DayWindows([(time(9, 0), time(12, 0)), (time(12, 0), time(17, 0))], loaded_at=0).masks()
+
+    assert is_within_windows(masks, time(9, 0), time(9, 30))
+    assert is_within_windows(masks, time(16, 50), time(17, 0))
+    assert not is_within_windows(masks, time(8, 55), time(9, 30))
+    # Must fit inside a single window, as with the SQL check
+    assert not is_within_windows(masks, time(11, 30), time(12, 30))
+
+
+def test_interval_window_shrinks_after_long_interval_is_discarded():
+    intervals = DoctorIntervals(loaded_at=0)
+    day = datetime(2030, 1, 7, 9)
+    for i in range(8):
+        intervals.add(i, day + timedelta(minutes=30 * i), day + timedelta(minutes=30 * i + 30))
+    intervals.add(100, day - timedelta(days=3), day - timedelta(days=2))
+    assert intervals.max_span == timedelta(days=1)
+
+    intervals.discard(100)
+    assert intervals.max_span == timedelta(minutes=30)
+    assert intervals.overlaps(day + timedelta(minutes=45), day + timedelta(minutes=50))
+    assert not intervals.overlaps(day - timedelta(days=3), day - timedelta(days=2))
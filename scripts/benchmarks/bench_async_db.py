@@ -0,0 +1,147 @@
+"""
+Compare throughput and latency of a doctor list route served by a sync
+route on the threadpool against the same route as `async def` on an async
+session, at 50, 200 and 1000 concurrent clients.
+
+Usage (from the repository root):
+
+    python -m scripts.benchmarks.bench_async_db --clients 50 200 1000 --db-latency-ms 5
+
+Runs against a temporary SQLite database (aiosqlite) unless --database-url
+points at PostgreSQL (asyncpg); the target database must be empty, the
+benchmark creates and drops its tables. --db-latency-ms adds a simulated
+network round trip to every query: a blocking sleep on the sync path and
+an awaited one on the async path, as psycopg2 and asyncpg would wait.
+"""
+import argparse
+import asyncio
+import os
+import tempfile
+import time
+
+import httpx
+from fastapi import Depends, FastAPI
+from sqlalchemy import create_engine
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
+from sqlalchemy.orm import Session, sessionmaker
+from sqlalchemy.pool import AsyncAdaptedQueuePool, QueuePool
+
+from app.crud.crud_doctor import async_doctor, doctor
+from app.db.models import Base, Doctor
+from app.db.session import async_database_url
+
+
+def build_app(database_url: str, pool_size: int, latency: float) -> FastAPI:
+    # Both engines get a queue pool of the same size; SQLite's asyncio
+    # dialect would otherwise open a connection per session
+    connect_args = {"check_same_thread": False} if database_url.startswith("sqlite") else {}
+    engine = create_engine(
+        database_url, connect_args=connect_args, poolclass=QueuePool, pool_size=pool_size, max_overflow=0
+    )
+    async_engine = create_async_engine(
+        async_database_url(database_url), connect_args=connect_args,
+        poolclass=AsyncAdaptedQueuePool, pool_size=pool_size, max_overflow=0
+    )
+    SessionLocal = sessionmaker(autoflush=False, bind=engine)
+    AsyncSessionLocal = async_sessionmaker(async_engine, autoflush=False, expire_on_commit=False)
+
+    def get_db():
+        db = SessionLocal()
+        try:
+            yield db
+        finally:
+            db.close()
+
+    async def get_async_db():
+        async with AsyncSessionLocal() as db:
+            yield db
+
+    app = FastAPI()
+    app.state.engines = (engine, async_engine)
+
+    @app.get("/sync/doctors")
+    def sync_doctors(db: Session = Depends(get_db)):
+        if latency:
+            time.sleep(latency)
+        return [{"id": d.id, "email": d.email} for d in doctor.get_multi(db, limit=20)]
+
+    @app.get("/async/doctors")
+    async def async_doctors(db: AsyncSession = Depends(get_async_db)):
+        if latency:
+            await asyncio.sleep(latency)
+        return [{"id": d.id, "email": d.email} for d in await async_doctor.get_multi(db, limit=20)]
+
+    return app
+
+
+async def load(client: httpx.AsyncClient, path: str, clients: int, requests: int):
+    latencies = []
+    bodies = set()
+
+    async def run_client():
+        for _ in range(requests):
+            started = time.perf_counter()
+            response = await client.get(path)
+            latencies.append(time.perf_counter() - started)
+            response.raise_for_status()
+            bodies.add(response.content)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(run_client() for _ in range(clients)))
+    elapsed = time.perf_counter() - started
+    latencies.sort()
+    return clients * requests / elapsed, latencies[len(latencies) // 2], latencies[int(len(latencies) * 0.99)], bodies
+
+
+async def run(args, database_url: str) -> None:
+    app = build_app(database_url, args.pool_size, args.db_latency_ms / 1000)
+    engine, async_engine = app.state.engines
+    Base.metadata.create_all(bind=engine)
+    with sessionmaker(bind=engine)() as db:
+        db.add_all([
+            Doctor(first_name="Bench", last_name=f"Doctor{i}", email=f"bench.doctor{i}@example.com",
+                   phone="0000000000", specialization="Cardiology")
+            for i in range(100)
+        ])
+        db.commit()
+
+    try:
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as client:
+            print(f"pool size {args.pool_size}, {args.requests} requests per client, "
+                  f"{args.db_latency_ms} ms simulated query latency")
+            # Open every pooled connection before measuring
+            await load(client, "/sync/doctors", args.pool_size, 1)
+            await load(client, "/async/doctors", args.pool_size, 1)
+
+            for clients in args.clients:
+                sync_rps, sync_p50, sync_p99, sync_bodies = await load(client, "/sync/doctors", clients, args.requests)
+                async_rps, async_p50, async_p99, async_bodies = await load(client, "/async/doctors", clients, args.requests)
+
+                assert sync_bodies == async_bodies and len(sync_bodies) == 1, "sync and async routes returned different pages"
+
+                print(f"{clients:>5} clients:")
+                print(f"  sync  route {sync_rps:9.1f} req/s  p50 {sync_p50 * 1e3:8.1f} ms  p99 {sync_p99 * 1e3:8.1f} ms")
+                print(f"  async route {async_rps:9.1f} req/s  p50 {async_p50 * 1e3:8.1f} ms  p99 {async_p99 * 1e3:8.1f} ms")
+    finally:
+        await async_engine.dispose()
+        Base.metadata.drop_all(bind=engine)
+        engine.dispose()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--database-url")
+    parser.add_argument("--clients", type=int, nargs="+", default=[50, 200, 1000])
+    parser.add_argument("--requests", type=int, default=10, help="requests per client")
+    parser.add_argument("--pool-size", type=int, default=50, help="connections in each engine's pool")
+    parser.add_argument("--db-latency-ms", type=float, default=0.0)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        database_url = args.database_url or f"sqlite:///{os.path.join(tmp, 'bench.db')}"
+        asyncio.run(run(args, database_url))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,103 @@
+"""
+Benchmark the per-request cost of authentication: decoding the JWT and
+loading the user on every request (the original get_current_user) against
+the cached token and principal lookups.
+
+Usage (from the repository root):
+
+    python -m scripts.benchmarks.bench_auth --requests 20000
+
+Runs against a temporary SQLite database unless --database-url points at an
+empty PostgreSQL database; the benchmark creates and drops its tables.
+"""
+import argparse
+import asyncio
+import os
+import tempfile
+import time
+
+from jose import jwt
+from sqlalchemy import create_engine
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+from sqlalchemy.orm import sessionmaker
+
+import app.api.deps as deps
+from app.api.deps import get_current_user
+from app.core.config import settings
+from app.core.principal_cache import principals, verified_tokens
+from app.core.security import create_access_token
+from app.crud.crud_user import user
+from app.db.models import Base, User
+from app.db.session import async_database_url
+from app.schemas.user import TokenPayload
+
+
+def legacy_get_current_user(db, token):
+    payload = jwt.decode(token, settings.SECRET_KEY, algorithms=[settings.ALGORITHM])
+    token_data = TokenPayload(**payload)
+    user_obj = user.get(db, id=token_data.sub)
+    if not user_obj or not user_obj.is_active:
+        raise RuntimeError("authentication failed")
+    return user_obj
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--database-url")
+    parser.add_argument("--requests", type=int, default=20000)
+    parser.add_argument("--users", type=int, default=100)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        database_url = args.database_url or f"sqlite:///{os.path.join(tmp, 'bench.db')}"
+        engine = create_engine(database_url)
+        Base.metadata.create_all(bind=engine)
+        SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+        async_engine = create_async_engine(async_database_url(database_url))
+        AsyncSessionLocal = async_sessionmaker(async_engine, autoflush=False, expire_on_commit=False)
+
+        db = SessionLocal()
+        db.add_all(
+            User(username=f"user{i}", email=f"user{i}@example.com", hashed_password="x", role="staff", is_active=True)
+            for i in range(args.users)
+        )
+        db.commit()
+        tokens = [create_access_token(user_id, "staff") for (user_id,) in db.query(User.id)]
+        requests = [tokens[i % len(tokens)] for i in range(args.requests)]
+
+        # A fresh session per request, as get_db hands out
+        started = time.perf_counter()
+        legacy_ids = []
+        for token in requests:
+            request_db = SessionLocal()
+            legacy_ids.append(legacy_get_current_user(request_db, token).id)
+            request_db.close()
+        legacy = time.perf_counter() - started
+
+        # get_current_user opens its own session on a principal cache miss
+        deps.AsyncSessionLocal = AsyncSessionLocal
+
+        async def authenticate_all():
+            ids = [(await get_current_user(token)).id for token in requests]
+            await async_engine.dispose()
+            return ids
+
+        principals.invalidate()
+        verified_tokens.clear()
+        started = time.perf_counter()
+        cached_ids = asyncio.run(authenticate_all())
+        cached = time.perf_counter() - started
+
+        assert legacy_ids == cached_ids, "cached authentication resolved different users"
+
+        print(f"requests            {args.requests}")
+        print(f"decode + query      {legacy / args.requests * 1e6:8.1f} us/request")
+        print(f"cached              {cached / args.requests * 1e6:8.1f} us/request")
+        print(f"speedup             {legacy / cached:8.1f}x")
+
+        db.close()
+        Base.metadata.drop_all(bind=engine)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,116 @@
+"""
+Concurrency stress test for the booking path: many threads race to book a
+small set of popular slots, then the table is checked for double bookings.
+
+Usage (from the repository root):
+
+    python -m scripts.benchmarks.bench_booking_concurrency --threads 32 --attempts 4000
+
+Runs against a temporary SQLite database (striped in-process locks) unless
+--database-url points at PostgreSQL (advisory locks). The target database
+must be empty: the benchmark creates and drops its tables.
+"""
+import argparse
+import os
+import random
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+from sqlalchemy import and_, create_engine, func
+from sqlalchemy.orm import aliased, sessionmaker
+
+from app.core.interval_index import appointment_index
+from app.crud.crud_appointment import appointment
+from app.db.models import Appointment, Base, Doctor, Patient
+from app.schemas.appointment import AppointmentCreate
+
+
+def count_double_bookings(db) -> int:
+    other = aliased(Appointment)
+    return db.query(func.count()).select_from(Appointment).join(
+        other,
+        and_(
+            other.doctor_id == Appointment.doctor_id,
+            other.id > Appointment.id,
+            other.status != "cancelled",
+            other.start_time < Appointment.end_time,
+            other.end_time > Appointment.start_time
+        )
+    ).filter(Appointment.status != "cancelled").scalar()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--database-url")
+    parser.add_argument("--threads", type=int, default=32)
+    parser.add_argument("--attempts", type=int, default=4000)
+    parser.add_argument("--doctors", type=int, default=20)
+    parser.add_argument("--slots", type=int, default=100, help="distinct slots per doctor")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        database_url = args.database_url or f"sqlite:///{os.path.join(tmp, 'bench.db')}"
+        connect_args = {"check_same_thread": False, "timeout": 60} if database_url.startswith("sqlite") else {}
+        engine = create_engine(database_url, connect_args=connect_args, pool_size=args.threads)
+        Base.metadata.create_all(bind=engine)
+        SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+        db = SessionLocal()
+        db.add(Patient(first_name="Bench", last_name="Patient", email="bench@example.com"))
+        db.add_all(
+            Doctor(first_name="Bench", last_name=str(i), email=f"doctor{i}@example.com", specialization="Bench")
+            for i in range(args.doctors)
+        )
+        db.commit()
+        doctor_ids = [doctor_id for (doctor_id,) in db.query(Doctor.id)]
+        patient_id = db.query(Patient.id).scalar()
+
+        rng = random.Random(42)
+        epoch = datetime(2030, 1, 7, 8, 0)
+        requests = []
+        for _ in range(args.attempts):
+            # Half-overlapping 30 minute slots on a 15 minute grid
+            start_time = epoch + timedelta(minutes=15 * rng.randrange(args.slots))
+            requests.append(AppointmentCreate(
+                patient_id=patient_id,
+                doctor_id=rng.choice(doctor_ids),
+                start_time=start_time,
+                end_time=start_time + timedelta(minutes=30)
+            ))
+
+        def book(appointment_in):
+            thread_db = SessionLocal()
+            try:
+                if appointment.check_conflicts(
+                    thread_db, doctor_id=appointment_in.doctor_id,
+                    start_time=appointment_in.start_time, end_time=appointment_in.end_time
+                ):
+                    return False
+                return appointment.create_if_free(thread_db, obj_in=appointment_in) is not None
+            finally:
+                thread_db.close()
+
+        appointment_index.invalidate()
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=args.threads) as executor:
+            outcomes = list(executor.map(book, requests))
+        elapsed = time.perf_counter() - started
+
+        booked = outcomes.count(True)
+        double_bookings = count_double_bookings(db)
+        print(f"attempts           {len(outcomes)}")
+        print(f"booked             {booked}")
+        print(f"rejected           {len(outcomes) - booked}")
+        print(f"double bookings    {double_bookings}")
+        print(f"attempts/s         {len(outcomes) / elapsed:.0f}")
+        print(f"bookings/s         {booked / elapsed:.0f}")
+
+        db.close()
+        Base.metadata.drop_all(bind=engine)
+        assert double_bookings == 0, "double bookings found"
+
+
+if __name__ == "__main__":
+    main()
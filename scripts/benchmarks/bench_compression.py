@@ -0,0 +1,109 @@
+"""
+Measure bytes saved and CPU cost per request of compressing an appointment
+list response: compressing on every request against serving a variant
+precompressed once when the response was cached.
+
+Usage (from the repository root):
+
+    python -m scripts.benchmarks.bench_compression --rows 100 --requests 200
+
+Builds a synthetic page of `AppointmentDetail` rows serialized the way the
+API returns them; no database is needed. Brotli is measured when the
+`brotli` package is installed.
+"""
+import argparse
+import base64
+import gzip
+import random
+import time
+from datetime import datetime, timedelta
+from typing import List
+
+from pydantic import TypeAdapter
+
+from app.core.compression import ENCODINGS, brotli, compress
+from app.core.config import settings
+from app.schemas.appointment import AppointmentDetail
+
+STATUSES = ["scheduled", "confirmed", "completed", "cancelled", "no_show"]
+SPECIALIZATIONS = ["Cardiology", "Dermatology", "Neurology", "Pediatrics", "Orthopedics"]
+
+
+def build_page(rows: int) -> bytes:
+    rng = random.Random(42)
+    epoch = datetime(2030, 1, 1, 9)
+    page = []
+    for i in range(1, rows + 1):
+        start_time = epoch + timedelta(minutes=30 * rng.randrange(5000))
+        page.append({
+            "id": i,
+            "patient_id": rng.randint(1, 5000),
+            "doctor_id": rng.randint(1, 200),
+            "start_time": start_time,
+            "end_time": start_time + timedelta(minutes=30),
+            "status": rng.choice(STATUSES),
+            "notes": rng.choice([None, "Follow-up visit", "Bring previous test results"]),
+            "created_at": epoch,
+            "updated_at": None,
+            "series_id": None,
+            "patient_name": f"Patient{rng.randint(1, 5000)} Lastname{rng.randint(1, 500)}",
+            "doctor_name": f"Doctor{rng.randint(1, 200)} Lastname{rng.randint(1, 200)}",
+            "doctor_specialization": rng.choice(SPECIALIZATIONS),
+        })
+    adapter = TypeAdapter(List[AppointmentDetail])
+    return adapter.dump_json(adapter.validate_python(page))
+
+
+def decompress(body: bytes, encoding: str) -> bytes:
+    return brotli.decompress(body) if encoding == "br" else gzip.decompress(body)
+
+
+def per_request(fn, requests: int) -> float:
+    started = time.perf_counter()
+    for _ in range(requests):
+        fn()
+    return (time.perf_counter() - started) / requests
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--rows", type=int, default=100)
+    parser.add_argument("--requests", type=int, default=200)
+    args = parser.parse_args()
+
+    body = build_page(args.rows)
+    print(f"identity body       {len(body):>9} bytes ({args.rows} appointments)")
+    if brotli is None:
+        print("brotli not installed; measuring gzip only")
+
+    levels = {
+        "br": (settings.COMPRESSION_BROTLI_QUALITY, settings.RESPONSE_CACHE_BROTLI_QUALITY),
+        "gzip": (settings.COMPRESSION_GZIP_LEVEL, settings.RESPONSE_CACHE_GZIP_LEVEL),
+    }
+
+    for encoding in ENCODINGS:
+        on_the_fly_level, cache_level = levels[encoding]
+
+        on_the_fly = compress(body, encoding, on_the_fly_level)
+        on_the_fly_cost = per_request(lambda: compress(body, encoding, on_the_fly_level), args.requests)
+
+        started = time.perf_counter()
+        precompressed = compress(body, encoding, cache_level)
+        store_cost = time.perf_counter() - started
+        # A hit decodes the base64 variant stored in the cache entry
+        stored = base64.b64encode(precompressed).decode()
+        hit_cost = per_request(lambda: base64.b64decode(stored), args.requests)
+
+        assert decompress(on_the_fly, encoding) == body, f"{encoding} round trip changed the body"
+        assert decompress(precompressed, encoding) == body, f"{encoding} round trip changed the body"
+
+        print(f"{encoding}:")
+        print(f"  on the fly (level {on_the_fly_level:>2}) {len(on_the_fly):>9} bytes "
+              f"({1 - len(on_the_fly) / len(body):6.1%} saved) {on_the_fly_cost * 1e6:10.1f} us/request")
+        print(f"  cached     (level {cache_level:>2}) {len(precompressed):>9} bytes "
+              f"({1 - len(precompressed) / len(body):6.1%} saved) {hit_cost * 1e6:10.1f} us/request "
+              f"+ {store_cost * 1e6:.1f} us once per cache write")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,107 @@
+"""
+Benchmark appointment conflict detection: the original three-branch OR query
+with COUNT(*) against the in-process interval index.
+
+Usage (from the repository root):
+
+    python -m scripts.benchmarks.bench_conflicts --doctors 50 --appointments 2000
+"""
+import argparse
+import os
+import random
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+from sqlalchemy import and_, create_engine, or_
+from sqlalchemy.orm import sessionmaker
+
+from app.core.interval_index import appointment_index
+from app.crud.crud_appointment import appointment
+from app.db.models import Appointment, Base, Doctor, Patient
+
+
+def legacy_check_conflicts(db, *, doctor_id, start_time, end_time, appointment_id=None):
+    query = db.query(Appointment).filter(
+        Appointment.doctor_id == doctor_id,
+        Appointment.status != "cancelled",
+        or_(
+            and_(Appointment.start_time <= start_time, Appointment.end_time > start_time),
+            and_(Appointment.start_time < end_time, Appointment.end_time >= end_time),
+            and_(Appointment.start_time >= start_time, Appointment.end_time <= end_time)
+        )
+    )
+    if appointment_id:
+        query = query.filter(Appointment.id != appointment_id)
+    return query.count() > 0
+
+
+def seed(db, doctors: int, appointments: int) -> datetime:
+    epoch = datetime(2030, 1, 7, 8, 0)
+    db.add(Patient(first_name="Bench", last_name="Patient", email="bench@example.com"))
+    db.add_all(
+        Doctor(first_name="Bench", last_name=str(i), email=f"doctor{i}@example.com", specialization="Bench")
+        for i in range(doctors)
+    )
+    db.flush()
+    rows = []
+    for doctor_id in range(1, doctors + 1):
+        for i in range(appointments):
+            start_time = epoch + timedelta(minutes=30 * i)
+            rows.append({
+                "patient_id": 1,
+                "doctor_id": doctor_id,
+                "start_time": start_time,
+                "end_time": start_time + timedelta(minutes=30),
+                "status": "cancelled" if i % 10 == 0 else "scheduled",
+            })
+    db.bulk_insert_mappings(Appointment, rows)
+    db.commit()
+    return epoch
+
+
+def timed(label, fn, probes):
+    started = time.perf_counter()
+    results = [fn(*probe) for probe in probes]
+    elapsed = time.perf_counter() - started
+    print(f"{label:<16} {len(probes) / elapsed:>12.0f} checks/s  {elapsed / len(probes) * 1e6:>9.1f} us/check")
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--doctors", type=int, default=50)
+    parser.add_argument("--appointments", type=int, default=2000, help="appointments per doctor")
+    parser.add_argument("--probes", type=int, default=5000)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        engine = create_engine(f"sqlite:///{os.path.join(tmp, 'bench.db')}")
+        Base.metadata.create_all(bind=engine)
+        db = sessionmaker(bind=engine)()
+        epoch = seed(db, args.doctors, args.appointments)
+
+        rng = random.Random(42)
+        span = args.appointments * 30
+        probes = []
+        for _ in range(args.probes):
+            start_time = epoch + timedelta(minutes=rng.randrange(-60, span + 60, 15))
+            probes.append((rng.randint(1, args.doctors), start_time, start_time + timedelta(minutes=30)))
+
+        legacy = timed(
+            "legacy query",
+            lambda d, s, e: legacy_check_conflicts(db, doctor_id=d, start_time=s, end_time=e),
+            probes
+        )
+
+        appointment_index.invalidate()
+        indexed = lambda d, s, e: appointment.check_conflicts(db, doctor_id=d, start_time=s, end_time=e)
+        timed("index (cold)", indexed, probes)
+        warm = timed("index (warm)", indexed, probes)
+
+        assert legacy == warm, "interval index disagrees with the database query"
+        db.close()
+
+
+if __name__ == "__main__":
+    main()
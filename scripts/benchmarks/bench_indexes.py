@@ -0,0 +1,135 @@
+"""
+Benchmark the hot appointment and availability queries before and after the
+index pack migration, printing each query plan and its latency.
+
+Usage (from the repository root):
+
+    python -m scripts.benchmarks.bench_indexes --rows 1000000
+
+Runs against a temporary SQLite database unless --database-url points at an
+empty PostgreSQL database; the benchmark creates and drops its tables.
+"""
+import argparse
+import os
+import random
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+from sqlalchemy import create_engine, text
+
+from app.db.migrations import run_migrations, schema_migrations
+from app.db.models import Appointment, Availability, Base
+
+STATUSES = ["scheduled", "confirmed", "completed", "cancelled", "no_show"]
+
+QUERIES = {
+    "conflict check": (
+        "SELECT EXISTS (SELECT 1 FROM appointments WHERE doctor_id = :doctor_id "
+        "AND status <> 'cancelled' AND start_time < :end_time AND end_time > :start_time)"
+    ),
+    "day slots": (
+        "SELECT start_time, end_time FROM appointments WHERE doctor_id = :doctor_id "
+        "AND start_time >= :start_time AND end_time <= :day_end AND status <> 'cancelled'"
+    ),
+    "patient page": (
+        "SELECT * FROM appointments WHERE patient_id = :patient_id "
+        "ORDER BY start_time, id LIMIT 100"
+    ),
+    "doctor weekday": (
+        "SELECT start_time, end_time FROM availabilities WHERE doctor_id = :doctor_id "
+        "AND day_of_week = :day_of_week AND is_available"
+    ),
+    "status count": "SELECT count(*) FROM appointments WHERE status = 'no_show'",
+}
+
+
+def seed(engine, rows: int, doctors: int, patients: int, epoch: datetime) -> None:
+    rng = random.Random(42)
+    chunk = []
+    with engine.begin() as connection:
+        connection.execute(Availability.__table__.insert(), [
+            {"doctor_id": doctor_id, "day_of_week": day, "start_time": datetime.min.time().replace(hour=9),
+             "end_time": datetime.min.time().replace(hour=17), "is_available": True}
+            for doctor_id in range(1, doctors + 1) for day in range(5)
+        ])
+        for _ in range(rows):
+            start_time = epoch + timedelta(minutes=15 * rng.randrange(365 * 96))
+            chunk.append({
+                "patient_id": rng.randint(1, patients),
+                "doctor_id": rng.randint(1, doctors),
+                "start_time": start_time,
+                "end_time": start_time + timedelta(minutes=30),
+                "status": rng.choice(STATUSES),
+            })
+            if len(chunk) == 50000:
+                connection.execute(Appointment.__table__.insert(), chunk)
+                chunk = []
+        if chunk:
+            connection.execute(Appointment.__table__.insert(), chunk)
+
+
+def measure(engine, params, repeat: int) -> None:
+    explain = "EXPLAIN QUERY PLAN " if engine.dialect.name == "sqlite" else "EXPLAIN "
+    with engine.connect() as connection:
+        for label, sql in QUERIES.items():
+            plan = connection.execute(text(explain + sql), params).fetchall()
+            started = time.perf_counter()
+            for _ in range(repeat):
+                connection.execute(text(sql), params).fetchall()
+            elapsed = (time.perf_counter() - started) / repeat
+            print(f"  {label:<16} {elapsed * 1e3:>9.3f} ms")
+            for row in plan:
+                print(f"      {row[-1]}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--database-url")
+    parser.add_argument("--rows", type=int, default=1000000)
+    parser.add_argument("--doctors", type=int, default=500)
+    parser.add_argument("--patients", type=int, default=50000)
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        engine = create_engine(args.database_url or f"sqlite:///{os.path.join(tmp, 'bench.db')}")
+
+        # Schema as created before the index pack existed
+        Base.metadata.create_all(bind=engine)
+        pack = [index for table in (Appointment.__table__, Availability.__table__)
+                for index in table.indexes if len(index.columns) > 1 or index.name == "ix_appointments_status"]
+        with engine.begin() as connection:
+            for index in pack:
+                index.drop(bind=connection)
+
+        epoch = datetime(2030, 1, 1)
+        started = time.perf_counter()
+        seed(engine, args.rows, args.doctors, args.patients, epoch)
+        print(f"seeded {args.rows} appointments in {time.perf_counter() - started:.1f}s")
+
+        day = epoch + timedelta(days=100)
+        params = {
+            "doctor_id": 7, "patient_id": 7, "day_of_week": 2,
+            "start_time": day.replace(hour=10), "end_time": day.replace(hour=10, minute=30),
+            "day_end": day.replace(hour=23, minute=59, second=59),
+        }
+
+        print("before:")
+        measure(engine, params, args.repeat)
+
+        started = time.perf_counter()
+        run_migrations(engine)
+        print(f"migrations applied in {time.perf_counter() - started:.1f}s")
+        with engine.begin() as connection:
+            connection.execute(text("ANALYZE"))
+
+        print("after:")
+        measure(engine, params, args.repeat)
+
+        Base.metadata.drop_all(bind=engine)
+        schema_migrations.drop(bind=engine)
+
+
+if __name__ == "__main__":
+    main()
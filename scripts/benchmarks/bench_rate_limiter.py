@@ -0,0 +1,107 @@
+"""
+Benchmark the latency a rate-limit check adds per request and how many
+requests concurrent clients get through: the original GET followed by an
+INCR/EXPIRE pipeline, the single token-bucket script call, and in-process
+buckets reconciled with Redis in the background.
+
+Usage (from the repository root, with Redis running):
+
+    python -m scripts.benchmarks.bench_rate_limiter --requests 5000 --clients 16
+
+Uses REDIS_URL unless --redis-url is given; the benchmark only touches keys
+under "bench:rate_limit:" and deletes them afterwards.
+"""
+import argparse
+import asyncio
+import time
+
+from redis import asyncio as aioredis
+
+from app.core.config import settings
+from app.core.rate_limiter import Bucket, LocalTokenBuckets, RedisTokenBuckets
+from app.core.redis_client import RedisClient
+
+
+async def legacy_check(client: aioredis.Redis, key: str, limit: int) -> bool:
+    current = await client.get(key)
+    if (int(current) if current else 0) >= limit:
+        return False
+    pipe = client.pipeline()
+    pipe.incr(key)
+    pipe.expire(key, 60)
+    await pipe.execute()
+    return True
+
+
+async def bucket_check(buckets, key: str, limit: int) -> bool:
+    # A refill rate this low keeps the bucket from refilling during the run
+    allowed, _ = await buckets.take([Bucket(key, limit, 1e-6)])
+    return allowed
+
+
+async def latency(check, requests: int) -> float:
+    started = time.perf_counter()
+    for i in range(requests):
+        await check(f"bench:rate_limit:latency:{i % 100}")
+    return (time.perf_counter() - started) / requests
+
+
+async def admitted(check, clients: int, attempts: int) -> int:
+    async def client():
+        return sum([await check("bench:rate_limit:burst") for _ in range(attempts)])
+
+    return sum(await asyncio.gather(*(client() for _ in range(clients))))
+
+
+async def cleanup(client: aioredis.Redis) -> None:
+    keys = [key async for key in client.scan_iter("bench:rate_limit:*")]
+    if keys:
+        await client.delete(*keys)
+
+
+async def run(args) -> None:
+    client = aioredis.from_url(args.redis_url)
+    shared = RedisClient(args.redis_url, call_timeout=5)
+    buckets = RedisTokenBuckets(shared)
+    local_buckets = LocalTokenBuckets(args.redis_url, max_error=1.0)
+    limit = args.requests  # never reached while measuring latency
+
+    await cleanup(client)
+    legacy = await latency(lambda key: legacy_check(client, key, limit), args.requests)
+    await cleanup(client)
+    scripted = await latency(lambda key: bucket_check(buckets, key, limit), args.requests)
+    local = await latency(lambda key: bucket_check(local_buckets, key, limit), args.requests)
+    local_buckets.stop()
+
+    attempts = args.limit // args.clients * 4
+    await cleanup(client)
+    legacy_admitted = await admitted(lambda key: legacy_check(client, key, args.limit), args.clients, attempts)
+    await cleanup(client)
+    script_admitted = await admitted(lambda key: bucket_check(buckets, key, args.limit), args.clients, attempts)
+    await cleanup(client)
+
+    await shared.close()
+    await client.aclose()
+
+    assert script_admitted == args.limit, "the token bucket admitted more or fewer requests than its limit"
+
+    print(f"requests            {args.requests}")
+    print(f"GET + INCR/EXPIRE   {legacy * 1e6:8.1f} us/request")
+    print(f"token bucket script {scripted * 1e6:8.1f} us/request")
+    print(f"local token buckets {local * 1e6:8.1f} us/request")
+    print(f"burst of {args.clients * attempts} requests from {args.clients} clients, limit {args.limit}:")
+    print(f"  GET + INCR/EXPIRE admitted {legacy_admitted}")
+    print(f"  token bucket      admitted {script_admitted}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--redis-url", default=settings.REDIS_URL)
+    parser.add_argument("--requests", type=int, default=5000)
+    parser.add_argument("--clients", type=int, default=16)
+    parser.add_argument("--limit", type=int, default=100)
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
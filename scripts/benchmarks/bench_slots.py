@@ -0,0 +1,74 @@
+"""
+Benchmark available-slot generation: the original nested loop against the
+merge/sweep implementation in app.core.slots.
+
+Usage (from the repository root):
+
+    python -m scripts.benchmarks.bench_slots --appointments 1000 --slot-minutes 5
+"""
+import argparse
+import random
+import time
+from datetime import date, datetime, timedelta
+from datetime import time as time_of_day
+
+from app.core.slots import generate_slots
+
+
+def nested_loop_slots(day, availabilities, appointments, slot_minutes):
+    slots = []
+    for window_start, window_end in availabilities:
+        current_time = datetime.combine(day, window_start)
+        end_time = datetime.combine(day, window_end)
+        while current_time + timedelta(minutes=slot_minutes) <= end_time:
+            slot_end_time = current_time + timedelta(minutes=slot_minutes)
+            is_available = True
+            for appointment_start, appointment_end in appointments:
+                if current_time < appointment_end and slot_end_time > appointment_start:
+                    is_available = False
+                    break
+            if is_available:
+                slots.append({
+                    "start_time": current_time.isoformat(),
+                    "end_time": slot_end_time.isoformat(),
+                    "is_available": True
+                })
+            current_time = slot_end_time
+    return slots
+
+
+def timed(label, fn, repeat):
+    started = time.perf_counter()
+    for _ in range(repeat):
+        result = fn()
+    elapsed = (time.perf_counter() - started) / repeat
+    print(f"{label:<12} {elapsed * 1e3:>9.2f} ms/call  ({len(result)} free slots)")
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--appointments", type=int, default=1000, help="appointments in the day")
+    parser.add_argument("--slot-minutes", type=int, default=5)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    rng = random.Random(42)
+    day = date(2030, 1, 1)
+    availabilities = [(time_of_day(0, 0), time_of_day(23, 59))]
+
+    # Short appointments packed into the afternoon and evening, leaving the
+    # morning free so every morning slot is compared with the whole day
+    appointments = []
+    for _ in range(args.appointments):
+        start_time = datetime.combine(day, time_of_day(12, 0)) + timedelta(minutes=rng.randrange(0, 12 * 60))
+        appointments.append((start_time, start_time + timedelta(minutes=1)))
+
+    legacy = timed("nested loop", lambda: nested_loop_slots(day, availabilities, appointments, args.slot_minutes), args.repeat)
+    sweep = timed("sweep", lambda: generate_slots(day, availabilities, appointments, args.slot_minutes), args.repeat)
+
+    assert legacy == sweep, "sweep result differs from the nested loop"
+
+
+if __name__ == "__main__":
+    main()